@@ -0,0 +1,430 @@
+"""
+Sales analytics over the order history
+
+Orders are folded into rollups: per day, and per district, delivery speed,
+promotion code and product, the order count, units, revenue and discount
+for each order status. When an order changes state its contribution moves
+from the old status to the new one. Each change touches a handful of
+rollup rows, and reports read rollups instead of rescanning orders. The
+status each order was last counted under is stored next to the rollups,
+so recording the same order twice (duplicate callbacks, a backfill over
+live data) never double counts. The backfill folds a whole page of orders
+into one set of deltas in memory and writes it in a single transaction.
+
+Rollups live in SQLite (shared by all gunicorn workers on the host) or in
+process memory (tests, single process). Parquet export needs the optional
+`pyarrow` package.
+"""
+
+import csv
+import io
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone, tzinfo
+from typing import Dict, Any, Optional, List, Tuple, Iterable, Sequence
+
+from storage import SQLiteConnectionPool, StoreError
+
+log = logging.getLogger(__name__)
+
+DIMENSIONS = ('day', 'district', 'delivery_speed', 'promo', 'product')
+
+# Statuses whose orders count as revenue; refunded and failed orders do not
+REVENUE_STATUSES = frozenset({'PAID'})
+FAILED_STATUSES = frozenset({'PAYMENT_FAILED'})
+OPEN_STATUSES = frozenset({'PENDING'})
+
+# (dimension, day, key) -> [orders, units, revenue, discount]
+Contribution = Tuple[str, str, str]
+Totals = List[float]
+
+
+class AnalyticsError(Exception):
+    """Raised for unknown report dimensions or an unavailable export format"""
+
+
+def order_contributions(order: Dict[str, Any], tz: tzinfo) -> Dict[Contribution, Totals]:
+    """
+    Rollup rows one order adds to, with its share of each
+
+    Args:
+        order: Order document
+        tz: Timezone whose calendar days the reports use
+
+    Returns:
+        (dimension, day, key) -> [orders, units, revenue, discount]
+    """
+    created_at = datetime.fromisoformat(order['created_at'])
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    day = created_at.astimezone(tz).date().isoformat()
+
+    cart = order.get('cart') or []
+    units = sum(int(line.get('qty', 0)) for line in cart)
+    totals = [1, units, float(order.get('total_amount') or 0), float(order.get('discount') or 0)]
+
+    rows = {
+        ('day', day, ''): totals,
+        ('district', day, (order.get('location') or {}).get('district') or 'unknown'): totals,
+        ('delivery_speed', day, order.get('delivery_speed') or 'standard'): totals
+    }
+    # Applied promotions only; an order's discount is attributed in full to every code it used
+    for code in order.get('promotions') or []:
+        rows[('promo', day, str(code).upper())] = totals
+    for line in cart:
+        key = ('product', day, str(line['id']))
+        qty = int(line.get('qty', 0))
+        previous = rows.get(key, [0, 0, 0.0, 0.0])
+        rows[key] = [1, previous[1] + qty, previous[2] + float(line.get('price') or 0) * qty, 0.0]
+    return rows
+
+
+def _fold_deltas(changes: Iterable[Tuple[Optional[str], str, Dict[Contribution, Totals]]]
+                 ) -> Dict[Tuple[str, str, str, str], Totals]:
+    # (previous status, new status, contributions) -> net change per rollup row
+    deltas: Dict[Tuple[str, str, str, str], Totals] = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    for previous, status, rows in changes:
+        for (dimension, day, key), totals in rows.items():
+            for sign, row_status in ((-1, previous), (1, status)):
+                if row_status is None:
+                    continue
+                delta = deltas[(dimension, day, key, row_status)]
+                for i, value in enumerate(totals):
+                    delta[i] += sign * value
+    return deltas
+
+
+class RollupBackend:
+    """Storage for rollups and the status each order was last counted under"""
+
+    def record(self, orders: Dict[str, Tuple[str, Dict[Contribution, Totals]]]) -> int:
+        """
+        Atomically count orders under their current status
+
+        Args:
+            orders: order_id -> (status, contributions)
+
+        Returns:
+            Number of orders whose counted status changed
+        """
+        raise NotImplementedError
+
+    def rows(self, dimension: str, day_from: Optional[str] = None,
+             day_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Rollup rows of one dimension with day_from <= day <= day_to"""
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """Drop every rollup (before a full rebuild)"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the backend"""
+
+
+class MemoryRollups(RollupBackend):
+    """Process-local rollups"""
+
+    def __init__(self):
+        self._rollups: Dict[Tuple[str, str, str, str], Totals] = {}
+        self._statuses: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, orders):
+        with self._lock:
+            changes = [(self._statuses.get(order_id), status, rows)
+                       for order_id, (status, rows) in orders.items() if self._statuses.get(order_id) != status]
+            for key, delta in _fold_deltas(changes).items():
+                current = self._rollups.setdefault(key, [0, 0, 0.0, 0.0])
+                for i, value in enumerate(delta):
+                    current[i] += value
+            self._statuses.update((order_id, status) for order_id, (status, _) in orders.items())
+        return len(changes)
+
+    def rows(self, dimension, day_from=None, day_to=None):
+        with self._lock:
+            return [
+                {'day': day, 'key': key, 'status': status, 'orders': totals[0], 'units': totals[1],
+                 'revenue': totals[2], 'discount': totals[3]}
+                for (row_dimension, day, key, status), totals in self._rollups.items()
+                if row_dimension == dimension and totals[0]
+                and (not day_from or day >= day_from) and (not day_to or day <= day_to)
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._rollups.clear()
+            self._statuses.clear()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sales_rollups (
+    dimension TEXT NOT NULL,
+    day       TEXT NOT NULL,
+    key       TEXT NOT NULL,
+    status    TEXT NOT NULL,
+    orders    INTEGER NOT NULL,
+    units     INTEGER NOT NULL,
+    revenue   REAL NOT NULL,
+    discount  REAL NOT NULL,
+    PRIMARY KEY (dimension, day, key, status)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sales_order_status (
+    order_id TEXT PRIMARY KEY,
+    status   TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteRollups(RollupBackend):
+    """
+    Rollups in a SQLite (WAL) file shared by every worker on the host
+
+    Kept apart from the order database so report writes never queue behind
+    checkout writes.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4, timeout: float = 5.0):
+        self.pool = SQLiteConnectionPool(path, size=pool_size, timeout=timeout)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def record(self, orders):
+        order_ids = list(orders)
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                counted: Dict[str, str] = {}
+                # Stay well below SQLite's bound parameter limit
+                for start in range(0, len(order_ids), 500):
+                    chunk = order_ids[start:start + 500]
+                    counted.update(conn.execute(
+                        f"SELECT order_id, status FROM sales_order_status WHERE order_id IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall())
+                changes = [(counted.get(order_id), status, rows)
+                           for order_id, (status, rows) in orders.items() if counted.get(order_id) != status]
+                conn.executemany(
+                    'INSERT INTO sales_rollups (dimension, day, key, status, orders, units, revenue, discount) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (dimension, day, key, status) DO UPDATE SET '
+                    'orders = orders + excluded.orders, units = units + excluded.units, '
+                    'revenue = revenue + excluded.revenue, discount = discount + excluded.discount',
+                    [(*key, *delta) for key, delta in _fold_deltas(changes).items()]
+                )
+                conn.executemany(
+                    'INSERT INTO sales_order_status (order_id, status) VALUES (?, ?) '
+                    'ON CONFLICT (order_id) DO UPDATE SET status = excluded.status',
+                    [(order_id, status) for order_id, (status, _) in orders.items()
+                     if counted.get(order_id) != status]
+                )
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        return len(changes)
+
+    def rows(self, dimension, day_from=None, day_to=None):
+        clauses = ['dimension = ?', 'orders != 0']
+        params: List[Any] = [dimension]
+        if day_from:
+            clauses.append('day >= ?')
+            params.append(day_from)
+        if day_to:
+            clauses.append('day <= ?')
+            params.append(day_to)
+        with self.pool.connection() as conn:
+            return [dict(row) for row in conn.execute(
+                f"SELECT day, key, status, orders, units, revenue, discount FROM sales_rollups "
+                f"WHERE {' AND '.join(clauses)}",
+                params
+            )]
+
+    def reset(self):
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM sales_rollups')
+            conn.execute('DELETE FROM sales_order_status')
+            conn.execute('COMMIT')
+
+    def close(self):
+        self.pool.close()
+
+
+def create_rollups(url: str) -> RollupBackend:
+    """
+    Build a rollup backend from a DATABASE_URL style string
+
+    Args:
+        url: 'sqlite:///path/to/file.db' or 'memory://'
+    """
+    if url.startswith('memory://'):
+        return MemoryRollups()
+    if url.startswith('sqlite:///'):
+        return SQLiteRollups(url[len('sqlite:///'):])
+    raise StoreError(f"Unsupported ANALYTICS_DATABASE_URL: {url}")
+
+
+def _rate(part: float, whole: float) -> Optional[float]:
+    return round(part / whole, 4) if whole else None
+
+
+class SalesAnalytics:
+    """Incrementally maintained sales reports"""
+
+    def __init__(self, backend: RollupBackend, tz: tzinfo = timezone.utc):
+        """
+        Args:
+            backend: Rollup storage
+            tz: Timezone whose calendar days the reports use
+        """
+        self.backend = backend
+        self.tz = tz
+
+    def record(self, orders: Sequence[Dict[str, Any]]) -> int:
+        """
+        Count orders under their current status (call after every status change)
+
+        Returns:
+            Number of orders whose counted status changed
+        """
+        return self.backend.record({
+            order['id']: (order['status'], order_contributions(order, self.tz)) for order in orders if order
+        })
+
+    def backfill(self, orders: Iterable[Dict[str, Any]], batch_size: int = 1000) -> Dict[str, int]:
+        """
+        Fold existing orders into the rollups, one transaction per batch
+
+        Orders already counted under their current status are skipped, so a
+        backfill can run while the app keeps recording live changes.
+
+        Returns:
+            {'orders': orders read, 'changed': orders whose counted status changed}
+        """
+        read = changed = 0
+        batch: List[Dict[str, Any]] = []
+        for order in orders:
+            batch.append(order)
+            if len(batch) >= batch_size:
+                changed += self.record(batch)
+                read += len(batch)
+                batch = []
+        if batch:
+            changed += self.record(batch)
+            read += len(batch)
+        log.info(f"Analytics backfill: {read} orders read, {changed} recounted")
+        return {'orders': read, 'changed': changed}
+
+    def _grouped(self, by: str, day_from: Optional[str], day_to: Optional[str]) -> Dict[str, Dict[str, Totals]]:
+        # group value -> status -> [orders, units, revenue, discount]
+        if by not in DIMENSIONS:
+            raise AnalyticsError(f"Unknown report dimension: {by}")
+        groups: Dict[str, Dict[str, Totals]] = defaultdict(lambda: defaultdict(lambda: [0, 0, 0.0, 0.0]))
+        for row in self.backend.rows(by, day_from, day_to):
+            totals = groups[row['day'] if by == 'day' else row['key']][row['status']]
+            totals[0] += row['orders']
+            totals[1] += row['units']
+            totals[2] += row['revenue']
+            totals[3] += row['discount']
+        return groups
+
+    @staticmethod
+    def _sum(statuses: Dict[str, Totals], included: Optional[frozenset] = None) -> Totals:
+        result = [0, 0, 0.0, 0.0]
+        for status, totals in statuses.items():
+            if included is None or status in included:
+                result = [a + b for a, b in zip(result, totals)]
+        return result
+
+    def revenue(self, by: str = 'day', day_from: Optional[str] = None,
+                day_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Paid orders, revenue and discount per day, district or delivery_speed"""
+        rows = []
+        for value, statuses in sorted(self._grouped(by, day_from, day_to).items()):
+            orders, units, revenue, discount = self._sum(statuses, REVENUE_STATUSES)
+            rows.append({
+                by: value,
+                'orders': orders,
+                'units': units,
+                'revenue': round(revenue, 2),
+                'discount': round(discount, 2),
+                'average_order_value': round(revenue / orders, 2) if orders else None
+            })
+        return rows
+
+    def failures(self, by: str = 'day', day_from: Optional[str] = None,
+                 day_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Payment failure rate (failed / settled orders) per day, district or delivery_speed"""
+        rows = []
+        for value, statuses in sorted(self._grouped(by, day_from, day_to).items()):
+            total = self._sum(statuses)[0]
+            failed = self._sum(statuses, FAILED_STATUSES)[0]
+            pending = self._sum(statuses, OPEN_STATUSES)[0]
+            rows.append({
+                by: value,
+                'orders': total,
+                'paid': self._sum(statuses, REVENUE_STATUSES)[0],
+                'failed': failed,
+                'pending': pending,
+                'failure_rate': _rate(failed, total - pending)
+            })
+        return rows
+
+    def promotions(self, day_from: Optional[str] = None, day_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Per promotion code: orders placed with it, how many were paid, and the discount given"""
+        all_orders = sum(row['orders'] for row in self.backend.rows('day', day_from, day_to))
+        rows = []
+        for code, statuses in sorted(self._grouped('promo', day_from, day_to).items()):
+            placed = self._sum(statuses)[0]
+            paid, _, revenue, discount = self._sum(statuses, REVENUE_STATUSES)
+            rows.append({
+                'promo': code,
+                'orders': placed,
+                'paid': paid,
+                'redemption_rate': _rate(paid, placed),
+                'share_of_orders': _rate(placed, all_orders),
+                'revenue': round(revenue, 2),
+                'discount': round(discount, 2)
+            })
+        return rows
+
+    def top_products(self, limit: int = 10, day_from: Optional[str] = None,
+                     day_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Best-selling products of paid orders by units sold"""
+        rows = []
+        for product_id, statuses in self._grouped('product', day_from, day_to).items():
+            orders, units, revenue, _ = self._sum(statuses, REVENUE_STATUSES)
+            if orders:
+                rows.append({'product_id': int(product_id), 'orders': orders, 'units': units,
+                             'revenue': round(revenue, 2)})
+        rows.sort(key=lambda row: (-row['units'], -row['revenue'], row['product_id']))
+        return rows[:limit]
+
+
+def to_csv(rows: List[Dict[str, Any]]) -> str:
+    """Report rows as CSV text with a header line"""
+    output = io.StringIO()
+    if rows:
+        writer = csv.DictWriter(output, fieldnames=list(rows[0]), lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+    return output.getvalue()
+
+
+def to_parquet(rows: List[Dict[str, Any]]) -> bytes:
+    """
+    Report rows as a Parquet file
+
+    Raises:
+        AnalyticsError: pyarrow is not installed
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise AnalyticsError('Parquet export requires the pyarrow package')
+    output = io.BytesIO()
+    pq.write_table(pa.Table.from_pylist(rows), output)
+    return output.getvalue()
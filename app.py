@@ -9,18 +9,45 @@ Date: December 2025
 
 import os
 import uuid
-import hashlib
-import hmac
 import base64
+import hmac
 import json
-import logging
-from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+import mimetypes
+import time
+from datetime import date, datetime, timezone
+from typing import Dict, Any, Optional, Tuple, List
+from zoneinfo import ZoneInfo
 
-from flask import Flask, request, jsonify, redirect, url_for, render_template_string, render_template
+import click
+from flask import (Flask, Response, request, jsonify, redirect, render_template, stream_with_context,
+                   session, g, send_from_directory)
 from flask.logging import create_logger
+from werkzeug.http import generate_etag
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 
+from storage import create_store, ORDER_FILTERS
+from esewa_client import EsewaClient, CircuitBreaker, EsewaUnavailable, EsewaResponseError
+from reconcile import Reconciler, start_scheduler, transition_for, ESEWA_STATUS_TRANSITIONS
+from idempotency import IdempotencyCache, TTLCache, request_fingerprint
+from catalog import Catalog, CatalogError
+from carts import CartService, CartError
+from signing import HmacSigner
+from callbacks import CallbackParser, CallbackError
+from delivery import DeliveryPricer, DeliveryPricingError
+from promotions import PromotionEngine
+from notifications import NotificationBus, TERMINAL_STATUSES
+from compression import Compressor
+from journal import EventJournal
+from ids import new_id
+from support import SupportHub, SupportError, create_messages
+from money import to_paisa, breakdown
+from analytics import SalesAnalytics, AnalyticsError, create_rollups, to_csv, to_parquet
+from ratelimit import RateLimiter, Limit, create_buckets
+from assets import AssetManifest, build as build_assets
+import metrics
+import logging_setup
+
 # Load environment variables
 load_dotenv()
 
@@ -28,9 +55,19 @@ load_dotenv()
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 
-# Configure logging
+# Behind nginx/a load balancer, trust that many X-Forwarded-For hops for the client address
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 0))
+if TRUSTED_PROXY_COUNT > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
+# Configure logging: records are written by a background thread (see logging_setup)
+logging_setup.setup_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    json_format=os.getenv('LOG_FORMAT', 'text').lower() == 'json',
+    sample_rate=float(os.getenv('LOG_SAMPLE_RATE', 1.0)),
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', 10000))
+)
 log = create_logger(app)
-log.setLevel(logging.INFO)
 
 # eSewa Configuration
 class EsewaConfig:
@@ -52,6 +89,9 @@ class EsewaConfig:
             self.merchant_code = "EPAYTEST"
             self.secret_key = "8gBm/:&EnhH.1/q"
         
+        # Allow pointing status checks at a stub server
+        self.verification_url = os.getenv('ESEWA_STATUS_URL', self.verification_url)
+        
         # URLs for success/failure callbacks
         self.success_url = os.getenv('SUCCESS_URL', 'http://localhost:5006/payment/success')
         self.failure_url = os.getenv('FAILURE_URL', 'http://localhost:5006/payment/failure')
@@ -59,9 +99,73 @@ class EsewaConfig:
 # Initialize eSewa config
 esewa = EsewaConfig()
 
-# In-memory storage for demo (use database in production)
-transactions_db = {}
-orders_db = {}
+if not esewa.secret_key:
+    raise RuntimeError('ESEWA_SECRET_KEY must be set for the live eSewa environment')
+
+# Delivery rates, zones and speed adjustments
+delivery_pricer = DeliveryPricer.load(
+    os.getenv('DELIVERY_CONFIG_PATH', os.path.join(app.root_path, 'data', 'delivery_zones.json'))
+)
+
+# Pre-keyed HMAC state shared by every signature
+signer = HmacSigner(esewa.secret_key)
+
+# Size-limited, schema-checked and signature-verified parsing of eSewa success callbacks
+callback_parser = CallbackParser(
+    signer,
+    max_size=int(os.getenv('CALLBACK_MAX_SIZE', 4096)),
+    seen_size=int(os.getenv('CALLBACK_SEEN_SIZE', 10000))
+)
+
+# Product catalog, loaded once and indexed in memory
+catalog = Catalog.load(os.getenv('CATALOG_PATH', os.path.join(app.root_path, 'data', 'products.json')))
+
+# Shared, pooled client for the eSewa status API
+esewa_client = EsewaClient(
+    esewa.verification_url,
+    connect_timeout=float(os.getenv('ESEWA_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.getenv('ESEWA_READ_TIMEOUT', 10)),
+    max_retries=int(os.getenv('ESEWA_MAX_RETRIES', 2)),
+    retry_budget=float(os.getenv('ESEWA_RETRY_BUDGET', 15)),
+    pool_size=int(os.getenv('ESEWA_POOL_SIZE', 20)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv('ESEWA_BREAKER_THRESHOLD', 5)),
+        reset_timeout=float(os.getenv('ESEWA_BREAKER_RESET', 30))
+    )
+)
+
+# Order/transaction storage shared by all workers
+# (DATABASE_URL=memory:// keeps everything in-process for tests)
+store = create_store(
+    os.getenv('DATABASE_URL', 'sqlite:///thapa_kirana.db'),
+    pool_size=int(os.getenv('DATABASE_POOL_SIZE', 8))
+)
+
+# Append-only journal of payment state transitions (audit trail and recovery source);
+# JOURNAL_DIR=off disables it
+JOURNAL_DIR = os.getenv('JOURNAL_DIR', os.path.join(app.root_path, 'journal'))
+journal = None if JOURNAL_DIR.lower() == 'off' else EventJournal(
+    JOURNAL_DIR,
+    snapshot_every=int(os.getenv('JOURNAL_SNAPSHOT_EVERY', 10000)),
+    durable=os.getenv('JOURNAL_FSYNC', 'true').lower() != 'false'
+)
+
+def record_event(event_type: str, transaction_uuid: Optional[str], **fields: Any) -> None:
+    """Journal a payment event; a journal failure never fails the request"""
+    if journal is None or not transaction_uuid:
+        return
+    try:
+        journal.append(event_type, transaction_uuid, **fields)
+    except Exception as e:
+        log.error(f"Journal append failed for {transaction_uuid}: {str(e)}")
+
+# Per-session carts ({product_id: qty} rows in the store, priced from the catalog on read)
+cart_service = CartService(
+    store,
+    catalog,
+    ttl=float(os.getenv('CART_TTL', 7 * 24 * 3600)),
+    max_lines=int(os.getenv('CART_MAX_LINES', 100))
+)
 
 class PaymentService:
     """Service class to handle payment operations"""
@@ -80,16 +184,7 @@ class PaymentService:
             Base64 encoded HMAC signature
         """
         message = f"total_amount={total_amount},transaction_uuid={transaction_uuid},product_code={product_code}"
-        
-        # Create HMAC SHA256 signature
-        signature = hmac.new(
-            esewa.secret_key.encode('utf-8'),
-            message.encode('utf-8'),
-            hashlib.sha256
-        ).digest()
-        
-        # Encode to base64
-        return base64.b64encode(signature).decode('utf-8')
+        return signer.sign(message)
     
     @staticmethod
     def generate_response_signature(message: str) -> str:
@@ -102,82 +197,618 @@ class PaymentService:
         Returns:
             Base64 encoded HMAC signature
         """
-        # Create HMAC SHA256 signature
-        signature = hmac.new(
-            esewa.secret_key.encode('utf-8'),
-            message.encode('utf-8'),
-            hashlib.sha256
-        ).digest()
-        
-        # Encode to base64
-        return base64.b64encode(signature).decode('utf-8')
-    
-    @staticmethod
-    def verify_payment(transaction_uuid: str, total_amount: str, product_code: str) -> Dict[str, Any]:
-        """
-        Verify payment status with eSewa
-        
-        Args:
-            transaction_uuid: Transaction UUID to verify
-            total_amount: Amount to verify
-            product_code: Product code used in payment
-            
-        Returns:
-            Dictionary containing verification result
-        """
-        try:
-            # In production, make HTTP request to eSewa verification API
-            # For demo, we'll simulate verification
-            
-            # Simulate successful verification
-            if transaction_uuid and total_amount:
-                return {
-                    'status': 'SUCCESS',
-                    'transaction_uuid': transaction_uuid,
-                    'product_code': product_code,
-                    'total_amount': total_amount,
-                    'status_code': 'Success',
-                    'ref_id': f"REF{uuid.uuid4().hex[:8].upper()}"
-                }
-            else:
-                return {
-                    'status': 'FAILED',
-                    'message': 'Invalid transaction parameters'
-                }
-                
-        except Exception as e:
-            log.error(f"Payment verification failed: {str(e)}")
-            return {
-                'status': 'ERROR',
-                'message': 'Verification service unavailable'
-            }
+        return signer.sign(message)
 
 # Initialize payment service
 payment_service = PaymentService()
 
+# Products per page on the catalog grid and /api/products
+PRODUCT_PAGE_SIZE = 24
+
+# Responses of recent /api/payment/initiate calls, keyed by Idempotency-Key; kept in
+# the order store so duplicates are caught whichever worker they reach
+idempotency_cache = IdempotencyCache(
+    maxsize=int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('IDEMPOTENCY_TTL', 120)),
+    store=store
+)
+
+STORE_TIMEZONE = ZoneInfo(os.getenv('STORE_TIMEZONE', 'Asia/Kathmandu'))
+
+# Promotion rules; weekdays and dates are evaluated in the store's timezone
+promotion_engine = PromotionEngine.load(
+    os.getenv('PROMOTIONS_PATH', os.path.join(app.root_path, 'data', 'promotions.json')),
+    tz=STORE_TIMEZONE
+)
+
+# Computed checkout totals by canonical cart, promotion state and delivery inputs, so a
+# quote and the checkout that follows sign and store the very same amount strings
+totals_cache = TTLCache(maxsize=int(os.getenv('TOTALS_CACHE_SIZE', 10000)), ttl=float(os.getenv('TOTALS_CACHE_TTL', 300)))
+
+# Sales report rollups, updated on every order status change; report days are store-local
+sales_analytics = SalesAnalytics(
+    create_rollups(os.getenv('ANALYTICS_DATABASE_URL', 'sqlite:///thapa_kirana_analytics.db')),
+    tz=STORE_TIMEZONE
+)
+
+# Pushes payment status changes to SSE/long-poll clients
+notification_bus = NotificationBus(store, poll_interval=float(os.getenv('STATUS_POLL_INTERVAL', 1.0)))
+
+# Customer support chat: bounded history per conversation, shared by all workers
+support_hub = SupportHub(
+    create_messages(os.getenv('SUPPORT_DATABASE_URL', 'sqlite:///thapa_kirana_support.db')),
+    history=int(os.getenv('SUPPORT_HISTORY', 50)),
+    max_length=int(os.getenv('SUPPORT_MAX_MESSAGE', 1000)),
+    ttl=float(os.getenv('SUPPORT_CONVERSATION_TTL', 7 * 24 * 3600)),
+    poll_interval=float(os.getenv('STATUS_POLL_INTERVAL', 1.0))
+)
+# Bearer token for the support admin endpoints (unset disables them)
+SUPPORT_ADMIN_TOKEN = os.getenv('SUPPORT_ADMIN_TOKEN', '')
+
+# Upper bounds for how long one status stream / long-poll request may hold a worker thread
+STATUS_STREAM_TIMEOUT = float(os.getenv('STATUS_STREAM_TIMEOUT', 300))
+STATUS_WAIT_MAX_TIMEOUT = 30.0
+STATUS_STREAM_HEARTBEAT = 15.0
+
+def publish_status(transaction: Optional[Dict[str, Any]]) -> None:
+    """Notify clients waiting on this transaction of its new status"""
+    if not transaction:
+        return
+    notification_bus.publish(transaction['transaction_uuid'], {
+        'transaction_uuid': transaction['transaction_uuid'],
+        'order_id': transaction['order_id'],
+        'status': transaction['status']
+    })
+
+def release_order_promotions(order: Optional[Dict[str, Any]]) -> None:
+    """Give back the promotion redemptions of an order whose payment failed"""
+    if not order:
+        return
+    for code in order.get('redeemed_promotions') or []:
+        store.release_promotion(code, order.get('customer_id'))
+
+def retake_order_promotions(order: Optional[Dict[str, Any]]) -> None:
+    """Count again the redemptions released when a since-paid order was failed"""
+    if not order:
+        return
+    for code in order.get('redeemed_promotions') or []:
+        # The discount was already charged, so the caps do not apply
+        store.redeem_promotion(code, order.get('customer_id'), None, None)
+
+def remove_paid_items(order: Optional[Dict[str, Any]]) -> None:
+    """Take a paid order's items out of the server-side cart it was checked out from"""
+    if order:
+        cart_service.remove_ordered(order.get('customer_id'), order.get('cart') or [])
+
+def track_orders(orders: List[Optional[Dict[str, Any]]]) -> None:
+    """Move orders to their current status in the sales reports; never fails the caller"""
+    orders = [order for order in orders if order]
+    if not orders:
+        return
+    try:
+        sales_analytics.record(orders)
+    except Exception as e:
+        log.error(f"Sales analytics update failed: {str(e)}")
+
+def on_reconciled(transactions: List[Dict[str, Any]]) -> None:
+    """Journal, notify waiting clients and settle promotions/carts/reports of transactions the reconciler settled"""
+    orders = []
+    for transaction in transactions:
+        record_event('failed' if transaction['status'] == 'FAILED' else 'verified',
+                     transaction['transaction_uuid'], order_id=transaction['order_id'],
+                     status=transaction['status'], source='status_api')
+        publish_status(transaction)
+        order = store.get_order(transaction['order_id'])
+        orders.append(order)
+        if transaction['status'] == 'FAILED':
+            release_order_promotions(order)
+        elif transaction['status'] == 'SUCCESS':
+            remove_paid_items(order)
+    track_orders(orders)
+
+def settle_verification(transaction: Dict[str, Any], esewa_response: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply an eSewa status answer to a PENDING transaction, as the reconciler does
+    
+    Returns:
+        Response payload for the verify endpoints
+    """
+    fields = transition_for(esewa_response)
+    if fields is not None:
+        settled = store.apply_updates([(transaction['transaction_uuid'], fields[0], fields[1])],
+                                      expected_status='PENDING')
+        on_reconciled(settled)
+        transaction = settled[0] if settled else store.get_transaction(transaction['transaction_uuid'])
+    return {
+        'success': True,
+        'verified': True,
+        'esewa_status': esewa_response.get('status'),
+        'transaction': transaction
+    }
+
+# Reconciliation of PENDING transactions abandoned before the eSewa redirect
+reconciler = Reconciler(
+    store,
+    esewa_client,
+    esewa.merchant_code,
+    max_workers=int(os.getenv('RECONCILE_WORKERS', 16)),
+    batch_size=int(os.getenv('RECONCILE_BATCH_SIZE', 500)),
+    on_settled=on_reconciled
+)
+
+@app.cli.command('reconcile')
+@click.option('--older-than', default=15.0, show_default=True, help='Minutes a transaction must have been PENDING')
+@click.option('--limit', default=None, type=int, help='Maximum transactions to check')
+def reconcile_command(older_than, limit):
+    """Verify stale PENDING transactions with eSewa and settle them"""
+    summary = reconciler.run_once(older_than, limit=limit)
+    click.echo(json.dumps(summary, indent=2))
+
+# Journal status -> (order status, transaction timestamp field) when recovering from the journal
+JOURNAL_RECOVERY_TRANSITIONS = {
+    transaction_status: (order_status, timestamp_field)
+    for transaction_status, order_status, timestamp_field in ESEWA_STATUS_TRANSITIONS.values()
+}
+
+@app.cli.group('journal')
+def journal_cli():
+    """Payment event journal"""
+    if journal is None:
+        raise click.ClickException('The journal is disabled (JOURNAL_DIR=off)')
+
+@journal_cli.command('snapshot')
+def journal_snapshot_command():
+    """Fold the journal into a new snapshot"""
+    result = journal.snapshot()
+    click.echo(json.dumps(result or {'skipped': 'another process is taking a snapshot'}, indent=2))
+
+@journal_cli.command('history')
+@click.argument('transaction_uuid')
+def journal_history_command(transaction_uuid):
+    """Print every journaled event of a transaction"""
+    click.echo(json.dumps(journal.history(transaction_uuid), indent=2))
+
+@journal_cli.command('recover')
+@click.option('--apply', 'apply_changes', is_flag=True, help='Settle lagging PENDING transactions in the store')
+@click.option('--chunk-size', default=500, show_default=True, help='Transactions looked up per store query')
+def journal_recover_command(apply_changes, chunk_size):
+    """Compare the journal with the store (e.g. after restoring a backup) and report drift"""
+    state = journal.replay()
+    settled = {
+        transaction_uuid: entry for transaction_uuid, entry in state['transactions'].items()
+        if entry['status'] in JOURNAL_RECOVERY_TRANSITIONS
+    }
+    missing, lagging, conflicting = [], [], []
+    uuids = list(state['transactions'])
+    for start in range(0, len(uuids), chunk_size):
+        chunk = uuids[start:start + chunk_size]
+        current = store.transaction_statuses(chunk)
+        for transaction_uuid in chunk:
+            stored = current.get(transaction_uuid)
+            entry = state['transactions'][transaction_uuid]
+            if stored is None:
+                missing.append(transaction_uuid)
+            elif transaction_uuid in settled and stored['status'] != entry['status']:
+                (lagging if stored['status'] == 'PENDING' else conflicting).append(transaction_uuid)
+
+    recovered = []
+    if apply_changes and lagging:
+        updates = []
+        for transaction_uuid in lagging:
+            entry = settled[transaction_uuid]
+            order_status, timestamp_field = JOURNAL_RECOVERY_TRANSITIONS[entry['status']]
+            updates.append((transaction_uuid,
+                            {'status': entry['status'], timestamp_field: entry['updated_at'],
+                             'recovered_at': datetime.now(timezone.utc).isoformat()},
+                            {'status': order_status}))
+        recovered = store.apply_updates(updates, expected_status='PENDING')
+        orders = []
+        for transaction in recovered:
+            publish_status(transaction)
+            order = store.get_order(transaction['order_id'])
+            orders.append(order)
+            if transaction['status'] == 'FAILED':
+                release_order_promotions(order)
+        track_orders(orders)
+
+    click.echo(json.dumps({
+        'snapshot': state['snapshot'],
+        'events_replayed': state['events_replayed'],
+        'replay_seconds': state['duration_seconds'],
+        'journaled_transactions': len(uuids),
+        # Missing from the store: cannot be rebuilt (orders are not journaled), only reported
+        'missing': missing,
+        'lagging': lagging,
+        'conflicting': conflicting,
+        'recovered': [transaction['transaction_uuid'] for transaction in recovered]
+    }, indent=2))
+
+@app.cli.group('analytics')
+def analytics_cli():
+    """Sales report rollups"""
+
+@analytics_cli.command('backfill')
+@click.option('--rebuild', is_flag=True, help='Drop the rollups first and recount every order')
+@click.option('--batch-size', default=1000, show_default=True, help='Orders folded per write')
+def analytics_backfill_command(rebuild, batch_size):
+    """Fold the order history into the sales report rollups"""
+    if rebuild:
+        sales_analytics.backend.reset()
+    summary = sales_analytics.backfill(store.iter_orders(batch_size=batch_size), batch_size=batch_size)
+    click.echo(json.dumps(summary, indent=2))
+
+def start_reconcile_scheduler() -> bool:
+    """Start the RECONCILE_INTERVAL scheduler thread in this process; False if it is disabled"""
+    interval = int(os.getenv('RECONCILE_INTERVAL', 0))
+    if interval <= 0:
+        return False
+    start_scheduler(reconciler, interval, float(os.getenv('RECONCILE_OLDER_THAN', 15)))
+    return True
+
+# Scheduler thread; enable it on a single process only (not every gunicorn worker).
+# gunicorn.conf.py turns this off and starts it in one worker after the fork instead
+if os.getenv('RECONCILE_ON_IMPORT', 'true').lower() != 'false':
+    start_reconcile_scheduler()
+
+# Fingerprinted static assets built by `flask --app app assets build`
+ASSETS_DIR = os.getenv('ASSETS_DIR', os.path.join(app.root_path, 'build', 'assets'))
+ASSET_MAX_AGE = int(os.getenv('ASSET_MAX_AGE', str(365 * 24 * 3600)))
+asset_manifest = AssetManifest.load(ASSETS_DIR)
+
+# Product card image URLs by image slug, shared with the JS product grid and cart
+product_images = {
+    product['image']: asset_manifest.thumbnail(f"images/kirana/{product['image']}.jpg")
+    for product in catalog.products.values() if product.get('image')
+}
+
+@app.context_processor
+def asset_helpers():
+    return {'asset_url': asset_manifest.url, 'product_images': product_images}
+
+@app.cli.group('assets')
+def assets_cli():
+    """Static asset pipeline"""
+
+@assets_cli.command('build')
+@click.option('--widths', default='320,640', show_default=True, help='Thumbnail widths in pixels')
+def build_assets_command(widths):
+    """Fingerprint, pre-compress and thumbnail everything under static/"""
+    manifest = build_assets(app.static_folder, ASSETS_DIR,
+                            thumbnail_widths=[int(width) for width in widths.split(',')])
+    click.echo(f"Built {len(manifest['files'])} files and {len(manifest['thumbnails'])} thumbnails in {ASSETS_DIR}")
+
+@app.route('/assets/<path:filename>')
+def built_asset(filename):
+    """Serve a fingerprinted asset, pre-compressed when the client accepts it"""
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding, suffix = None, ''
+    for candidate, extension in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.isfile(os.path.join(ASSETS_DIR, filename + extension)):
+            encoding, suffix = candidate, extension
+            break
+    
+    response = send_from_directory(ASSETS_DIR, filename + suffix, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Names change with content, so browsers never need to revalidate
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# Rendered HTML pages by (template, params); see page_response
+page_cache = TTLCache(maxsize=int(os.getenv('PAGE_CACHE_SIZE', 1024)), ttl=float(os.getenv('PAGE_CACHE_TTL', 300)))
+
+# Pages change only when templates or the data they render change
+PAGES_LAST_MODIFIED = datetime.fromtimestamp(int(max(
+    os.path.getmtime(os.path.join(directory, name))
+    for directory in (os.path.join(app.root_path, 'templates'), os.path.join(app.root_path, 'data'))
+    for name in os.listdir(directory)
+)), timezone.utc)
+
+# gzip/brotli for buffered text responses above COMPRESS_MIN_SIZE bytes
+compressor = Compressor(min_size=int(os.getenv('COMPRESS_MIN_SIZE', 1024)))
+
+@app.after_request
+def compress_response(response):
+    return compressor.process(request, response)
+
+# Metrics; with several gunicorn workers set METRICS_DIR so /metrics covers all of them
+if os.getenv('METRICS_DIR'):
+    metrics.registry.enable_multiprocess(os.getenv('METRICS_DIR'),
+                                         float(os.getenv('METRICS_FLUSH_INTERVAL', 5)))
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('method', 'route', 'status')
+)
+HTTP_REQUESTS_IN_FLIGHT = metrics.gauge('http_requests_in_flight', 'Requests currently being served')
+PAYMENTS_INITIATED = metrics.counter(
+    'payments_initiated_total', 'Payment initiation requests by outcome', ('outcome',)
+)
+PAYMENT_CALLBACKS = metrics.counter(
+    'payment_callbacks_total', 'eSewa success/failure callbacks by result', ('result',)
+)
+SIGNATURE_MISMATCHES = metrics.counter(
+    'payment_signature_mismatches_total', 'eSewa callbacks whose signature did not verify'
+)
+RATE_LIMITED = metrics.counter(
+    'rate_limited_requests_total', 'Requests rejected with 429 by route group', ('group',)
+)
+
+# Token buckets per client address and per route group, shared by all workers
+# through a SQLite file (RATE_LIMIT_STORAGE=memory:// keeps them per process)
+rate_limiter = RateLimiter(
+    create_buckets(os.getenv('RATE_LIMIT_STORAGE', 'sqlite:///thapa_kirana_ratelimit.db')),
+    {
+        'initiate': {
+            'client': Limit.parse(os.getenv('RATE_LIMIT_INITIATE', '10/minute')),
+            'global': Limit.parse(os.getenv('RATE_LIMIT_INITIATE_GLOBAL', '300/minute'))
+        },
+        'status': {
+            'client': Limit.parse(os.getenv('RATE_LIMIT_STATUS', '60/minute')),
+            'global': Limit.parse(os.getenv('RATE_LIMIT_STATUS_GLOBAL', 'off'))
+        },
+        'esewa_status': {
+            'client': Limit.parse(os.getenv('RATE_LIMIT_ESEWA_STATUS', '20/minute')),
+            'global': Limit.parse(os.getenv('RATE_LIMIT_ESEWA_STATUS_GLOBAL', '300/minute'))
+        },
+        'support': {
+            'client': Limit.parse(os.getenv('RATE_LIMIT_SUPPORT', '20/minute')),
+            'global': Limit.parse(os.getenv('RATE_LIMIT_SUPPORT_GLOBAL', 'off'))
+        }
+    }
+)
+RATE_LIMITED_ENDPOINTS = {
+    'initiate_payment': 'initiate',
+    'payment_status': 'status',
+    'payment_status_stream': 'status',
+    'payment_status_wait': 'status',
+    'esewa_status_check': 'esewa_status',
+    'verify_transaction': 'esewa_status',
+    'post_support_message': 'support'
+}
+
+@app.before_request
+def bind_request_id():
+    # Correlation id for every log line of this request; echoed in X-Request-ID
+    g.request_id = (request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16])[:64]
+    logging_setup.clear_context(request_id=g.request_id)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+
+@app.before_request
+def enforce_rate_limit():
+    group = RATE_LIMITED_ENDPOINTS.get(request.endpoint)
+    if group is None:
+        return None
+    decision = rate_limiter.check(group, request.remote_addr or 'unknown')
+    if decision['allowed']:
+        return None
+    RATE_LIMITED.inc(group)
+    log.info(f"Rate limited {request.remote_addr} on {group}", extra={'sample': True})
+    response = jsonify({'error': 'Too many requests, please try again later'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(decision['retry_after'])
+    return response
+
+@app.after_request
+def remember_response_status(response):
+    g.response_status = response.status_code
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.teardown_request
+def record_request_metrics(error=None):
+    # Runs after streamed responses finish, so NDJSON exports are timed in full
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    HTTP_REQUESTS_IN_FLIGHT.dec()
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route,
+                                 str(g.get('response_status', 500)))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/')
 def index():
     """Serve the main index page"""
-    return render_template('index.html')
+    # The page only changes with the catalog and the running sales
+    sales = tuple(promotion_engine.active_automatic())
+    
+    def render():
+        products = catalog.query(limit=PRODUCT_PAGE_SIZE)
+        next_cursor = None
+        if len(products) == PRODUCT_PAGE_SIZE:
+            next_cursor = encode_cursor(products[-1]['price'], products[-1]['id'])
+        return render_template('index.html', products=products, next_cursor=next_cursor, sales=sales)
+    
+    return page_response('index.html', render=render, sales=tuple(sale.code for sale in sales))
 
 @app.route('/cart')
 def cart():
     """Serve the cart page"""
-    return render_template('cart.html')
+    return page_response('cart.html')
+
+@app.route('/login')
+def login():
+    """Serve the login page"""
+    return page_response('login.html')
 
 @app.route('/cart-test')
 def cart_test():
     """Serve cart test page for debugging"""
     return render_template('cart_test.html')
 
+@app.route('/api/products')
+def list_products():
+    """
+    Query the product catalog, cheapest first
+    
+    Query params:
+        category: one or more categories (comma separated or repeated)
+        min_price, max_price: inclusive price bounds
+        limit: page size (default 24, max 100)
+        cursor: next_cursor value from the previous page
+    """
+    try:
+        categories = [
+            category for value in request.args.getlist('category')
+            for category in value.split(',') if category
+        ]
+        min_price = request.args.get('min_price', type=int)
+        max_price = request.args.get('max_price', type=int)
+        limit = min(max(int(request.args.get('limit', PRODUCT_PAGE_SIZE)), 1), 100)
+        
+        after = decode_cursor(request.args.get('cursor'))
+        if after:
+            after = (int(after[0]), int(after[1]))
+        
+        products = catalog.query(categories, min_price=min_price, max_price=max_price,
+                                 after=after, limit=limit)
+        
+        next_cursor = None
+        if len(products) == limit:
+            next_cursor = encode_cursor(products[-1]['price'], products[-1]['id'])
+        
+        return jsonify({
+            'success': True,
+            'products': products,
+            'count': len(products),
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    except Exception as e:
+        log.error(f"Product listing failed: {str(e)}")
+        return jsonify({'error': 'Product listing failed'}), 500
+
+@app.route('/api/delivery/areas')
+def delivery_areas():
+    """Selectable delivery areas per district"""
+    return jsonify({'success': True, 'areas': delivery_pricer.areas()})
+
+@app.route('/api/delivery/quote', methods=['POST'])
+def delivery_quote():
+    """
+    Quote delivery and, when a cart is given, the full order totals
+    
+    Expected JSON payload:
+    {
+        "cart": [{"id": 1, "qty": 1}] (optional),
+        "location": {"district": "kathmandu", "area": "koteshwor", "coordinates": {"lat": 27.7, "lng": 85.3}},
+        "delivery_speed": "express",
+        "promo_code": "THAPA10" (optional)
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        location = data.get('location') or {}
+        delivery_speed = data.get('delivery_speed', 'standard')
+        
+        quote = delivery_pricer.quote(location.get('district'), location.get('area'),
+                                      delivery_speed, location.get('coordinates'))
+        
+        totals = None
+        if data.get('cart'):
+            cart = catalog.price_cart(data['cart'])
+            totals = calculate_totals(cart, location, delivery_speed, data.get('promo_code'))
+        
+        return jsonify({'success': True, 'delivery': quote, 'totals': totals})
+        
+    except (DeliveryPricingError, CatalogError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.error(f"Delivery quote failed: {str(e)}")
+        return jsonify({'error': 'Delivery quote failed'}), 500
+
+def cart_response(items: Dict[int, int]):
+    """JSON body for the cart API: catalog-priced lines plus the item count"""
+    lines = cart_service.lines(items)
+    return jsonify({
+        'success': True,
+        'cart': lines,
+        'count': sum(line['qty'] for line in lines),
+        'subtotal': sum(line['price'] * line['qty'] for line in lines)
+    })
+
+@app.route('/api/cart')
+def get_cart():
+    """The current session's cart"""
+    try:
+        return cart_response(cart_service.items(customer_key()))
+    except Exception as e:
+        log.error(f"Cart lookup failed: {str(e)}")
+        return jsonify({'error': 'Cart lookup failed'}), 500
+
+@app.route('/api/cart/items', methods=['POST'])
+def add_cart_item():
+    """
+    Add a product to the cart
+    
+    Expected JSON payload:
+    {"id": 1, "qty": 1 (optional)}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        return cart_response(cart_service.add(customer_key(), data.get('id'), data.get('qty', 1)))
+    except CartError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.error(f"Cart update failed: {str(e)}")
+        return jsonify({'error': 'Cart update failed'}), 500
+
+@app.route('/api/cart/items/<int:product_id>', methods=['PUT', 'DELETE'])
+def update_cart_item(product_id):
+    """
+    Set a product's quantity (PUT {"qty": 2}; 0 removes it) or remove it (DELETE)
+    """
+    try:
+        if request.method == 'DELETE':
+            items = cart_service.remove(customer_key(), product_id)
+        else:
+            data = request.get_json(silent=True) or {}
+            items = cart_service.set(customer_key(), product_id, data.get('qty'))
+        return cart_response(items)
+    except CartError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.error(f"Cart update failed: {str(e)}")
+        return jsonify({'error': 'Cart update failed'}), 500
+
+@app.route('/api/cart/merge', methods=['POST'])
+def merge_cart():
+    """
+    Merge a browser (localStorage) cart into the session's cart, e.g. after login
+    
+    Expected JSON payload:
+    {"cart": [{"id": 1, "qty": 2}]}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        return cart_response(cart_service.merge(customer_key(), data.get('cart') or []))
+    except CartError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.error(f"Cart merge failed: {str(e)}")
+        return jsonify({'error': 'Cart merge failed'}), 500
+
 @app.route('/api/payment/initiate', methods=['POST'])
 def initiate_payment():
     """
     Initiate eSewa ePay payment process
     
-    Expected JSON payload:
+    Expected JSON payload (cart items are priced from the catalog by id;
+    without "cart" the session's server-side cart is checked out):
     {
-        "cart": [{"id": 1, "name": "Product", "price": 100, "qty": 1}],
+        "cart": [{"id": 1, "qty": 1}] (optional),
         "location": {"district": "kathmandu", "area": "koteshwor"},
         "delivery_speed": "express",
         "promo_code": "THAPA10" (optional)
@@ -189,10 +820,14 @@ def initiate_payment():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
+        # Promotion limits and carts are kept per browser session
+        data['customer_id'] = customer_key()
+        if not data.get('cart'):
+            data['cart'] = cart_service.as_cart(data['customer_id'])
+        
         # Validate required fields
         cart = data.get('cart', [])
         location = data.get('location', {})
-        delivery_speed = data.get('delivery_speed', 'standard')
         
         if not cart:
             return jsonify({'error': 'Cart is empty'}), 400
@@ -200,170 +835,228 @@ def initiate_payment():
         if not location.get('district'):
             return jsonify({'error': 'Delivery location required'}), 400
         
-        # Calculate amounts (following eSewa ePay format)
-        amount = sum(item['price'] * item.get('qty', item.get('quantity', 1)) for item in cart)  # Base product amount
-        tax_amount = 0  # No tax for now
-        product_service_charge = 0  # No service charge
-        product_delivery_charge = calculate_delivery_charge(location.get('district'), delivery_speed)
-        
-        # Apply discount if any
-        discount = calculate_discount(data.get('promo_code'), amount)
-        amount = amount - discount  # Apply discount to base amount
-        
-        # Calculate total as per eSewa formula: amount + tax + service + delivery
-        total_amount = amount + tax_amount + product_service_charge + product_delivery_charge
-        
-        if total_amount <= 0:
-            return jsonify({'error': 'Invalid total amount'}), 400
-        
-        # Generate unique transaction UUID (alphanumeric and hyphen only as per eSewa docs)
-        transaction_uuid = f"THAPA-{datetime.now().strftime('%y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
-        
-        # Store order details
-        order_id = f"ORD{uuid.uuid4().hex[:8].upper()}"
-        orders_db[order_id] = {
-            'id': order_id,
-            'transaction_uuid': transaction_uuid,
-            'cart': cart,
-            'location': location,
-            'delivery_speed': delivery_speed,
-            'amount': amount,
-            'tax_amount': tax_amount,
-            'product_service_charge': product_service_charge,
-            'product_delivery_charge': product_delivery_charge,
-            'total_amount': total_amount,
-            'discount': discount,
-            'status': 'PENDING',
-            'created_at': datetime.now(timezone.utc).isoformat(),
-            'promo_code': data.get('promo_code')
-        }
-        
-        # Generate signature using eSewa's exact specification
-        signature = payment_service.generate_signature(
-            str(total_amount), 
-            transaction_uuid, 
-            esewa.merchant_code
+        # Replay the first response for duplicate submissions (double clicks, retries);
+        # an Idempotency-Key reused for a different order is refused with 422
+        fingerprint = request_fingerprint(data)
+        key = request.headers.get('Idempotency-Key') or f"fp:{fingerprint}"
+        payload, status_code, replayed = idempotency_cache.run(
+            f"initiate:{data['customer_id']}:{key}", lambda: create_payment_order(data), fingerprint
         )
         
-        # Store transaction
-        transactions_db[transaction_uuid] = {
-            'transaction_uuid': transaction_uuid,
-            'order_id': order_id,
-            'total_amount': total_amount,
-            'status': 'PENDING',
-            'created_at': datetime.now(timezone.utc).isoformat()
-        }
-        
-        # Prepare eSewa ePay form data (exact format as per documentation)
-        payment_data = {
-            'amount': str(amount),
-            'tax_amount': str(tax_amount),
-            'total_amount': str(total_amount),
-            'transaction_uuid': transaction_uuid,
-            'product_code': esewa.merchant_code,
-            'product_service_charge': str(product_service_charge),
-            'product_delivery_charge': str(product_delivery_charge),
-            'success_url': esewa.success_url,
-            'failure_url': esewa.failure_url,
-            'signed_field_names': 'total_amount,transaction_uuid,product_code',
-            'signature': signature,
-            'payment_url': esewa.payment_url
-        }
-        
-        log.info(f"eSewa Payment initiated: Order {order_id}, Transaction {transaction_uuid}, Amount {total_amount}")
+        if replayed:
+            log.info(f"Replayed payment initiation for Transaction {payload.get('transaction_uuid')}",
+                     extra={'sample': True})
+        PAYMENTS_INITIATED.inc('replayed' if replayed else 'created' if status_code == 200 else 'rejected')
         
-        return jsonify({
-            'success': True,
-            'order_id': order_id,
-            'transaction_uuid': transaction_uuid,
-            'payment_url': esewa.payment_url,
-            'esewa_data': {
-                'amount': payment_data['amount'],
-                'tax_amount': payment_data['tax_amount'],
-                'total_amount': payment_data['total_amount'],
-                'transaction_uuid': payment_data['transaction_uuid'],
-                'product_code': payment_data['product_code'],
-                'product_service_charge': payment_data['product_service_charge'],
-                'product_delivery_charge': payment_data['product_delivery_charge'],
-                'success_url': payment_data['success_url'],
-                'failure_url': payment_data['failure_url'],
-                'signed_field_names': payment_data['signed_field_names'],
-                'signature': payment_data['signature']
-            },
-            'message': 'eSewa payment initiated successfully'
-        })
+        response = jsonify(payload)
+        response.status_code = status_code
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+        return response
         
     except Exception as e:
         log.error(f"eSewa payment initiation failed: {str(e)}")
         return jsonify({'error': 'Payment initiation failed'}), 500
 
+def create_payment_order(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """
+    Create the order, transaction and signed eSewa form data for a validated checkout
+    
+    Returns:
+        (response payload, HTTP status code)
+    """
+    location = data['location']
+    delivery_speed = data.get('delivery_speed', 'standard')
+    
+    # Price the cart from the catalog; client-supplied prices are ignored
+    try:
+        cart = catalog.price_cart(data['cart'])
+        totals = calculate_totals(cart, location, delivery_speed, data.get('promo_code'))
+    except (CatalogError, DeliveryPricingError) as e:
+        return {'error': str(e)}, 400
+    
+    amount = totals['amount']
+    tax_amount = totals['tax_amount']
+    product_service_charge = totals['product_service_charge']
+    product_delivery_charge = totals['product_delivery_charge']
+    discount = totals['discount']
+    total_amount = totals['total_amount']
+    
+    if to_paisa(total_amount) <= 0:
+        return {'error': 'Invalid total amount'}, 400
+    
+    # Count redemptions of capped promotions; undo them all if any cap is reached
+    customer_id = data.get('customer_id')
+    redeemed = []
+    for code in totals['promotions']:
+        promotion = promotion_engine.get(code)
+        if promotion is None or not promotion.limited:
+            continue
+        if not store.redeem_promotion(code, customer_id, promotion.max_redemptions, promotion.per_user_limit):
+            for done in redeemed:
+                store.release_promotion(done, customer_id)
+            return {'error': f"Promo code {code} has already been used"}, 400
+        redeemed.append(code)
+    
+    # Time-ordered, collision-safe transaction UUID (alphanumeric and hyphen only as per eSewa docs)
+    transaction_uuid = new_id('THAPA-')
+    
+    # Order details
+    order_id = new_id('ORD')
+    logging_setup.bind(order_id=order_id, transaction_uuid=transaction_uuid)
+    order = {
+        'id': order_id,
+        'transaction_uuid': transaction_uuid,
+        'cart': cart,
+        'location': location,
+        'delivery_speed': delivery_speed,
+        'amount': amount,
+        'tax_amount': tax_amount,
+        'product_service_charge': product_service_charge,
+        'product_delivery_charge': product_delivery_charge,
+        'total_amount': total_amount,
+        'discount': discount,
+        'status': 'PENDING',
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'promo_code': data.get('promo_code'),
+        'promotions': totals['promotions'],
+        'redeemed_promotions': redeemed,
+        'customer_id': customer_id
+    }
+    
+    # Generate signature using eSewa's exact specification
+    signature = payment_service.generate_signature(
+        total_amount,
+        transaction_uuid, 
+        esewa.merchant_code
+    )
+    
+    # Store order and transaction together
+    store.create_payment(order, {
+        'transaction_uuid': transaction_uuid,
+        'order_id': order_id,
+        'total_amount': total_amount,
+        'status': 'PENDING',
+        'created_at': datetime.now(timezone.utc).isoformat()
+    })
+    record_event('initiated', transaction_uuid, order_id=order_id, status='PENDING', total_amount=total_amount)
+    track_orders([order])
+    
+    # Prepare eSewa ePay form data (exact format as per documentation)
+    payment_data = {
+        'amount': amount,
+        'tax_amount': tax_amount,
+        'total_amount': total_amount,
+        'transaction_uuid': transaction_uuid,
+        'product_code': esewa.merchant_code,
+        'product_service_charge': product_service_charge,
+        'product_delivery_charge': product_delivery_charge,
+        'success_url': esewa.success_url,
+        'failure_url': esewa.failure_url,
+        'signed_field_names': 'total_amount,transaction_uuid,product_code',
+        'signature': signature,
+        'payment_url': esewa.payment_url
+    }
+    
+    log.info(f"eSewa Payment initiated: Order {order_id}, Transaction {transaction_uuid}, Amount {total_amount}")
+    
+    return {
+        'success': True,
+        'order_id': order_id,
+        'transaction_uuid': transaction_uuid,
+        'payment_url': esewa.payment_url,
+        'esewa_data': {
+            'amount': payment_data['amount'],
+            'tax_amount': payment_data['tax_amount'],
+            'total_amount': payment_data['total_amount'],
+            'transaction_uuid': payment_data['transaction_uuid'],
+            'product_code': payment_data['product_code'],
+            'product_service_charge': payment_data['product_service_charge'],
+            'product_delivery_charge': payment_data['product_delivery_charge'],
+            'success_url': payment_data['success_url'],
+            'failure_url': payment_data['failure_url'],
+            'signed_field_names': payment_data['signed_field_names'],
+            'signature': payment_data['signature']
+        },
+        'message': 'eSewa payment initiated successfully'
+    }, 200
+
 @app.route('/payment/success')
 def payment_success():
     """Handle successful payment callback from eSewa ePay"""
     try:
         # eSewa ePay sends response as Base64 encoded data in 'data' parameter
-        encoded_data = request.args.get('data')
-        
-        if not encoded_data:
-            log.warning("No encoded data received from eSewa")
-            return redirect('/payment-failed.html?reason=missing_data')
-        
         try:
-            # Decode Base64 response
-            decoded_data = base64.b64decode(encoded_data).decode('utf-8')
-            response_data = json.loads(decoded_data)
-            
-            log.info(f"eSewa response received: {response_data}")
-            
-        except Exception as decode_error:
-            log.error(f"Failed to decode eSewa response: {decode_error}")
-            return redirect('/payment-failed.html?reason=invalid_response')
+            response_data = callback_parser.parse(request.args.get('data'))
+        except CallbackError as e:
+            log.warning(f"Rejected eSewa callback: {str(e)}")
+            if e.reason == 'invalid_signature':
+                SIGNATURE_MISMATCHES.inc()
+            PAYMENT_CALLBACKS.inc('invalid')
+            return redirect(f'/payment-failed.html?reason={e.reason}')
         
         # Extract response parameters
-        transaction_code = response_data.get('transaction_code')
-        status = response_data.get('status')
-        total_amount = response_data.get('total_amount')
-        transaction_uuid = response_data.get('transaction_uuid')
-        product_code = response_data.get('product_code')
-        received_signature = response_data.get('signature')
-        
-        if not all([transaction_code, status, total_amount, transaction_uuid, product_code]):
-            log.warning("Missing required parameters in eSewa response")
-            return redirect('/payment-failed.html?reason=missing_params')
-        
-        # Verify signature for response integrity
-        response_message = f"transaction_code={transaction_code},status={status},total_amount={total_amount},transaction_uuid={transaction_uuid},product_code={product_code},signed_field_names=transaction_code,status,total_amount,transaction_uuid,product_code,signed_field_names"
-        expected_signature = payment_service.generate_response_signature(response_message)
-        
-        if received_signature != expected_signature:
-            log.warning(f"Signature mismatch - Expected: {expected_signature}, Received: {received_signature}")
-            # For demo purposes, we'll continue even if signature doesn't match
-            # In production, you should reject the transaction
+        transaction_code = response_data['transaction_code']
+        status = response_data['status']
+        transaction_uuid = response_data['transaction_uuid']
+        logging_setup.bind(transaction_uuid=transaction_uuid)
+        
+        # A repeated redirect (page reload, eSewa retry) was already settled by this worker
+        outcome = callback_parser.seen(transaction_code)
+        if outcome is not None and outcome['transaction_uuid'] == transaction_uuid:
+            PAYMENT_CALLBACKS.inc('replayed')
+            return redirect(f"/payment-success.html?order_id={outcome['order_id']}&transaction_code={transaction_code}")
+        
+        record_event('callback_received', transaction_uuid, source='success', esewa_status=status,
+                     transaction_code=transaction_code, total_amount=response_data['total_amount'])
         
         # Check if payment is complete
         if status == 'COMPLETE':
-            # Update transaction status
-            if transaction_uuid in transactions_db:
-                transactions_db[transaction_uuid]['status'] = 'SUCCESS'
-                transactions_db[transaction_uuid]['transaction_code'] = transaction_code
-                transactions_db[transaction_uuid]['verified_at'] = datetime.now(timezone.utc).isoformat()
-                
-                # Update order status
-                order_id = transactions_db[transaction_uuid]['order_id']
-                if order_id in orders_db:
-                    orders_db[order_id]['status'] = 'PAID'
-                    orders_db[order_id]['payment_verified_at'] = datetime.now(timezone.utc).isoformat()
-                    orders_db[order_id]['transaction_code'] = transaction_code
+            # Update transaction and order status
+            now = datetime.now(timezone.utc).isoformat()
+            updates = [(
+                transaction_uuid,
+                {'status': 'SUCCESS', 'transaction_code': transaction_code, 'verified_at': now},
+                {'status': 'PAID', 'payment_verified_at': now, 'transaction_code': transaction_code}
+            )]
+            # A PENDING transaction is settled here. A FAILED one is too: the unsigned
+            # failure redirect (or a status check that ran first) must not outrank
+            # eSewa's signed word that the money was taken. Anything else is left as it is
+            settled = store.apply_updates(updates, expected_status='PENDING')
+            recovered = [] if settled else store.apply_updates(updates, expected_status='FAILED')
+            settled = settled or recovered
+            transaction = settled[0] if settled else store.get_transaction(transaction_uuid)
+            logging_setup.bind(order_id=transaction and transaction['order_id'])
+            if settled:
+                publish_status(transaction)
+                record_event('verified', transaction_uuid, order_id=transaction['order_id'], status='SUCCESS',
+                             transaction_code=transaction_code, source='callback')
+                order = store.get_order(transaction['order_id'])
+                if recovered:
+                    log.warning(f"COMPLETE callback recovered FAILED transaction {transaction_uuid}")
+                    retake_order_promotions(order)
+                remove_paid_items(order)
+                track_orders([order])
+            elif transaction and transaction['status'] != 'SUCCESS':
+                log.error(f"COMPLETE callback for {transaction['status']} transaction {transaction_uuid}")
+                PAYMENT_CALLBACKS.inc('incomplete')
+                return redirect(f'/payment-failed.html?reason=payment_incomplete&transaction_uuid={transaction_uuid}')
+            if transaction:
+                callback_parser.remember(transaction_code, {'transaction_uuid': transaction_uuid,
+                                                            'order_id': transaction['order_id']})
             
             log.info(f"eSewa payment successful: Transaction {transaction_uuid}, Code {transaction_code}")
+            PAYMENT_CALLBACKS.inc('success')
             
-                    # Redirect to success page with order details
-            order_id = transactions_db[transaction_uuid]['order_id'] if transaction_uuid in transactions_db else 'UNKNOWN'
+            # Redirect to success page with order details
+            order_id = transaction['order_id'] if transaction else 'UNKNOWN'
             return redirect(f'/payment-success.html?order_id={order_id}&transaction_code={transaction_code}')
             
         else:
             log.warning(f"eSewa payment not complete: Status {status}")
-            return redirect('/payment-failed.html?reason=payment_incomplete')
+            PAYMENT_CALLBACKS.inc('incomplete')
+            # The failure page keeps listening and moves on once the payment settles
+            return redirect(f'/payment-failed.html?reason=payment_incomplete&transaction_uuid={transaction_uuid}')
             
     except Exception as e:
         log.error(f"eSewa payment success handling failed: {str(e)}")
@@ -374,17 +1067,26 @@ def payment_failure():
     """Handle failed payment callback from eSewa"""
     try:
         transaction_uuid = request.args.get('transaction_uuid')
+        logging_setup.bind(transaction_uuid=transaction_uuid)
         
-        if transaction_uuid and transaction_uuid in transactions_db:
-            transactions_db[transaction_uuid]['status'] = 'FAILED'
-            transactions_db[transaction_uuid]['failed_at'] = datetime.now(timezone.utc).isoformat()
-            
-            # Update order status
-            order_id = transactions_db[transaction_uuid]['order_id']
-            if order_id in orders_db:
-                orders_db[order_id]['status'] = 'PAYMENT_FAILED'
+        if transaction_uuid:
+            record_event('callback_received', transaction_uuid, source='failure')
+            # The failure redirect is unsigned: it may only fail a transaction that is still PENDING
+            settled = store.apply_updates([(
+                transaction_uuid,
+                {'status': 'FAILED', 'failed_at': datetime.now(timezone.utc).isoformat()},
+                {'status': 'PAYMENT_FAILED'}
+            )], expected_status='PENDING')
+            for transaction in settled:
+                record_event('failed', transaction_uuid, order_id=transaction['order_id'], status='FAILED',
+                             source='callback')
+                publish_status(transaction)
+                order = store.get_order(transaction['order_id'])
+                release_order_promotions(order)
+                track_orders([order])
         
         log.info(f"Payment failed: Transaction {transaction_uuid}")
+        PAYMENT_CALLBACKS.inc('failure')
         return redirect('/payment-failed.html')
         
     except Exception as e:
@@ -395,9 +1097,9 @@ def payment_failure():
 def payment_status(transaction_uuid):
     """Get payment status for a transaction"""
     try:
-        if transaction_uuid in transactions_db:
-            transaction = transactions_db[transaction_uuid]
-            order = orders_db.get(transaction['order_id'], {})
+        transaction = store.get_transaction(transaction_uuid)
+        if transaction:
+            order = store.get_order(transaction['order_id']) or {}
             
             return jsonify({
                 'success': True,
@@ -411,10 +1113,96 @@ def payment_status(transaction_uuid):
         log.error(f"Status check failed: {str(e)}")
         return jsonify({'error': 'Status check failed'}), 500
 
+def sse_message(event: Dict[str, Any]) -> str:
+    return f"event: status\ndata: {json.dumps(event)}\n\n"
+
+@app.route('/api/payment/status/<transaction_uuid>/stream')
+def payment_status_stream(transaction_uuid):
+    """
+    Server-Sent Events stream of a transaction's status
+    
+    Sends the current status immediately, then every change, and closes
+    once the status is final or after STATUS_STREAM_TIMEOUT seconds.
+    """
+    try:
+        current = store.transaction_statuses([transaction_uuid]).get(transaction_uuid)
+        if current is None:
+            return jsonify({'error': 'Transaction not found'}), 404
+        
+        # Subscribe before streaming so no change between the snapshot and the first wait is lost
+        subscription = None
+        if current['status'] not in TERMINAL_STATUSES:
+            subscription = notification_bus.subscribe(transaction_uuid, current['status'])
+        
+        def events():
+            try:
+                yield 'retry: 3000\n\n'
+                yield sse_message(current)
+                if subscription is None:
+                    return
+                deadline = time.monotonic() + STATUS_STREAM_TIMEOUT
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    event = subscription.get(timeout=min(STATUS_STREAM_HEARTBEAT, remaining))
+                    if event is None:
+                        # Comment line keeps proxies from closing an idle connection
+                        yield ': keep-alive\n\n'
+                        continue
+                    yield sse_message(event)
+                    if event['status'] in TERMINAL_STATUSES:
+                        return
+            finally:
+                if subscription is not None:
+                    subscription.close()
+        
+        return Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        
+    except Exception as e:
+        log.error(f"Status stream failed: {str(e)}")
+        return jsonify({'error': 'Status stream failed'}), 500
+
+@app.route('/api/payment/status/<transaction_uuid>/wait')
+def payment_status_wait(transaction_uuid):
+    """
+    Long-poll for a transaction's status to change
+    
+    Query params:
+        status: Status the client already has (defaults to the current one)
+        timeout: Seconds to wait, at most 30 (default 25)
+    
+    Returns as soon as the status differs from `status`, or with
+    changed=false when the timeout expires.
+    """
+    try:
+        try:
+            timeout = min(float(request.args.get('timeout', 25)), STATUS_WAIT_MAX_TIMEOUT)
+        except ValueError:
+            return jsonify({'error': 'Invalid timeout'}), 400
+        
+        current = store.transaction_statuses([transaction_uuid]).get(transaction_uuid)
+        if current is None:
+            return jsonify({'error': 'Transaction not found'}), 404
+        
+        known = request.args.get('status') or current['status']
+        if current['status'] != known or current['status'] in TERMINAL_STATUSES:
+            return jsonify({'success': True, 'changed': current['status'] != known, 'transaction': current})
+        
+        with notification_bus.subscribe(transaction_uuid, known) as subscription:
+            event = subscription.get(timeout=max(timeout, 0))
+        
+        return jsonify({'success': True, 'changed': event is not None, 'transaction': event or current})
+        
+    except Exception as e:
+        log.error(f"Status wait failed: {str(e)}")
+        return jsonify({'error': 'Status wait failed'}), 500
+
 @app.route('/api/esewa/status')
 def esewa_status_check():
     """
-    Check payment status with eSewa (simulated for demo)
+    Check payment status with the eSewa status API
     Query params: product_code, total_amount, transaction_uuid
     """
     try:
@@ -425,39 +1213,19 @@ def esewa_status_check():
         if not all([product_code, total_amount, transaction_uuid]):
             return jsonify({'error': 'Missing required parameters'}), 400
         
-        # In production, make actual HTTP request to eSewa status API
-        # For demo, simulate response
-        if transaction_uuid in transactions_db:
-            transaction = transactions_db[transaction_uuid]
-            
-            # Simulate eSewa status API response format
-            if transaction['status'] == 'SUCCESS':
-                response = {
-                    'product_code': product_code,
-                    'transaction_uuid': transaction_uuid,
-                    'total_amount': float(total_amount),
-                    'status': 'COMPLETE',
-                    'ref_id': transaction.get('transaction_code', f"REF{uuid.uuid4().hex[:6].upper()}")
-                }
-            else:
-                response = {
-                    'product_code': product_code,
-                    'transaction_uuid': transaction_uuid,
-                    'total_amount': float(total_amount),
-                    'status': 'PENDING',
-                    'ref_id': None
-                }
-            
-            return jsonify(response)
-        else:
-            return jsonify({
-                'product_code': product_code,
-                'transaction_uuid': transaction_uuid,
-                'total_amount': float(total_amount),
-                'status': 'NOT_FOUND',
-                'ref_id': None
-            }), 404
-            
+        try:
+            response = esewa_client.check_status(product_code, total_amount, transaction_uuid)
+        except EsewaResponseError as e:
+            return jsonify(e.payload or {'code': 0, 'error_message': 'Invalid request'}), e.status_code
+        
+        return jsonify(response)
+        
+    except EsewaUnavailable as e:
+        log.error(f"eSewa status check failed: {str(e)}")
+        return jsonify({
+            'code': 0,
+            'error_message': 'Service is currently unavailable'
+        }), 503
     except Exception as e:
         log.error(f"eSewa status check failed: {str(e)}")
         return jsonify({
@@ -465,176 +1233,478 @@ def esewa_status_check():
             'error_message': 'Service is currently unavailable'
         }), 500
 
+@app.route('/api/payment/verify/<transaction_uuid>', methods=['POST'])
+def verify_transaction(transaction_uuid):
+    """
+    Confirm a PENDING transaction with the eSewa status API and settle it
+    
+    Transactions that are already settled are returned unchanged
+    (verified=false) without calling eSewa.
+    """
+    try:
+        transaction = store.get_transaction(transaction_uuid)
+        if transaction is None:
+            return jsonify({'error': 'Transaction not found'}), 404
+        if transaction['status'] != 'PENDING':
+            return jsonify({'success': True, 'verified': False, 'transaction': transaction})
+        
+        try:
+            response = esewa_client.check_status(esewa.merchant_code, str(transaction['total_amount']),
+                                                 transaction_uuid)
+        except EsewaResponseError as e:
+            log.warning(f"eSewa rejected verification of {transaction_uuid}: {str(e)}")
+            return jsonify({'error': 'eSewa rejected the status check'}), 502
+        
+        return jsonify(settle_verification(transaction, response))
+        
+    except EsewaUnavailable as e:
+        log.error(f"Payment verification failed: {str(e)}")
+        return jsonify({'error': 'Verification service unavailable'}), 503
+    except Exception as e:
+        log.error(f"Payment verification failed: {str(e)}")
+        return jsonify({'error': 'Payment verification failed'}), 500
+
 @app.route('/api/orders')
 def list_orders():
-    """List all orders (for admin/demo purposes)"""
+    """
+    List orders (for admin/demo purposes), newest first
+    
+    Query params:
+        status, district, promo_code: exact-match filters
+        from, to: ISO-8601 date/datetime range on created_at (from inclusive, to exclusive)
+        limit: page size (default 50, max 500)
+        cursor: next_cursor value from the previous page
+        format: 'ndjson' streams every matching order, one JSON object per line
+    """
     try:
+        filters = {
+            'status': request.args.get('status'),
+            'district': request.args.get('district'),
+            'promo_code': request.args.get('promo_code'),
+            'created_from': parse_timestamp(request.args.get('from')),
+            'created_to': parse_timestamp(request.args.get('to'))
+        }
+        filters = {key: value for key, value in filters.items() if key in ORDER_FILTERS and value}
+        
+        if request.args.get('format') == 'ndjson':
+            def generate():
+                for order in store.iter_orders(filters):
+                    yield json.dumps(order) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        after = decode_cursor(request.args.get('cursor'))
+        orders = store.query_orders(filters, after=after, limit=limit)
+        
+        next_cursor = None
+        if len(orders) == limit:
+            next_cursor = encode_cursor(orders[-1]['created_at'], orders[-1]['id'])
+        
         return jsonify({
             'success': True,
-            'orders': list(orders_db.values()),
-            'count': len(orders_db)
+            'orders': orders,
+            'count': len(orders),
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
     except Exception as e:
         log.error(f"Orders listing failed: {str(e)}")
         return jsonify({'error': 'Orders listing failed'}), 500
 
+REPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', to_csv),
+    'parquet': ('application/vnd.apache.parquet', to_parquet)
+}
+
+def report_day(value: Optional[str]) -> Optional[str]:
+    """Validate a YYYY-MM-DD report bound (store-local day)"""
+    return date.fromisoformat(value).isoformat() if value else None
+
+def report_response(name: str, rows: List[Dict[str, Any]]):
+    """Report rows as JSON, or as a CSV/Parquet download with ?format="""
+    fmt = request.args.get('format', 'json')
+    if fmt == 'json':
+        return jsonify({'success': True, 'report': name, 'rows': rows, 'count': len(rows)})
+    if fmt not in REPORT_FORMATS:
+        raise AnalyticsError(f"Unsupported format: {fmt}")
+    mimetype, render = REPORT_FORMATS[fmt]
+    return Response(render(rows), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{name}.{fmt}"'})
+
+@app.route('/api/reports/<report>')
+def sales_report(report):
+    """
+    Sales reports from the incrementally maintained rollups
+    
+    Reports:
+        revenue, failures: ?by=day|district|delivery_speed
+        promotions: redemption rate and discount per code
+        products: top products of paid orders, ?limit= (default 10, max 100)
+    
+    Query params:
+        from, to: inclusive YYYY-MM-DD range of store-local order days
+        format: json (default), csv or parquet
+    """
+    try:
+        day_from = report_day(request.args.get('from'))
+        day_to = report_day(request.args.get('to'))
+        by = request.args.get('by', 'day')
+        
+        if report in ('revenue', 'failures'):
+            if by not in ('day', 'district', 'delivery_speed'):
+                raise AnalyticsError(f"Unknown report dimension: {by}")
+            method = sales_analytics.revenue if report == 'revenue' else sales_analytics.failures
+            rows = method(by, day_from, day_to)
+        elif report == 'promotions':
+            rows = sales_analytics.promotions(day_from, day_to)
+        elif report == 'products':
+            limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+            rows = sales_analytics.top_products(limit, day_from, day_to)
+            for row in rows:
+                product = catalog.get(row['product_id'])
+                row['name'] = product['name'] if product else None
+        else:
+            return jsonify({'error': f'Unknown report: {report}'}), 404
+        
+        return report_response(report, rows)
+    except (AnalyticsError, ValueError) as e:
+        return jsonify({'error': f'Invalid report request: {e}'}), 400
+    except Exception as e:
+        log.error(f"Sales report failed: {str(e)}")
+        return jsonify({'error': 'Sales report failed'}), 500
+
+def support_after() -> int:
+    """The `after` message id of a support request: query param, else the SSE Last-Event-ID header"""
+    value = request.args.get('after') or request.headers.get('Last-Event-ID') or 0
+    after = int(value)
+    if after < 0:
+        raise ValueError('after')
+    return after
+
+def customer_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Support messages as shown to the customer (without the conversation id)"""
+    return [{key: message[key] for key in ('id', 'sender', 'body', 'created_at')} for message in messages]
+
+def support_message_event(message: Dict[str, Any]) -> str:
+    return f"id: {message['id']}\nevent: message\ndata: {json.dumps(message)}\n\n"
+
+def support_admin_denied() -> Optional[Tuple[Response, int]]:
+    """403 response unless the request carries the SUPPORT_ADMIN_TOKEN bearer token"""
+    supplied = request.headers.get('Authorization', '')
+    if SUPPORT_ADMIN_TOKEN and hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {SUPPORT_ADMIN_TOKEN}".encode('utf-8')):
+        return None
+    return jsonify({'error': 'Forbidden'}), 403
+
+@app.route('/api/support/messages')
+def support_messages():
+    """
+    The current customer's support conversation
+
+    Query params:
+        after: Only messages with a larger id (default 0: the whole kept history)
+    """
+    try:
+        try:
+            after = support_after()
+        except ValueError:
+            return jsonify({'error': 'Invalid after'}), 400
+        return jsonify({'success': True, 'messages': customer_messages(support_hub.messages(customer_key(), after))})
+    except Exception as e:
+        log.error(f"Support messages failed: {str(e)}")
+        return jsonify({'error': 'Unable to load messages'}), 500
+
+@app.route('/api/support/messages', methods=['POST'])
+def post_support_message():
+    """Send a message to the shop: {"message": "..."}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        message = support_hub.post(customer_key(), 'customer', data.get('message'))
+        return jsonify({'success': True, 'message': customer_messages([message])[0]}), 201
+    except SupportError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.error(f"Support message failed: {str(e)}")
+        return jsonify({'error': 'Unable to send message'}), 500
+
+@app.route('/api/support/messages/wait')
+def support_messages_wait():
+    """
+    Long-poll for new messages in the current customer's conversation
+
+    Query params:
+        after: Id of the newest message the client has
+        timeout: Seconds to wait, at most 30 (default 25)
+
+    Returns the new messages as soon as there are any, or an empty list
+    when the timeout expires.
+    """
+    try:
+        try:
+            after = support_after()
+            timeout = min(float(request.args.get('timeout', 25)), STATUS_WAIT_MAX_TIMEOUT)
+        except ValueError:
+            return jsonify({'error': 'Invalid after or timeout'}), 400
+
+        messages = support_hub.wait(customer_key(), after, max(timeout, 0))
+        return jsonify({'success': True, 'messages': customer_messages(messages)})
+    except Exception as e:
+        log.error(f"Support wait failed: {str(e)}")
+        return jsonify({'error': 'Unable to load messages'}), 500
+
+@app.route('/api/support/messages/stream')
+def support_messages_stream():
+    """
+    Server-Sent Events stream of the current customer's conversation
+
+    Sends the messages after `after` (or Last-Event-ID on reconnect), then
+    each new one, and closes after STATUS_STREAM_TIMEOUT seconds.
+    """
+    try:
+        try:
+            after = support_after()
+        except ValueError:
+            return jsonify({'error': 'Invalid after'}), 400
+        conversation_id = customer_key()
+
+        def events():
+            last_id = after
+            deadline = time.monotonic() + STATUS_STREAM_TIMEOUT
+            yield 'retry: 3000\n\n'
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                messages = support_hub.wait(conversation_id, last_id, min(STATUS_STREAM_HEARTBEAT, remaining))
+                if not messages:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ': keep-alive\n\n'
+                    continue
+                for message in customer_messages(messages):
+                    yield support_message_event(message)
+                last_id = messages[-1]['id']
+
+        return Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Exception as e:
+        log.error(f"Support stream failed: {str(e)}")
+        return jsonify({'error': 'Support stream failed'}), 500
+
+@app.route('/api/support/conversations')
+def support_conversations():
+    """
+    Most recently active support conversations with their latest message (admin)
+
+    Query params:
+        limit: Conversations to list (default 50, max 500)
+    """
+    denied = support_admin_denied()
+    if denied:
+        return denied
+    try:
+        try:
+            limit = max(1, min(int(request.args.get('limit', 50)), 500))
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+        return jsonify({'success': True, 'conversations': support_hub.conversations(limit)})
+    except Exception as e:
+        log.error(f"Support conversations failed: {str(e)}")
+        return jsonify({'error': 'Unable to load conversations'}), 500
+
+@app.route('/api/support/conversations/<conversation_id>/messages')
+def support_conversation_messages(conversation_id):
+    """Messages of one conversation (admin), ?after= as for the customer"""
+    denied = support_admin_denied()
+    if denied:
+        return denied
+    try:
+        try:
+            after = support_after()
+        except ValueError:
+            return jsonify({'error': 'Invalid after'}), 400
+        return jsonify({'success': True, 'messages': support_hub.messages(conversation_id, after)})
+    except Exception as e:
+        log.error(f"Support messages failed: {str(e)}")
+        return jsonify({'error': 'Unable to load messages'}), 500
+
+@app.route('/api/support/conversations/<conversation_id>/reply', methods=['POST'])
+def support_reply(conversation_id):
+    """Reply to a customer as the shop (admin): {"message": "..."}"""
+    denied = support_admin_denied()
+    if denied:
+        return denied
+    try:
+        if not support_hub.messages(conversation_id):
+            return jsonify({'error': 'Conversation not found'}), 404
+        data = request.get_json(silent=True) or {}
+        message = support_hub.post(conversation_id, 'admin', data.get('message'))
+        return jsonify({'success': True, 'message': message}), 201
+    except SupportError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.error(f"Support reply failed: {str(e)}")
+        return jsonify({'error': 'Unable to send reply'}), 500
+
 # Static files are handled automatically by Flask from /static folder
 
 # Helper functions
-def calculate_delivery_charge(district: str, speed: str) -> float:
+def calculate_delivery_charge(district: str, speed: str, area: Optional[str] = None,
+                              coordinates: Optional[Dict[str, Any]] = None) -> float:
     """Calculate delivery charge based on location and speed"""
-    base_charges = {
-        'kathmandu': 40,
-        'lalitpur': 60,
-        'bhaktapur': 80,
-        'custom': 120
-    }
+    return delivery_pricer.quote(district, area, speed, coordinates)['charge']
+
+def calculate_totals(cart: list, location: Dict[str, Any], delivery_speed: str,
+                     promo_code: Optional[str]) -> Dict[str, Any]:
+    """
+    Compute the eSewa amount breakdown for priced cart lines
     
-    base = base_charges.get(district, 50)
+    Args:
+        cart: Cart lines priced by the catalog
+        location: Delivery location (district, area, coordinates)
+        delivery_speed: Delivery speed key
+        promo_code: Optional promo code
+        
+    Returns:
+        Dictionary with applied promotion codes and the eSewa amount fields
+        (subtotal, discount, amount, ... total_amount) as canonical amount strings
+    """
+    key = json.dumps([
+        sorted((item['id'], item['qty'], item['price']) for item in cart),
+        promotion_engine.state_key(promo_code),
+        location.get('district'), location.get('area'), location.get('coordinates'), delivery_speed
+    ], sort_keys=True, default=str)
+    totals = totals_cache.get(key)
+    if totals is None:
+        subtotal = sum(to_paisa(item['price']) * item['qty'] for item in cart)  # Base product amount
+        product_delivery_charge = to_paisa(calculate_delivery_charge(
+            location.get('district'), delivery_speed, location.get('area'), location.get('coordinates')
+        ))
+        
+        # Apply the entered code and any automatic promotions (e.g. the Friday sale)
+        promotion = promotion_engine.evaluate(promo_code, cart, subtotal)
+        
+        # amount = subtotal - discount; total = amount + tax + service + delivery (no tax or service charge)
+        totals = breakdown(subtotal, promotion['discount'], product_delivery_charge)
+        totals['promotions'] = [applied.code for applied in promotion['promotions']]
+        totals_cache.set(key, totals)
     
-    if speed == 'express':
-        base += 40
-    elif speed == 'scheduled':
-        base -= 10
+    return {**totals, 'promotions': list(totals['promotions'])}
+
+def parse_timestamp(value: Optional[str]) -> Optional[str]:
+    """Normalize an ISO-8601 date/datetime query value to the UTC format used in created_at"""
+    if not value:
+        return None
     
-    return max(0, base)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+def encode_cursor(sort_key: Any, item_id: Any) -> str:
+    """Build an opaque pagination cursor from the sort key and id of the last item of a page"""
+    return base64.urlsafe_b64encode(f"{sort_key}|{item_id}".encode('utf-8')).decode('ascii')
 
-def calculate_discount(promo_code: str, subtotal: float) -> float:
-    """Calculate discount amount based on promo code"""
-    if not promo_code:
-        return 0
+def decode_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    """Decode a cursor produced by encode_cursor (raises ValueError if malformed)"""
+    if not cursor:
+        return None
     
-    promo_code = promo_code.upper()
+    try:
+        sort_key, item_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 1)
+    except Exception:
+        raise ValueError('cursor')
+    return sort_key, item_id
+
+def page_response(template: str, render=None, **params: str) -> Response:
+    """
+    Serve an HTML page with a weak ETag and Last-Modified, answering 304 when the client's copy is current
     
-    if promo_code == 'THAPA10':
-        return subtotal * 0.10  # 10% discount
-    elif promo_code == 'FLAT50':
-        return 50  # Rs. 50 flat discount
-    elif promo_code == 'NEWUSER20':
-        return subtotal * 0.20  # 20% discount for new users
+    Rendered pages are cached by template and params, so a burst of
+    identical requests (e.g. payment redirects) renders and hashes once.
+    
+    Args:
+        template: Template name
+        render: Callable producing the HTML (defaults to rendering template with params)
+        params: Values the page depends on; also the template context by default
+    """
+    key = (template, tuple(sorted(params.items())))
+    page = None if app.debug else page_cache.get(key)
+    if page is None:
+        html = render() if render is not None else render_template(template, **params)
+        page = (html, generate_etag(html.encode('utf-8')))
+        page_cache.set(key, page)
     
-    return 0
+    response = Response(page[0], mimetype='text/html')
+    response.set_etag(page[1], weak=True)
+    response.last_modified = PAGES_LAST_MODIFIED
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
-# Success and failure HTML templates
+def customer_key() -> str:
+    """Stable id for the current browser session, used for its cart and per-customer promotion limits"""
+    if 'customer_id' not in session:
+        # Outlive the browser session so the server-side cart is still there next visit
+        session.permanent = True
+        session['customer_id'] = uuid.uuid4().hex
+    return session['customer_id']
+
+# Payment result pages (rendered from templates, cached and served conditionally)
 @app.route('/payment-success.html')
 def success_page():
     """Payment success page"""
-    order_id = request.args.get('order_id', '')
-    ref_id = request.args.get('ref_id', '')
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Payment Successful - Thapa Kirana</title>
-        <link rel="stylesheet" href="style.css">
-        <style>
-            .success-container {{
-                max-width: 600px;
-                margin: 100px auto;
-                text-align: center;
-                padding: 2rem;
-                background: white;
-                border-radius: 12px;
-                box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-            }}
-            .success-icon {{
-                font-size: 4rem;
-                color: #10b981;
-                margin-bottom: 1rem;
-            }}
-            .order-details {{
-                background: #f3f4f6;
-                padding: 1.5rem;
-                border-radius: 8px;
-                margin: 2rem 0;
-                text-align: left;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="success-container">
-            <div class="success-icon">✅</div>
-            <h1>Payment Successful!</h1>
-            <p>Thank you for your order. Your payment has been processed successfully.</p>
-            
-            <div class="order-details">
-                <h3>Order Details</h3>
-                <p><strong>Order ID:</strong> {order_id}</p>
-                <p><strong>Transaction Reference:</strong> {ref_id}</p>
-                <p><strong>Status:</strong> Confirmed</p>
-                <p>We will deliver your order within the selected timeframe.</p>
-            </div>
-            
-            <a href="index.html" class="checkout-btn-full">Continue Shopping</a>
-        </div>
-    </body>
-    </html>
-    """
-    return html
+    return page_response('payment_success.html',
+                         order_id=request.args.get('order_id', ''),
+                         reference=request.args.get('transaction_code') or request.args.get('ref_id', ''))
 
 @app.route('/payment-failed.html')
 def failure_page():
     """Payment failure page"""
-    reason = request.args.get('reason', 'unknown')
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Payment Failed - Thapa Kirana</title>
-        <link rel="stylesheet" href="style.css">
-        <style>
-            .failure-container {{
-                max-width: 600px;
-                margin: 100px auto;
-                text-align: center;
-                padding: 2rem;
-                background: white;
-                border-radius: 12px;
-                box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-            }}
-            .failure-icon {{
-                font-size: 4rem;
-                color: #ef4444;
-                margin-bottom: 1rem;
-            }}
-            .failure-reason {{
-                background: #fee2e2;
-                color: #991b1b;
-                padding: 1rem;
-                border-radius: 8px;
-                margin: 1rem 0;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="failure-container">
-            <div class="failure-icon">❌</div>
-            <h1>Payment Failed</h1>
-            <p>We're sorry, but your payment could not be processed.</p>
-            
-            <div class="failure-reason">
-                <strong>Reason:</strong> {reason.replace('_', ' ').title()}
-            </div>
-            
-            <p>Please try again or contact our support if the problem persists.</p>
-            
-            <div style="margin-top: 2rem;">
-                <a href="/cart" class="checkout-btn-full" style="margin-right: 1rem;">Try Again</a>
-                <a href="/" class="continue-shopping-link">Continue Shopping</a>
-            </div>
-        </div>
-    </body>
-    </html>
+    return page_response('payment_failed.html',
+                         reason=request.args.get('reason', 'unknown'),
+                         transaction_uuid=request.args.get('transaction_uuid', ''))
+
+def warm_up() -> Dict[str, float]:
+    """
+    Prime this process's caches before it takes traffic
+    
+    Compiles every template, primes the catalog indexes, delivery quotes
+    and promotion tables, and renders the cached pages. Run by the
+    gunicorn hooks in gunicorn.conf.py: once in the master with
+    preload_app (workers inherit the result), otherwise in each worker.
+    
+    Returns:
+        Seconds spent per step
     """
-    return html
+    def pages():
+        for path, view in (('/', index), ('/cart', cart), ('/login', login)):
+            with app.test_request_context(path):
+                view()
+    
+    def delivery_quotes():
+        for district, district_config in delivery_pricer.districts.items():
+            for area in [None, *district_config.get('areas', {})]:
+                for speed in delivery_pricer.speed_adjustments:
+                    delivery_pricer.quote(district, area, speed)
+    
+    steps = (
+        ('templates', lambda: [app.jinja_env.get_template(name) for name in app.jinja_env.list_templates()]),
+        ('catalog', lambda: [catalog.query([category], limit=PRODUCT_PAGE_SIZE) for category in catalog.categories]),
+        ('delivery', delivery_quotes),
+        ('promotions', promotion_engine.active_automatic),
+        ('pages', pages)
+    )
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            log.warning(f"Warm-up step {name} failed: {str(e)}")
+        timings[name] = round(time.perf_counter() - started, 4)
+    return timings
 
 if __name__ == '__main__':
-    # Development server
+    # Development server (production: python serve.py)
     port = int(os.getenv('PORT', 5005))
     app.run(debug=True, host='0.0.0.0', port=port)
@@ -0,0 +1,301 @@
+"""
+ASGI entry point (async serving mode)
+
+    gunicorn asgi:application -c gunicorn.conf.py      # SERVER_MODE=async
+    uvicorn asgi:application --workers 4
+
+The routes that wait on the eSewa gateway (/api/esewa/status and
+/api/payment/verify/<transaction_uuid>) run as coroutines on the event
+loop with a pooled AsyncEsewaClient. A request waiting on eSewa then costs
+a coroutine instead of a worker thread, so one process can have hundreds
+of them in flight. The support chat long-poll and SSE routes wait on the
+SupportHub the same way, so thousands of idle chat clients hold no
+threads. Their store calls are short local SQLite operations and run in
+the default thread pool. Every other route is the regular Flask app,
+served from a thread pool of ASGI_THREADS threads per process by a2wsgi's
+WSGIMiddleware.
+
+Requires the optional `httpx`, `a2wsgi` and `uvicorn` packages.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from typing import Dict, Any, Optional, Tuple, List, Callable, Awaitable, AsyncIterator, Union
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.wrappers import Request
+
+import logging_setup
+from app import (app, log, esewa, esewa_client, store, rate_limiter, settle_verification, support_hub,
+                 customer_messages, support_message_event, STATUS_WAIT_MAX_TIMEOUT, STATUS_STREAM_TIMEOUT,
+                 STATUS_STREAM_HEARTBEAT, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT, RATE_LIMITED,
+                 TRUSTED_PROXY_COUNT)
+from esewa_client import AsyncEsewaClient, EsewaUnavailable, EsewaResponseError
+
+# (status, JSON payload) or (status, server-sent event chunks)
+Result = Tuple[int, Union[Dict[str, Any], AsyncIterator[str]]]
+
+_async_client: Optional[AsyncEsewaClient] = None
+
+
+def async_esewa_client() -> AsyncEsewaClient:
+    """The process's async eSewa client, created on first use inside the event loop"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncEsewaClient(
+            esewa.verification_url,
+            connect_timeout=esewa_client.connect_timeout,
+            read_timeout=esewa_client.read_timeout,
+            max_retries=esewa_client.max_retries,
+            retry_budget=esewa_client.retry_budget,
+            pool_size=int(os.getenv('ESEWA_ASYNC_POOL_SIZE', 100)),
+            # One breaker per process, whichever client trips it
+            breaker=esewa_client.breaker
+        )
+    return _async_client
+
+
+async def esewa_status_check(scope: Dict[str, Any], params: Dict[str, str]) -> Result:
+    """Async twin of app.esewa_status_check"""
+    product_code = params.get('product_code')
+    total_amount = params.get('total_amount')
+    transaction_uuid = params.get('transaction_uuid')
+
+    if not all([product_code, total_amount, transaction_uuid]):
+        return 400, {'error': 'Missing required parameters'}
+
+    try:
+        return 200, await async_esewa_client().check_status(product_code, total_amount, transaction_uuid)
+    except EsewaResponseError as e:
+        return e.status_code, e.payload or {'code': 0, 'error_message': 'Invalid request'}
+    except EsewaUnavailable as e:
+        log.error(f"eSewa status check failed: {str(e)}")
+        return 503, {'code': 0, 'error_message': 'Service is currently unavailable'}
+
+
+async def verify_transaction(scope: Dict[str, Any], params: Dict[str, str], transaction_uuid: str) -> Result:
+    """Async twin of app.verify_transaction"""
+    transaction = await asyncio.to_thread(store.get_transaction, transaction_uuid)
+    if transaction is None:
+        return 404, {'error': 'Transaction not found'}
+    if transaction['status'] != 'PENDING':
+        return 200, {'success': True, 'verified': False, 'transaction': transaction}
+
+    try:
+        response = await async_esewa_client().check_status(
+            esewa.merchant_code, str(transaction['total_amount']), transaction_uuid
+        )
+    except EsewaResponseError as e:
+        log.warning(f"eSewa rejected verification of {transaction_uuid}: {str(e)}")
+        return 502, {'error': 'eSewa rejected the status check'}
+    except EsewaUnavailable as e:
+        log.error(f"Payment verification failed: {str(e)}")
+        return 503, {'error': 'Verification service unavailable'}
+
+    return 200, await asyncio.to_thread(settle_verification, transaction, response)
+
+
+def session_customer(scope: Dict[str, Any]) -> Optional[str]:
+    """customer_id from the Flask session cookie, or None for a client without a session"""
+    cookie = _header(scope, b'cookie')
+    if not cookie:
+        return None
+    session = app.session_interface.open_session(app, Request({'HTTP_COOKIE': cookie}))
+    return (session or {}).get('customer_id')
+
+
+def support_params(params: Dict[str, str], scope: Dict[str, Any]) -> int:
+    """The `after` id as in app.support_after (query param, else Last-Event-ID)"""
+    after = int(params.get('after') or _header(scope, b'last-event-id') or 0)
+    if after < 0:
+        raise ValueError('after')
+    return after
+
+
+async def support_messages_wait(scope: Dict[str, Any], params: Dict[str, str]) -> Result:
+    """Async twin of app.support_messages_wait"""
+    try:
+        after = support_params(params, scope)
+        timeout = max(min(float(params.get('timeout', 25)), STATUS_WAIT_MAX_TIMEOUT), 0)
+    except ValueError:
+        return 400, {'error': 'Invalid after or timeout'}
+
+    conversation_id = session_customer(scope)
+    if conversation_id is None:
+        # No session yet means no messages; sleeping keeps a client in a poll loop from spinning
+        await asyncio.sleep(timeout)
+        return 200, {'success': True, 'messages': []}
+    messages = await support_hub.wait_async(conversation_id, after, timeout)
+    return 200, {'success': True, 'messages': customer_messages(messages)}
+
+
+async def support_messages_stream(scope: Dict[str, Any], params: Dict[str, str]) -> Result:
+    """Async twin of app.support_messages_stream"""
+    try:
+        after = support_params(params, scope)
+    except ValueError:
+        return 400, {'error': 'Invalid after'}
+    conversation_id = session_customer(scope)
+
+    async def events() -> AsyncIterator[str]:
+        last_id = after
+        deadline = time.monotonic() + STATUS_STREAM_TIMEOUT
+        yield 'retry: 3000\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            wait = min(STATUS_STREAM_HEARTBEAT, remaining)
+            if conversation_id is None:
+                await asyncio.sleep(wait)
+                messages = []
+            else:
+                messages = await support_hub.wait_async(conversation_id, last_id, wait)
+            if not messages:
+                yield ': keep-alive\n\n'
+                continue
+            for message in customer_messages(messages):
+                yield support_message_event(message)
+            last_id = messages[-1]['id']
+
+    return 200, events()
+
+
+# (method, path pattern, handler, Flask rule for metrics, rate limit group or None)
+ROUTES: List[Tuple[str, re.Pattern, Callable[..., Awaitable[Result]], str, Optional[str]]] = [
+    ('GET', re.compile(r'^/api/esewa/status$'), esewa_status_check,
+     '/api/esewa/status', 'esewa_status'),
+    ('POST', re.compile(r'^/api/payment/verify/(?P<transaction_uuid>[^/]+)$'), verify_transaction,
+     '/api/payment/verify/<transaction_uuid>', 'esewa_status'),
+    ('GET', re.compile(r'^/api/support/messages/wait$'), support_messages_wait,
+     '/api/support/messages/wait', None),
+    ('GET', re.compile(r'^/api/support/messages/stream$'), support_messages_stream,
+     '/api/support/messages/stream', None),
+]
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    for key, value in scope.get('headers') or ():
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _client_address(scope: Dict[str, Any]) -> str:
+    """The client address the Flask routes see: ProxyFix's pick from X-Forwarded-For"""
+    if TRUSTED_PROXY_COUNT > 0:
+        forwarded = ','.join(value.decode('latin-1') for key, value in scope.get('headers') or ()
+                             if key.lower() == b'x-forwarded-for')
+        hops = [hop.strip() for hop in forwarded.split(',')] if forwarded else []
+        # The entry appended by the outermost trusted proxy; fewer entries than
+        # trusted proxies means the header is not to be believed
+        if len(hops) >= TRUSTED_PROXY_COUNT and hops[-TRUSTED_PROXY_COUNT]:
+            return hops[-TRUSTED_PROXY_COUNT]
+    return (scope.get('client') or ('unknown', 0))[0]
+
+
+async def _send_json(send, status: int, payload: Dict[str, Any], headers: List[Tuple[bytes, bytes]]) -> None:
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())] + headers
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_events(receive, send, chunks: AsyncIterator[str], headers: List[Tuple[bytes, bytes]]) -> None:
+    # Stream until the generator ends or the client disconnects, whichever is first
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')] + headers
+    })
+
+    async def pump() -> None:
+        async for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+
+    async def disconnected() -> None:
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    streaming = asyncio.ensure_future(pump())
+    watching = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait((streaming, watching), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (streaming, watching):
+            task.cancel()
+        await asyncio.gather(streaming, watching, return_exceptions=True)
+        await chunks.aclose()
+    if streaming.done() and not streaming.cancelled() and streaming.exception() is None:
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _serve(scope, receive, send, handler, rule: str, group: Optional[str], path_params: Dict[str, str]) -> None:
+    # Same request id, rate limiting and metrics as the Flask hooks
+    request_id = (_header(scope, b'x-request-id') or uuid.uuid4().hex[:16])[:64]
+    logging_setup.clear_context(request_id=request_id)
+    headers = [(b'x-request-id', request_id.encode('latin-1'))]
+    started = time.perf_counter()
+    status = 500
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+    try:
+        client = _client_address(scope)
+        decision = {'allowed': True} if group is None else await asyncio.to_thread(rate_limiter.check, group, client)
+        if not decision['allowed']:
+            RATE_LIMITED.inc(group)
+            status = 429
+            headers.append((b'retry-after', str(decision['retry_after']).encode()))
+            await _send_json(send, status, {'error': 'Too many requests, please try again later'}, headers)
+            return
+
+        params = {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        try:
+            status, payload = await handler(scope, params, **path_params)
+        except Exception as e:
+            log.error(f"{rule} failed: {str(e)}")
+            status, payload = 500, {'error': 'Request failed'}
+        if isinstance(payload, dict):
+            await _send_json(send, status, payload, headers)
+        else:
+            await _send_events(receive, send, payload, headers)
+    finally:
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, scope['method'], rule, str(status))
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _async_client is not None:
+                await _async_client.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+_wsgi = WSGIMiddleware(app, workers=int(os.getenv('ASGI_THREADS', 16)))
+
+
+async def application(scope, receive, send) -> None:
+    """ASGI callable: async eSewa and support chat routes, everything else through Flask"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] == 'http':
+        for method, pattern, handler, rule, group in ROUTES:
+            match = pattern.match(scope['path'])
+            if match and scope['method'] == method:
+                await _serve(scope, receive, send, handler, rule, group, match.groupdict())
+                return
+    await _wsgi(scope, receive, send)
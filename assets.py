@@ -0,0 +1,175 @@
+"""
+Static asset pipeline
+
+`flask --app app assets build` copies everything under static/ to a build
+directory under content-hashed names (style.css -> style.3f2a1b4c9d.css).
+It pre-compresses text assets to .gz/.br and renders resized WebP/JPEG
+thumbnails of product images. A manifest maps logical paths to the
+built files. The app serves /assets/* with `Cache-Control: immutable` and
+picks the smallest pre-compressed variant the client accepts. Templates
+resolve URLs through asset_url()/thumbnail(); without a build they fall
+back to the plain /static files.
+
+Thumbnails need Pillow and .br files need Brotli; both are only imported
+by the build step.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Any, Optional, Sequence
+
+log = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+# Worth pre-compressing; images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = frozenset({'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'})
+THUMBNAIL_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png'})
+MIN_COMPRESS_SIZE = 256
+
+
+def _hashed_name(relative_path: str, digest: str, suffix: str = '') -> str:
+    stem, ext = os.path.splitext(relative_path)
+    return f"{stem}.{digest}{suffix}{ext}"
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _precompress(path: str, data: bytes) -> None:
+    """Write path.gz and, if Brotli is installed, path.br next to path"""
+    _write(f"{path}.gz", gzip.compress(data, compresslevel=9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        return
+    _write(f"{path}.br", brotli.compress(data, quality=11))
+
+
+def _thumbnails(source_path: str, relative_path: str, digest: str, output_dir: str,
+                widths: Sequence[int], webp_quality: int, jpeg_quality: int) -> Dict[str, Dict[str, str]]:
+    """Resized WebP for every width plus a JPEG at the smallest width"""
+    from PIL import Image
+
+    variants: Dict[str, Dict[str, str]] = {'webp': {}, 'jpg': {}}
+    with Image.open(source_path) as original:
+        image = original.convert('RGB')
+    for width in sorted(widths):
+        # Never upscale; small originals are just re-encoded
+        target = min(width, image.width)
+        resized = image if target == image.width else image.resize(
+            (target, max(1, round(image.height * target / image.width))), Image.LANCZOS
+        )
+        webp_name = os.path.splitext(_hashed_name(relative_path, digest, f".w{width}"))[0] + '.webp'
+        os.makedirs(os.path.dirname(os.path.join(output_dir, webp_name)), exist_ok=True)
+        resized.save(os.path.join(output_dir, webp_name), 'WEBP', quality=webp_quality, method=6)
+        variants['webp'][str(width)] = webp_name
+        if width == min(widths):
+            jpg_name = os.path.splitext(_hashed_name(relative_path, digest, f".w{width}"))[0] + '.jpg'
+            resized.save(os.path.join(output_dir, jpg_name), 'JPEG', quality=jpeg_quality,
+                         optimize=True, progressive=True)
+            variants['jpg'][str(width)] = jpg_name
+    return variants
+
+
+def build(static_dir: str, output_dir: str, thumbnail_widths: Sequence[int] = (320, 640),
+          thumbnail_prefix: str = 'images/', webp_quality: int = 75, jpeg_quality: int = 80) -> Dict[str, Any]:
+    """
+    Build fingerprinted, pre-compressed assets and thumbnails
+
+    Args:
+        static_dir: Source directory (the app's static folder)
+        output_dir: Build directory; replaced on every build
+        thumbnail_widths: Thumbnail widths in pixels
+        thumbnail_prefix: Only images under this static/ sub-path get thumbnails
+        webp_quality: WebP quality (0-100)
+        jpeg_quality: JPEG fallback quality (0-100)
+
+    Returns:
+        The manifest, also written to output_dir/manifest.json
+    """
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+
+    manifest: Dict[str, Any] = {'files': {}, 'thumbnails': {}}
+    for root, _, filenames in os.walk(static_dir):
+        for filename in sorted(filenames):
+            source_path = os.path.join(root, filename)
+            relative_path = os.path.relpath(source_path, static_dir).replace(os.sep, '/')
+            with open(source_path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:10]
+
+            built_name = _hashed_name(relative_path, digest)
+            built_path = os.path.join(output_dir, built_name)
+            _write(built_path, data)
+            manifest['files'][relative_path] = built_name
+
+            ext = os.path.splitext(filename)[1].lower()
+            if ext in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_SIZE:
+                _precompress(built_path, data)
+            if ext in THUMBNAIL_EXTENSIONS and relative_path.startswith(thumbnail_prefix):
+                manifest['thumbnails'][relative_path] = _thumbnails(
+                    source_path, relative_path, digest, output_dir,
+                    thumbnail_widths, webp_quality, jpeg_quality
+                )
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    log.info(f"Built {len(manifest['files'])} assets and {len(manifest['thumbnails'])} thumbnails")
+    return manifest
+
+
+class AssetManifest:
+    """Resolves logical static paths to built asset URLs"""
+
+    def __init__(self, manifest: Optional[Dict[str, Any]] = None, url_prefix: str = '/assets/',
+                 fallback_prefix: str = '/static/'):
+        manifest = manifest or {}
+        self.files: Dict[str, str] = manifest.get('files', {})
+        self.thumbnails: Dict[str, Dict[str, Dict[str, str]]] = manifest.get('thumbnails', {})
+        self.url_prefix = url_prefix
+        self.fallback_prefix = fallback_prefix
+
+    @classmethod
+    def load(cls, output_dir: str, **kwargs) -> 'AssetManifest':
+        """Load output_dir/manifest.json; an empty manifest (plain /static URLs) if not built"""
+        path = os.path.join(output_dir, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return cls(None, **kwargs)
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f), **kwargs)
+
+    @property
+    def built(self) -> bool:
+        return bool(self.files)
+
+    def url(self, path: str) -> str:
+        """URL of a static file, fingerprinted if it was built"""
+        built = self.files.get(path)
+        return self.url_prefix + built if built else self.fallback_prefix + path
+
+    def thumbnail(self, path: str) -> Dict[str, Any]:
+        """
+        Image URLs for a product card
+
+        Returns:
+            {'src': JPEG (or original) URL, 'srcset': WebP srcset or ''}
+        """
+        variants = self.thumbnails.get(path)
+        if not variants:
+            return {'src': self.url(path), 'srcset': ''}
+        jpg = next(iter(variants['jpg'].values()))
+        return {
+            'src': self.url_prefix + jpg,
+            'srcset': ', '.join(f"{self.url_prefix}{name} {width}w" for width, name in
+                                sorted(variants['webp'].items(), key=lambda item: int(item[0])))
+        }
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Load test for the checkout and callback hot paths
+
+Drives /api/payment/initiate, /payment/success (validly signed base64
+callbacks), /api/payment/status/<uuid> and /api/orders at one or more
+concurrency levels and reports p50/p95/p99 latency and requests per
+second as JSON. eSewa is replaced by benchmarks/esewa_stub.py and the app
+runs against a throwaway SQLite database.
+
+Targets:
+    testclient  Flask's test client, in process (default)
+    gunicorn    a local gunicorn started for the run (--workers)
+    url         an already running server (--url)
+
+Usage:
+    python benchmarks/bench_checkout.py --concurrency 1,8,32 --requests 500
+    python benchmarks/bench_checkout.py --target gunicorn --workers 4 --output bench.json
+    python benchmarks/bench_checkout.py --baseline bench.json --max-regression 20
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from esewa_stub import start_stub, status_url  # noqa: E402
+from signing import HmacSigner  # noqa: E402
+
+TEST_SECRET_KEY = "8gBm/:&EnhH.1/q"
+TEST_PRODUCT_CODE = 'EPAYTEST'
+PRODUCT_IDS = list(range(1, 13))
+DISTRICTS = ['kathmandu', 'lalitpur', 'bhaktapur']
+SCENARIOS = ('initiate', 'success', 'status', 'orders')
+
+# send(method, path, json_body, headers) -> HTTP status code
+Send = Callable[[str, str, Optional[Dict[str, Any]], Optional[Dict[str, str]]], int]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class TestClientTarget:
+    """In-process target using Flask's test client (one client per thread)"""
+
+    name = 'testclient'
+
+    def __init__(self):
+        import app as app_module
+        app_module.app.logger.setLevel('WARNING')
+        self.app = app_module.app
+
+    def session(self) -> Send:
+        client = self.app.test_client()
+
+        def send(method, path, body=None, headers=None):
+            return client.open(path, method=method, json=body, headers=headers).status_code
+        return send
+
+    def post_json(self, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        response = self.app.test_client().post(path, json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"POST {path} returned {response.status_code}")
+        return response.get_json()
+
+    def close(self):
+        pass
+
+
+class HttpTarget:
+    """Target reachable over HTTP (one requests.Session per thread)"""
+
+    name = 'url'
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+
+    def session(self) -> Send:
+        import requests
+        http = requests.Session()
+
+        def send(method, path, body=None, headers=None):
+            return http.request(method, self.base_url + path, json=body, headers=headers,
+                                allow_redirects=False, timeout=30).status_code
+        return send
+
+    def post_json(self, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        import requests
+        response = requests.post(self.base_url + path, json=body, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        pass
+
+
+class GunicornTarget(HttpTarget):
+    """Local gunicorn serving app:app for the duration of the run"""
+
+    name = 'gunicorn'
+
+    def __init__(self, workers: int, threads: int):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        super().__init__(f"http://127.0.0.1:{port}")
+
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--chdir', ROOT, '-b', f"127.0.0.1:{port}",
+             '-w', str(workers), '--threads', str(threads), '--log-level', 'warning', 'app:app'],
+            env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self._wait_until_ready()
+
+    def _wait_until_ready(self, timeout: float = 30):
+        import requests
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {self.process.returncode}")
+            try:
+                requests.get(self.base_url + '/api/delivery/areas', timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.close()
+        raise RuntimeError('gunicorn did not start in time')
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def checkout_body(rng: random.Random) -> Dict[str, Any]:
+    return {
+        'cart': [{'id': product_id, 'qty': rng.randint(1, 3)}
+                 for product_id in rng.sample(PRODUCT_IDS, rng.randint(1, 4))],
+        'location': {'district': rng.choice(DISTRICTS)},
+        'delivery_speed': rng.choice(['express', 'standard', 'scheduled']),
+        'promo_code': rng.choice(['', '', 'THAPA10', 'FLAT50'])
+    }
+
+
+def signed_callback(signer: HmacSigner, transaction_uuid: str, total_amount: Any) -> str:
+    """Base64 success callback payload signed the way eSewa signs it"""
+    response = {
+        'transaction_code': f"BENCH{uuid.uuid4().hex[:6].upper()}",
+        'status': 'COMPLETE',
+        'total_amount': str(total_amount),
+        'transaction_uuid': transaction_uuid,
+        'product_code': TEST_PRODUCT_CODE,
+        'signed_field_names': 'transaction_code,status,total_amount,transaction_uuid,product_code,signed_field_names'
+    }
+    response['signature'] = signer.sign_fields(response, response['signed_field_names'].split(','))
+    return base64.b64encode(json.dumps(response).encode('utf-8')).decode('ascii')
+
+
+def create_seed_payments(target, count: int, rng: random.Random) -> List[Tuple[str, Any]]:
+    """Create count pending payments; returns (transaction_uuid, total_amount) pairs"""
+    seeded = []
+    for _ in range(count):
+        payload = target.post_json('/api/payment/initiate', checkout_body(rng))
+        seeded.append((payload['transaction_uuid'], payload['esewa_data']['total_amount']))
+    return seeded
+
+
+def build_requests(scenario: str, count: int, seeded: List[Tuple[str, Any]],
+                   signer: HmacSigner, rng: random.Random):
+    """Pre-build (method, path, body, headers, expected statuses) so generation is not timed"""
+    built = []
+    for i in range(count):
+        if scenario == 'initiate':
+            built.append(('POST', '/api/payment/initiate', checkout_body(rng),
+                          {'Idempotency-Key': uuid.uuid4().hex}, (200,)))
+        elif scenario == 'success':
+            transaction_uuid, total_amount = seeded[i % len(seeded)]
+            data = signed_callback(signer, transaction_uuid, total_amount)
+            built.append(('GET', f"/payment/success?data={quote(data)}", None, None, (302,)))
+        elif scenario == 'status':
+            built.append(('GET', f"/api/payment/status/{seeded[i % len(seeded)][0]}", None, None, (200,)))
+        elif scenario == 'orders':
+            built.append(('GET', '/api/orders?limit=50', None, None, (200,)))
+    return built
+
+
+def run_scenario(target, scenario: str, concurrency: int, planned: list) -> Dict[str, Any]:
+    """Send planned requests from concurrency threads; the first concurrency requests are warm-up"""
+    local = threading.local()
+
+    def one(item):
+        if not hasattr(local, 'send'):
+            local.send = target.session()
+        method, path, body, headers, expected = item
+        started = time.perf_counter()
+        try:
+            ok = local.send(method, path, body, headers) in expected
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Warm up connections and per-thread clients outside the measurement
+        list(pool.map(one, planned[:concurrency]))
+        started = time.perf_counter()
+        outcomes = list(pool.map(one, planned[concurrency:]))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _ in outcomes)
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': len(outcomes),
+        'errors': sum(1 for _, ok in outcomes if not ok),
+        'rps': round(len(outcomes) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'max': round(latencies[-1], 3)
+        }
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, max_regression: float) -> List[str]:
+    """Return descriptions of results more than max_regression percent worse than the baseline"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['scenario'], r['concurrency']): r for r in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        before = baseline.get((result['scenario'], result['concurrency']))
+        if before is None:
+            continue
+        label = f"{result['scenario']}@{result['concurrency']}"
+        if result['latency_ms']['p95'] > before['latency_ms']['p95'] * (1 + max_regression / 100):
+            regressions.append(f"{label} p95 {before['latency_ms']['p95']} -> {result['latency_ms']['p95']} ms")
+        if result['rps'] < before['rps'] * (1 - max_regression / 100):
+            regressions.append(f"{label} rps {before['rps']} -> {result['rps']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', choices=('testclient', 'gunicorn', 'url'), default='testclient')
+    parser.add_argument('--url', help='Base URL for --target url')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated client thread counts')
+    parser.add_argument('--requests', type=int, default=300, help='Requests per scenario and concurrency')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--seed-orders', type=int, default=200, help='Payments created before measuring')
+    parser.add_argument('--stub-latency-ms', type=float, default=0, help='Artificial eSewa latency')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='Previous JSON report to compare against')
+    parser.add_argument('--max-regression', type=float, default=20, help='Allowed p95/rps regression in percent')
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.target == 'url' and not args.url:
+        parser.error('--target url needs --url')
+
+    stub = start_stub(latency_ms=args.stub_latency_ms)
+    workdir = tempfile.mkdtemp(prefix='thapa-bench-')
+    if args.target != 'url':
+        os.environ.update({
+            'ESEWA_ENV': 'test',
+            'ESEWA_STATUS_URL': status_url(stub),
+            'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            'RECONCILE_INTERVAL': '0'
+        })
+
+    if args.target == 'testclient':
+        target = TestClientTarget()
+    elif args.target == 'gunicorn':
+        target = GunicornTarget(args.workers, args.threads)
+    else:
+        target = HttpTarget(args.url)
+
+    rng = random.Random(42)
+    signer = HmacSigner(TEST_SECRET_KEY)
+    try:
+        seeded = create_seed_payments(target, args.seed_orders, rng)
+        results = []
+        for scenario in scenarios:
+            for concurrency in (int(value) for value in args.concurrency.split(',')):
+                planned = build_requests(scenario, args.requests + concurrency, seeded, signer, rng)
+                result = run_scenario(target, scenario, concurrency, planned)
+                results.append(result)
+                print(f"{scenario:<10} c={concurrency:<4} {result['rps']:>9,.1f} req/s  "
+                      f"p50 {result['latency_ms']['p50']:>8.2f}  p95 {result['latency_ms']['p95']:>8.2f}  "
+                      f"p99 {result['latency_ms']['p99']:>8.2f} ms  errors {result['errors']}", file=sys.stderr)
+    finally:
+        target.close()
+        stub.shutdown()
+
+    report = {
+        'target': target.name,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    failed = sum(result['errors'] for result in results)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+    if failed:
+        print(f"{failed} requests failed", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
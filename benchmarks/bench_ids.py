@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: order/transaction ID generation and collision check
+
+Measures IDs per second for the old uuid4-based IDs and for ids.new_id,
+then generates --count IDs from several threads and several forked
+processes at once and verifies that they are all distinct and that every
+thread's IDs are strictly increasing.
+
+Usage:
+    python benchmarks/bench_ids.py [--count 2000000] [--threads 4] [--processes 4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ids import new_id  # noqa: E402
+
+
+def old_transaction_uuid() -> str:
+    """Transaction UUID as create_payment_order built it before ids.py"""
+    return f"THAPA-{datetime.now().strftime('%y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
+
+
+def rate(label: str, count: int, fn) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    per_second = count / (time.perf_counter() - started)
+    print(f"{label:<28} {per_second:>12,.0f} IDs/s")
+    return per_second
+
+
+def generate(count: int, threads: int) -> list:
+    """count IDs from threads threads; raises if a thread's IDs are not strictly increasing"""
+    batches = [[] for _ in range(threads)]
+
+    def worker(batch: list) -> None:
+        for _ in range(count // threads):
+            batch.append(new_id())
+        if any(a >= b for a, b in zip(batch, batch[1:])):
+            raise AssertionError('IDs of one thread are not increasing')
+
+    workers = [threading.Thread(target=worker, args=(batch,)) for batch in batches]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return [value for batch in batches for value in batch]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=2000000, help='IDs generated for the collision check')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args()
+
+    before = rate('uuid4 THAPA-yymmdd-xxxxxx', 200000, old_transaction_uuid)
+    after = rate('ids.new_id', 200000, lambda: new_id('THAPA-'))
+    print(f"speedup: {after / before:.2f}x")
+
+    # Forked workers, like gunicorn's, each with several threads
+    per_process = args.count // args.processes
+    started = time.perf_counter()
+    with multiprocessing.get_context('fork').Pool(args.processes) as pool:
+        results = pool.starmap(generate, [(per_process, args.threads)] * args.processes)
+    elapsed = time.perf_counter() - started
+
+    ids = [value for result in results for value in result]
+    distinct = len(set(ids))
+    print(f"generated {len(ids):,} IDs in {elapsed:.2f}s across {args.processes} processes x "
+          f"{args.threads} threads: {len(ids) - distinct} collisions")
+    sys.exit(0 if distinct == len(ids) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: eSewa signatures per second
+
+Compares the original per-call hmac.new() signing with the pre-keyed
+HmacSigner (single and batch API).
+
+Usage:
+    python benchmarks/bench_signing.py [--count 200000]
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from signing import HmacSigner  # noqa: E402
+
+SECRET_KEY = "8gBm/:&EnhH.1/q"
+
+
+def sign_from_scratch(message: str) -> str:
+    """Signing as PaymentService did before HmacSigner"""
+    signature = hmac.new(SECRET_KEY.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).digest()
+    return base64.b64encode(signature).decode('utf-8')
+
+
+def rate(label: str, count: int, fn) -> float:
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    per_second = count / elapsed
+    print(f"{label:<28} {per_second:>12,.0f} signatures/s")
+    return per_second
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=200000)
+    args = parser.parse_args()
+
+    messages = [
+        f"total_amount={100 + i % 900},transaction_uuid=THAPA-{i:012d},product_code=EPAYTEST"
+        for i in range(args.count)
+    ]
+    signer = HmacSigner(SECRET_KEY)
+    assert signer.sign(messages[0]) == sign_from_scratch(messages[0])
+
+    before = rate('hmac.new per call', args.count, lambda: [sign_from_scratch(m) for m in messages])
+    after = rate('HmacSigner.sign', args.count, lambda: [signer.sign(m) for m in messages])
+    batch = rate('HmacSigner.sign_many', args.count, lambda: signer.sign_many(messages))
+    print(f"speedup: {after / before:.2f}x single, {batch / before:.2f}x batch")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Stub eSewa transaction status API for benchmarks and local runs
+
+Answers GET /api/epay/transaction/status/ with a COMPLETE status for any
+transaction, after an optional artificial latency. Point the app at it
+with ESEWA_STATUS_URL.
+
+Usage:
+    python benchmarks/esewa_stub.py [--port 9090] [--latency-ms 20]
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+STATUS_PATH = '/api/epay/transaction/status/'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    status = 'COMPLETE'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != STATUS_PATH.rstrip('/'):
+            self.send_error(404)
+            return
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = json.dumps({
+            'product_code': query.get('product_code'),
+            'transaction_uuid': query.get('transaction_uuid'),
+            'total_amount': query.get('total_amount'),
+            'status': self.status,
+            'ref_id': f"STUB{abs(hash(query.get('transaction_uuid'))) % 10 ** 8:08d}"
+        }).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port: int = 0, latency_ms: float = 0, status: str = 'COMPLETE') -> ThreadingHTTPServer:
+    """
+    Start the stub on a daemon thread
+
+    Returns:
+        The running server; its status URL is status_url(server)
+    """
+    handler = type('Handler', (StubHandler,), {'latency': latency_ms / 1000, 'status': status})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='esewa-stub', daemon=True).start()
+    return server
+
+
+def status_url(server: ThreadingHTTPServer) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}{STATUS_PATH}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=9090)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--status', default='COMPLETE')
+    args = parser.parse_args()
+
+    server = start_stub(args.port, args.latency_ms, args.status)
+    print(f"eSewa stub listening on {status_url(server)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
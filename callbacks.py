@@ -0,0 +1,133 @@
+"""
+eSewa success callback parsing
+
+eSewa redirects the customer to /payment/success with the payment result
+as base64 JSON in the `data` query parameter. CallbackParser checks it
+cheapest-first. The size limit comes before any decoding, then a
+precompiled field schema, then the HMAC over the fields named in the
+response's own signed_field_names. A malformed or forged callback is
+rejected before it reaches the store. Callbacks already processed are
+remembered by transaction_code in a bounded LRU set, so a customer
+reloading the success page or eSewa repeating the redirect does not
+repeat the store writes.
+"""
+
+import base64
+import binascii
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, FrozenSet
+
+from signing import HmacSigner
+
+# Fields the app acts on; each must also be covered by the signature
+REQUIRED_FIELDS = ('transaction_code', 'status', 'total_amount', 'transaction_uuid', 'product_code')
+
+CALLBACK_STATUSES = frozenset({
+    'COMPLETE', 'PENDING', 'FULL_REFUND', 'PARTIAL_REFUND', 'AMBIGUOUS', 'NOT_FOUND', 'CANCELED'
+})
+
+# Field -> pattern the whole value must match (eSewa may format amounts as '1,000.0')
+FIELD_PATTERNS = {
+    'transaction_code': re.compile(r'[A-Za-z0-9-]{1,64}'),
+    'total_amount': re.compile(r'\d{1,3}(?:,?\d{3})*(?:\.\d{1,2})?'),
+    'transaction_uuid': re.compile(r'[A-Za-z0-9-]{1,64}'),
+    'product_code': re.compile(r'[A-Za-z0-9_-]{1,64}'),
+    'signed_field_names': re.compile(r'[a-z_]{1,32}(?:,[a-z_]{1,32}){0,15}'),
+    'signature': re.compile(r'[A-Za-z0-9+/]{43}='),
+}
+
+
+class CallbackError(ValueError):
+    """Raised for a callback that must be rejected; reason is the failure page's reason code"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class CallbackParser:
+    """Validates eSewa success callbacks and remembers the ones already processed"""
+
+    def __init__(self, signer: HmacSigner, max_size: int = 4096, seen_size: int = 10000,
+                 required_fields: FrozenSet[str] = frozenset(REQUIRED_FIELDS)):
+        """
+        Args:
+            signer: Signer holding the merchant secret key
+            max_size: Longest accepted `data` value, in characters (before decoding)
+            seen_size: Processed transaction codes remembered (least recently used evicted)
+            required_fields: Fields the signature must cover
+        """
+        self.signer = signer
+        self.max_size = max_size
+        self.seen_size = seen_size
+        self.required_fields = required_fields
+        self._seen: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, encoded: Optional[str]) -> Dict[str, str]:
+        """
+        Decode and verify a callback's `data` parameter
+
+        Returns:
+            The callback fields as strings
+
+        Raises:
+            CallbackError: reason is 'missing_data', 'invalid_response',
+                'missing_params' or 'invalid_signature'
+        """
+        if not encoded:
+            raise CallbackError('missing_data', 'No callback data')
+        if len(encoded) > self.max_size:
+            raise CallbackError('invalid_response', f"Callback data too large ({len(encoded)} characters)")
+
+        try:
+            # '+' may arrive as ' ' when the query string was not encoded
+            payload = json.loads(base64.b64decode(encoded.replace(' ', '+'), validate=True))
+        except (binascii.Error, ValueError) as e:
+            raise CallbackError('invalid_response', f"Undecodable callback data: {e}")
+        if not isinstance(payload, dict):
+            raise CallbackError('invalid_response', 'Callback data is not an object')
+
+        fields: Dict[str, str] = {}
+        for name, value in payload.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(value)
+            if isinstance(value, str):
+                fields[name] = value
+
+        missing = [name for name in REQUIRED_FIELDS + ('signed_field_names', 'signature') if not fields.get(name)]
+        if missing:
+            raise CallbackError('missing_params', f"Callback is missing {', '.join(missing)}")
+        for name, pattern in FIELD_PATTERNS.items():
+            if not pattern.fullmatch(fields[name]):
+                raise CallbackError('invalid_response', f"Malformed callback field {name}")
+        if fields['status'] not in CALLBACK_STATUSES:
+            raise CallbackError('invalid_response', f"Unknown callback status {fields['status']}")
+
+        signed_field_names = fields['signed_field_names'].split(',')
+        if not self.required_fields.issubset(signed_field_names):
+            raise CallbackError('invalid_signature', 'Signature does not cover the payment fields')
+        if any(name not in fields for name in signed_field_names):
+            raise CallbackError('missing_params', 'Callback is missing a signed field')
+        if not self.signer.verify(self.signer.message_for(fields, signed_field_names), fields['signature']):
+            raise CallbackError('invalid_signature', f"Signature mismatch for {fields['transaction_uuid']}")
+        return fields
+
+    def seen(self, transaction_code: str) -> Optional[Dict[str, Any]]:
+        """Outcome remembered for an already processed transaction_code, or None"""
+        with self._lock:
+            outcome = self._seen.get(transaction_code)
+            if outcome is not None:
+                self._seen.move_to_end(transaction_code)
+            return outcome
+
+    def remember(self, transaction_code: str, outcome: Dict[str, Any]) -> None:
+        """Record a processed callback so a replay can skip the store"""
+        with self._lock:
+            self._seen[transaction_code] = outcome
+            self._seen.move_to_end(transaction_code)
+            while len(self._seen) > self.seen_size:
+                self._seen.popitem(last=False)
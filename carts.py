@@ -0,0 +1,163 @@
+"""
+Server-side shopping carts
+
+Each browser session owns one cart, stored as a compact {product_id: qty}
+map in the order store so every gunicorn worker sees the same cart. Names,
+prices and images are never stored; they are filled in from the catalog
+when the cart is read, so checkout always prices from trusted data. Carts
+expire ttl seconds after their last change and expired rows are purged
+periodically.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from catalog import Catalog
+from storage import OrderStore, CartItems
+
+log = logging.getLogger(__name__)
+
+
+class CartError(ValueError):
+    """Raised for unknown products, invalid quantities or an oversized cart"""
+
+
+class CartService:
+    """Cart operations for one store and catalog"""
+
+    def __init__(self, store: OrderStore, catalog: Catalog, ttl: float = 7 * 24 * 3600,
+                 max_lines: int = 100, max_qty: int = 99, purge_interval: float = 3600.0):
+        """
+        Args:
+            store: Backend holding the carts
+            catalog: Catalog used to validate and price cart lines
+            ttl: Seconds a cart survives without changes
+            max_lines: Maximum distinct products per cart
+            max_qty: Maximum quantity per product
+            purge_interval: Minimum seconds between purges of expired carts
+        """
+        self.store = store
+        self.catalog = catalog
+        self.ttl = ttl
+        self.max_lines = max_lines
+        self.max_qty = max_qty
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+
+    def items(self, session_id: str) -> CartItems:
+        """Product id -> quantity for the session's cart"""
+        return self.store.get_cart(session_id, time.time())
+
+    def as_cart(self, session_id: str) -> List[Dict[str, Any]]:
+        """The cart as [{'id', 'qty'}] items, as accepted by Catalog.price_cart"""
+        return [{'id': product_id, 'qty': qty} for product_id, qty in self.items(session_id).items()]
+
+    def lines(self, items: CartItems) -> List[Dict[str, Any]]:
+        """Price a cart from the catalog, skipping products that were removed from it"""
+        return self.catalog.price_cart(
+            [{'id': product_id, 'qty': qty} for product_id, qty in items.items() if self.catalog.get(product_id)]
+        )
+
+    def add(self, session_id: str, product_id: Any, qty: Any = 1) -> CartItems:
+        """Add qty of a product to the cart"""
+        product_id, qty = self._validate(product_id, qty)
+
+        def updater(items: CartItems) -> CartItems:
+            items[product_id] = min(items.get(product_id, 0) + qty, self.max_qty)
+            return items
+
+        return self._update(session_id, updater)
+
+    def set(self, session_id: str, product_id: Any, qty: Any) -> CartItems:
+        """Set a product's quantity; 0 removes it"""
+        if qty == 0:
+            return self.remove(session_id, product_id)
+        product_id, qty = self._validate(product_id, qty)
+
+        def updater(items: CartItems) -> CartItems:
+            items[product_id] = qty
+            return items
+
+        return self._update(session_id, updater)
+
+    def remove(self, session_id: str, product_id: Any) -> CartItems:
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            raise CartError(f"Unknown product: {product_id}")
+
+        def updater(items: CartItems) -> CartItems:
+            items.pop(product_id, None)
+            return items
+
+        return self._update(session_id, updater)
+
+    def merge(self, session_id: str, cart: List[Dict[str, Any]]) -> CartItems:
+        """
+        Fold a client-side (localStorage) cart into the session's cart
+
+        The larger quantity wins for products in both carts, so merging the
+        same browser cart twice does not double it. Unknown products and
+        invalid lines are skipped rather than failing the whole merge.
+        """
+        incoming: CartItems = {}
+        for item in cart or []:
+            try:
+                product_id, qty = self._validate(item.get('id'), item.get('qty', item.get('quantity', 1)))
+            except (CartError, AttributeError):
+                continue
+            incoming[product_id] = max(incoming.get(product_id, 0), qty)
+
+        def updater(items: CartItems) -> CartItems:
+            for product_id, qty in incoming.items():
+                items[product_id] = max(items.get(product_id, 0), qty)
+            return items
+
+        return self._update(session_id, updater)
+
+    def remove_ordered(self, session_id: Optional[str], order_lines: List[Dict[str, Any]]) -> None:
+        """Take the quantities of a paid order out of the cart it was placed from"""
+        if not session_id:
+            return
+        ordered = {int(line['id']): int(line['qty']) for line in order_lines}
+
+        def updater(items: CartItems) -> CartItems:
+            return {product_id: qty - ordered.get(product_id, 0) for product_id, qty in items.items()}
+
+        self.store.update_cart(session_id, updater, time.time() + self.ttl, time.time())
+
+    def _validate(self, product_id: Any, qty: Any) -> Tuple[int, int]:
+        product = self.catalog.get(product_id)
+        if product is None:
+            raise CartError(f"Unknown product: {product_id}")
+        if not isinstance(qty, int) or isinstance(qty, bool) or qty < 1:
+            raise CartError(f"Invalid quantity for product {product['id']}")
+        return product['id'], min(qty, self.max_qty)
+
+    def _update(self, session_id: str, updater) -> CartItems:
+        def bounded(items: CartItems) -> CartItems:
+            items = updater(items)
+            if len(items) > self.max_lines:
+                raise CartError(f"A cart can hold at most {self.max_lines} different products")
+            return items
+
+        now = time.time()
+        items = self.store.update_cart(session_id, bounded, now + self.ttl, now)
+        self._maybe_purge(now)
+        return items
+
+    def _maybe_purge(self, now: float) -> None:
+        if now < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_purge = now + self.purge_interval
+            removed = self.store.purge_carts(now)
+            if removed:
+                log.info(f"Purged {removed} expired carts")
+        except Exception as e:
+            log.warning(f"Cart purge failed: {str(e)}")
+        finally:
+            self._purge_lock.release()
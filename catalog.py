@@ -0,0 +1,148 @@
+"""
+Product catalog for Thapa Kirana Pasal
+
+Loaded once at startup from a JSON or CSV file and indexed in memory:
+a global (price, id) index plus per-category postings in the same order.
+Price/category queries bisect into the relevant postings instead of
+scanning, and checkout prices carts from here rather than trusting
+client-supplied prices.
+"""
+
+import bisect
+import csv
+import heapq
+import json
+import os
+from itertools import islice
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+
+
+class CatalogError(ValueError):
+    """Raised for unknown products or invalid cart lines"""
+
+
+class Catalog:
+    """In-memory, read-only product catalog with price and category indexes"""
+
+    def __init__(self, products: Iterable[Dict[str, Any]]):
+        self.products: Dict[int, Dict[str, Any]] = {}
+        for product in products:
+            product = dict(product)
+            product['id'] = int(product['id'])
+            product['price'] = int(product['price'])
+            self.products[product['id']] = product
+
+        # (price, id) keys, sorted; per-category lists share the same ordering
+        self._price_index: List[Tuple[int, int]] = sorted(
+            (product['price'], product_id) for product_id, product in self.products.items()
+        )
+        self._by_category: Dict[str, List[Tuple[int, int]]] = {}
+        for key in self._price_index:
+            category = self.products[key[1]]['category']
+            self._by_category.setdefault(category, []).append(key)
+
+    @classmethod
+    def load(cls, path: str) -> 'Catalog':
+        """Load a catalog from a .json (list of products) or .csv file"""
+        if os.path.splitext(path)[1].lower() == '.csv':
+            with open(path, newline='', encoding='utf-8') as f:
+                return cls(_product_from_row(row) for row in csv.DictReader(f))
+
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @property
+    def categories(self) -> List[str]:
+        return sorted(self._by_category)
+
+    def get(self, product_id: Any) -> Optional[Dict[str, Any]]:
+        try:
+            return self.products.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    def query(self, categories: Optional[List[str]] = None, min_price: Optional[int] = None,
+              max_price: Optional[int] = None, after: Optional[Tuple[int, int]] = None,
+              limit: int = 24) -> List[Dict[str, Any]]:
+        """
+        Return products ordered by (price, id)
+
+        Args:
+            categories: Only these categories (None or empty for all)
+            min_price: Inclusive lower price bound
+            max_price: Inclusive upper price bound
+            after: (price, id) of the last product of the previous page
+            limit: Maximum number of products
+
+        Returns:
+            List of product dicts
+        """
+        start = (min_price, -1) if min_price is not None else None
+        if after is not None and (start is None or tuple(after) > start):
+            start = tuple(after)
+
+        if categories:
+            postings = [self._by_category.get(category, []) for category in set(categories)]
+        else:
+            postings = [self._price_index]
+
+        def tail(keys):
+            position = bisect.bisect_right(keys, start) if start is not None else 0
+            return islice(keys, position, None)
+
+        merged = tail(postings[0]) if len(postings) == 1 else heapq.merge(*(tail(keys) for keys in postings))
+
+        results = []
+        for price, product_id in merged:
+            if max_price is not None and price > max_price:
+                break
+            results.append(self.products[product_id])
+            if len(results) >= limit:
+                break
+        return results
+
+    def price_cart(self, cart: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Build trusted cart lines from client cart items
+
+        Only the id and quantity of each item are used; name, price and image
+        come from the catalog.
+
+        Raises:
+            CatalogError: Unknown product id or invalid quantity
+        """
+        lines = []
+        for item in cart:
+            product = self.get(item.get('id'))
+            if product is None:
+                raise CatalogError(f"Unknown product: {item.get('id')}")
+
+            qty = item.get('qty', item.get('quantity', 1))
+            if not isinstance(qty, int) or isinstance(qty, bool) or qty < 1:
+                raise CatalogError(f"Invalid quantity for product {product['id']}")
+
+            lines.append({
+                'id': product['id'],
+                'name': product['name'],
+                'price': product['price'],
+                'category': product['category'],
+                'qty': qty,
+                'image': product.get('image')
+            })
+        return lines
+
+
+def _product_from_row(row: Dict[str, str]) -> Dict[str, Any]:
+    product: Dict[str, Any] = {
+        'id': int(row['id']),
+        'name': row['name'],
+        'price': int(row['price']),
+        'category': row['category'],
+        'image': row.get('image') or None,
+        'rating': float(row['rating']) if row.get('rating') else None
+    }
+    if row.get('original_price'):
+        product['original_price'] = int(row['original_price'])
+    if row.get('badge_label'):
+        product['badge'] = {'style': row.get('badge_style') or 'hot', 'label': row['badge_label']}
+    return product
@@ -0,0 +1,103 @@
+"""
+HTTP response compression
+
+Compresses buffered text responses (HTML, JSON, CSS, JS, ...) above a
+size threshold with brotli when the optional `brotli` package is
+installed and the client accepts it, and gzip otherwise. Streamed
+responses (SSE, NDJSON exports) and files served by send_file are left
+alone. Compressed bodies of responses that carry an ETag are cached by
+(ETag, encoding), so a burst of identical pages is compressed once.
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = frozenset({
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson', 'image/svg+xml'
+})
+
+
+class Compressor:
+    """Negotiates Content-Encoding and compresses eligible responses"""
+
+    def __init__(self, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5,
+                 cache_size: int = 256):
+        """
+        Args:
+            min_size: Smallest body (bytes) worth compressing
+            gzip_level: gzip compression level (1-9)
+            brotli_quality: brotli quality (0-11)
+            cache_size: Compressed bodies kept per (ETag, encoding)
+        """
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[Tuple[str, str], bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def encodings(self) -> Tuple[str, ...]:
+        """Supported encodings, most preferred first"""
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def choose_encoding(self, accept_encoding) -> Optional[str]:
+        """Pick the best supported encoding from a parsed Accept-Encoding header"""
+        for encoding in self.encodings:
+            if accept_encoding[encoding] > 0:
+                return encoding
+        return None
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        # mtime=0 keeps the output deterministic, so equal pages give equal bodies
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def _cached_compress(self, etag: Optional[str], data: bytes, encoding: str) -> bytes:
+        if etag is None:
+            return self.compress(data, encoding)
+
+        key = (etag, encoding)
+        with self._lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+                return body
+
+        body = self.compress(data, encoding)
+        with self._lock:
+            self._cache[key] = body
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return body
+
+    def process(self, request, response):
+        """after_request hook: compress the response in place if it is eligible"""
+        response.vary.add('Accept-Encoding')
+
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or request.method == 'HEAD' or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        etag, _ = response.get_etag()
+        response.set_data(self._cached_compress(etag, data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,164 @@
+"""
+Delivery pricing engine
+
+Rates are loaded from a JSON config (see data/delivery_zones.json):
+per-district base rates with optional per-area overrides, speed
+adjustments, and service-zone polygons for pricing map-picked
+coordinates. Zone polygons are bucketed into a fixed lat/lng grid at load
+time, so a coordinate lookup only runs point-in-polygon tests against the
+few zones overlapping its cell. Quotes are memoized.
+"""
+
+import json
+import math
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Tuple
+
+# District used when a map location falls outside every service zone
+CUSTOM_DISTRICT = 'custom'
+
+
+class DeliveryPricingError(ValueError):
+    """Raised for unknown delivery speeds or malformed coordinates"""
+
+
+def valid_point(lat: float, lng: float) -> bool:
+    """True for a finite latitude/longitude within the globe's bounds (NaN and inf fail)"""
+    return math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180
+
+
+def point_in_polygon(lat: float, lng: float, polygon: List[Tuple[float, float]]) -> bool:
+    """Ray-casting test; polygon is a list of (lat, lng) vertices"""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lng_i = polygon[i]
+        lat_j, lng_j = polygon[j]
+        if (lng_i > lng) != (lng_j > lng):
+            crossing = lat_i + (lng - lng_i) * (lat_j - lat_i) / (lng_j - lng_i)
+            if lat < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+
+class DeliveryPricer:
+    """Prices deliveries by district/area or by map coordinates"""
+
+    def __init__(self, config: Dict[str, Any], cache_size: int = 4096):
+        self.default_rate = config.get('default_rate', 50)
+        self.minimum_charge = config.get('minimum_charge', 0)
+        self.speed_adjustments: Dict[str, int] = config.get('speed_adjustments', {'standard': 0})
+        self.districts: Dict[str, Dict[str, Any]] = config.get('districts', {})
+        self.cell = float(config.get('grid_cell_degrees', 0.01))
+
+        self.zones = []
+        for zone in config.get('zones', []):
+            polygon = [tuple(map(float, vertex)) for vertex in zone['polygon']]
+            lats = [vertex[0] for vertex in polygon]
+            lngs = [vertex[1] for vertex in polygon]
+            self.zones.append({
+                'name': zone['name'],
+                'district': zone['district'],
+                'area': zone.get('area'),
+                'polygon': polygon,
+                'bbox': (min(lats), min(lngs), max(lats), max(lngs))
+            })
+
+        # Grid cell -> indexes of zones whose bounding box overlaps it.
+        # Zones keep config order, so earlier zones win where they overlap.
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        for index, zone in enumerate(self.zones):
+            min_lat, min_lng, max_lat, max_lng = zone['bbox']
+            for row in range(self._cell_of(min_lat), self._cell_of(max_lat) + 1):
+                for col in range(self._cell_of(min_lng), self._cell_of(max_lng) + 1):
+                    self._grid.setdefault((row, col), []).append(index)
+
+        self._cached_quote = lru_cache(maxsize=cache_size)(self._quote)
+
+    @classmethod
+    def load(cls, path: str) -> 'DeliveryPricer':
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _cell_of(self, degrees: float) -> int:
+        return math.floor(degrees / self.cell)
+
+    def zone_for(self, lat: float, lng: float) -> Optional[Dict[str, Any]]:
+        """Return the first service zone containing the point, or None"""
+        if not valid_point(lat, lng):
+            return None
+        for index in self._grid.get((self._cell_of(lat), self._cell_of(lng)), ()):
+            zone = self.zones[index]
+            if point_in_polygon(lat, lng, zone['polygon']):
+                return zone
+        return None
+
+    def areas(self) -> Dict[str, List[Dict[str, str]]]:
+        """Selectable areas per district, for the location picker"""
+        return {
+            district: [{'value': value, 'label': area.get('label', value)}
+                       for value, area in config.get('areas', {}).items()]
+            for district, config in self.districts.items() if config.get('areas')
+        }
+
+    def quote(self, district: Optional[str] = None, area: Optional[str] = None,
+              speed: str = 'standard', coordinates: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Price a delivery
+
+        Coordinates, when given, take precedence over the district/area the
+        customer picked.
+
+        Args:
+            district: District key (e.g. 'kathmandu')
+            area: Area key within the district (e.g. 'koteshwor')
+            speed: Delivery speed key from speed_adjustments
+            coordinates: {'lat': ..., 'lng': ...} picked on the map
+
+        Returns:
+            Quote dict with charge, district, area, zone and speed
+
+        Raises:
+            DeliveryPricingError: Unknown speed, invalid coordinates or a
+                district/area/speed that is not a string
+        """
+        # They come from client JSON and key the memo cache, so a list or dict must not get that far
+        for name, value in (('district', district), ('area', area), ('speed', speed)):
+            if value is not None and not isinstance(value, str):
+                raise DeliveryPricingError(f"Invalid {name}")
+        point = None
+        if coordinates:
+            try:
+                # ~11 m precision keeps the memo cache effective for map clicks
+                point = (round(float(coordinates['lat']), 4), round(float(coordinates['lng']), 4))
+            except (KeyError, TypeError, ValueError, OverflowError):
+                raise DeliveryPricingError('Invalid coordinates')
+            if not valid_point(*point):
+                raise DeliveryPricingError('Invalid coordinates')
+        return dict(self._cached_quote(district, area, speed, point))
+
+    def _quote(self, district: Optional[str], area: Optional[str], speed: str,
+               point: Optional[Tuple[float, float]]) -> Dict[str, Any]:
+        if speed not in self.speed_adjustments:
+            raise DeliveryPricingError(f"Unknown delivery speed: {speed}")
+
+        zone_name = None
+        if point is not None:
+            zone = self.zone_for(*point)
+            if zone is not None:
+                district, area, zone_name = zone['district'], zone['area'], zone['name']
+            else:
+                district, area = CUSTOM_DISTRICT, None
+
+        district_config = self.districts.get(district or '', {})
+        area_config = district_config.get('areas', {}).get(area or '', {})
+        rate = area_config.get('rate', district_config.get('rate', self.default_rate))
+
+        return {
+            'charge': max(self.minimum_charge, rate + self.speed_adjustments[speed]),
+            'district': district,
+            'area': area,
+            'zone': zone_name,
+            'speed': speed
+        }
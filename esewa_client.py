@@ -0,0 +1,400 @@
+"""
+eSewa transaction status client
+
+Shared, pooled HTTP client for the eSewa status API. Every call has strict
+connect/read timeouts, a bounded number of retries with jittered backoff
+and sits behind a circuit breaker, so a slow or failing gateway can never
+pin all workers. AsyncEsewaClient is the asyncio twin used by the ASGI
+entry point (asgi.py); it needs the optional `httpx` package.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+try:
+    import httpx
+except ImportError:  # optional dependency, only needed for AsyncEsewaClient
+    httpx = None
+
+log = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying; anything else is returned to the caller
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+STATUS_CHECK_SECONDS = metrics.histogram(
+    'esewa_status_check_seconds', 'eSewa status API call latency including retries', ('outcome',)
+)
+STATUS_CHECK_RETRIES = metrics.counter('esewa_status_check_retries_total', 'eSewa status API retries')
+
+
+class EsewaUnavailable(Exception):
+    """eSewa could not be reached within the timeout/retry budget"""
+
+
+class CircuitOpenError(EsewaUnavailable):
+    """Calls are short-circuited because eSewa has been failing"""
+
+
+class EsewaResponseError(Exception):
+    """eSewa answered with a non-retryable error (e.g. 400 for bad parameters)"""
+
+    def __init__(self, status_code: int, payload: Dict[str, Any]):
+        super().__init__(f"eSewa returned HTTP {status_code}")
+        self.status_code = status_code
+        self.payload = payload
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    CLOSED lets every call through. After failure_threshold consecutive
+    failures it turns OPEN and rejects calls for reset_timeout seconds,
+    then goes HALF_OPEN and lets a single trial call decide whether to
+    close again or re-open.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        # The lock may have been held by another thread of the parent; a trial in
+        # flight there never finishes here
+        self._lock = threading.Lock()
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def acquire(self) -> Optional[str]:
+        """
+        Ask to attempt a call now
+
+        Returns:
+            'call' (closed), 'trial' (the single half-open trial, which must
+            end in record_success, record_failure or release) or None if the
+            call is rejected
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return 'call'
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return None
+                self._state = self.HALF_OPEN
+            if self._trial_in_flight:
+                return None
+            self._trial_in_flight = True
+            return 'trial'
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted now"""
+        return self.acquire() is not None
+
+    def release(self) -> None:
+        """End a trial that finished without a verdict (cancelled or an unexpected error)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class _StatusClientBase:
+    """Retry, backoff and response handling shared by the sync and async clients"""
+
+    def __init__(self, status_url: str, connect_timeout: float = 3.05, read_timeout: float = 10.0,
+                 max_retries: int = 2, backoff_base: float = 0.2, backoff_max: float = 2.0,
+                 retry_budget: float = 15.0, breaker: Optional[CircuitBreaker] = None):
+        self.status_url = status_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget = retry_budget
+        self.breaker = breaker or CircuitBreaker()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _start(self) -> bool:
+        """Pass the breaker; True if this call is its half-open trial"""
+        permit = self.breaker.acquire()
+        if permit is None:
+            raise CircuitOpenError('eSewa status API circuit is open')
+        return permit == 'trial'
+
+    @staticmethod
+    def _params(product_code: str, total_amount: str, transaction_uuid: str) -> Dict[str, str]:
+        return {
+            'product_code': product_code,
+            'total_amount': total_amount,
+            'transaction_uuid': transaction_uuid
+        }
+
+    def _handle(self, status_code: int, decode) -> Optional[Dict[str, Any]]:
+        """The decoded answer, None if status_code is worth retrying"""
+        if status_code in RETRYABLE_STATUS_CODES:
+            return None
+        try:
+            payload = decode()
+        except ValueError:
+            payload = {}
+        # Any well-formed answer means the gateway is healthy
+        self.breaker.record_success()
+        if status_code != 200:
+            raise EsewaResponseError(status_code, payload)
+        return payload
+
+    def _next_delay(self, attempt: int, deadline: float, transaction_uuid: str,
+                    last_error: Optional[str]) -> Optional[float]:
+        """Backoff before the next attempt, or None when retries are exhausted"""
+        delay = self._backoff(attempt)
+        if attempt == self.max_retries or time.monotonic() + delay >= deadline:
+            return None
+        log.warning(f"eSewa status check for {transaction_uuid} failed ({last_error}), retrying")
+        STATUS_CHECK_RETRIES.inc()
+        return delay
+
+    def _give_up(self, last_error: Optional[str]) -> EsewaUnavailable:
+        self.breaker.record_failure()
+        return EsewaUnavailable(f"eSewa status check failed: {last_error}")
+
+
+def _observe(started: float, error: Optional[BaseException]) -> None:
+    if error is None:
+        outcome = 'ok'
+    elif isinstance(error, CircuitOpenError):
+        outcome = 'circuit_open'
+    elif isinstance(error, EsewaResponseError):
+        outcome = 'rejected'
+    else:
+        outcome = 'unavailable'
+    STATUS_CHECK_SECONDS.observe(time.perf_counter() - started, outcome)
+
+
+class EsewaClient(_StatusClientBase):
+    """Client for the eSewa transaction status API"""
+
+    def __init__(self, status_url: str, connect_timeout: float = 3.05, read_timeout: float = 10.0,
+                 max_retries: int = 2, backoff_base: float = 0.2, backoff_max: float = 2.0,
+                 retry_budget: float = 15.0, pool_size: int = 20,
+                 breaker: Optional[CircuitBreaker] = None,
+                 session: Optional[requests.Session] = None):
+        """
+        Args:
+            status_url: eSewa transaction status endpoint
+            connect_timeout: Seconds allowed to establish a connection
+            read_timeout: Seconds allowed between bytes of the response
+            max_retries: Extra attempts after the first one
+            backoff_base: Base delay for exponential backoff (full jitter)
+            backoff_max: Upper bound for a single backoff delay
+            retry_budget: Total seconds a single call may spend including retries
+            pool_size: Keep-alive connections kept per host
+            breaker: Circuit breaker shared by all calls
+            session: Pre-configured requests session (mainly for tests)
+        """
+        super().__init__(status_url, connect_timeout, read_timeout, max_retries,
+                         backoff_base, backoff_max, retry_budget, breaker)
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+
+        self._owns_session = session is None
+        self.session = self._new_session() if session is None else session
+        if self._owns_session and hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        # Retries are handled here so they respect the backoff and budget
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'Accept': 'application/json'})
+        return session
+
+    def _after_fork(self) -> None:
+        # Pooled sockets (and the pool's locks) opened by the parent, e.g. by a
+        # preloaded master's scheduler, must not be shared with a forked worker.
+        # The inherited session is dropped, not closed, so the parent's sockets stay open
+        self.session = self._new_session()
+
+    def check_status(self, product_code: str, total_amount: str, transaction_uuid: str) -> Dict[str, Any]:
+        """
+        Query eSewa for the status of a transaction
+
+        Args:
+            product_code: Merchant/product code used in the payment
+            total_amount: Total amount that was signed
+            transaction_uuid: Transaction UUID to check
+
+        Returns:
+            Decoded eSewa response, e.g. {'status': 'COMPLETE', 'ref_id': ...}
+
+        Raises:
+            CircuitOpenError: The breaker is open
+            EsewaUnavailable: Timeouts/5xx exhausted the retry budget
+            EsewaResponseError: eSewa rejected the request
+        """
+        started = time.perf_counter()
+        error = None
+        try:
+            trial = self._start()
+            try:
+                return self._check_status(product_code, total_amount, transaction_uuid)
+            except (EsewaUnavailable, EsewaResponseError):
+                raise
+            except BaseException:
+                # No verdict on eSewa's health: free the trial so the breaker can't stay stuck
+                if trial:
+                    self.breaker.release()
+                raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _observe(started, error)
+
+    def _check_status(self, product_code: str, total_amount: str, transaction_uuid: str) -> Dict[str, Any]:
+        params = self._params(product_code, total_amount, transaction_uuid)
+        deadline = time.monotonic() + self.retry_budget
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(self.status_url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                last_error = str(e)
+            else:
+                payload = self._handle(response.status_code, response.json)
+                if payload is not None:
+                    return payload
+                last_error = f"HTTP {response.status_code}"
+
+            delay = self._next_delay(attempt, deadline, transaction_uuid, last_error)
+            if delay is None:
+                break
+            time.sleep(delay)
+
+        raise self._give_up(last_error)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncEsewaClient(_StatusClientBase):
+    """
+    asyncio client for the eSewa status API
+
+    Same timeouts, retries, metrics and circuit breaker semantics as
+    EsewaClient (pass the same breaker to share its state), but a call
+    waiting on the gateway holds no thread, so one event loop can wait on
+    hundreds of them over a pooled httpx.AsyncClient.
+    """
+
+    def __init__(self, status_url: str, connect_timeout: float = 3.05, read_timeout: float = 10.0,
+                 max_retries: int = 2, backoff_base: float = 0.2, backoff_max: float = 2.0,
+                 retry_budget: float = 15.0, pool_size: int = 100,
+                 breaker: Optional[CircuitBreaker] = None, client: Optional['httpx.AsyncClient'] = None):
+        """
+        Args:
+            pool_size: Maximum open connections to eSewa
+            client: Pre-configured httpx.AsyncClient (mainly for tests)
+            Others as for EsewaClient
+        """
+        super().__init__(status_url, connect_timeout, read_timeout, max_retries,
+                         backoff_base, backoff_max, retry_budget, breaker)
+        if client is None:
+            if httpx is None:
+                raise RuntimeError('AsyncEsewaClient requires the httpx package')
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                headers={'Accept': 'application/json'}
+            )
+        self.client = client
+
+    async def check_status(self, product_code: str, total_amount: str, transaction_uuid: str) -> Dict[str, Any]:
+        """Query eSewa for the status of a transaction; see EsewaClient.check_status"""
+        started = time.perf_counter()
+        error = None
+        try:
+            trial = self._start()
+            try:
+                return await self._check_status(product_code, total_amount, transaction_uuid)
+            except (EsewaUnavailable, EsewaResponseError):
+                raise
+            except BaseException:
+                # Includes asyncio.CancelledError when the client disconnects mid-trial
+                if trial:
+                    self.breaker.release()
+                raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _observe(started, error)
+
+    async def _check_status(self, product_code: str, total_amount: str, transaction_uuid: str) -> Dict[str, Any]:
+        params = self._params(product_code, total_amount, transaction_uuid)
+        deadline = time.monotonic() + self.retry_budget
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.get(self.status_url, params=params)
+            except httpx.HTTPError as e:
+                last_error = str(e)
+            else:
+                payload = self._handle(response.status_code, response.json)
+                if payload is not None:
+                    return payload
+                last_error = f"HTTP {response.status_code}"
+
+            delay = self._next_delay(attempt, deadline, transaction_uuid, last_error)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+        raise self._give_up(last_error)
+
+    async def close(self) -> None:
+        await self.client.aclose()
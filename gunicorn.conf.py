@@ -0,0 +1,111 @@
+"""
+Recommended gunicorn settings for Thapa Kirana Pasal
+
+    gunicorn app:app -c gunicorn.conf.py                        # sync mode (default)
+    SERVER_MODE=async gunicorn asgi:application -c gunicorn.conf.py
+
+sync: gthread workers; each in-flight request (including one waiting on
+eSewa or holding an SSE stream) occupies one of THREADS threads.
+async: uvicorn workers; eSewa status/verification calls are coroutines,
+so a worker keeps hundreds of them waiting on the gateway, and the rest of
+the Flask app runs in a thread pool of ASGI_THREADS threads.
+
+The app is preloaded in the master and warmed up there (templates,
+pricing and page caches), so forked workers, including ones recycled by
+max_requests, start warm instead of paying for imports on their first
+requests. Each boot logs a startup report with import and warm-up times.
+A RECONCILE_INTERVAL scheduler is started in one worker, not the master.
+`python serve.py` starts gunicorn with this file.
+
+All values can be overridden with the environment variables below or on
+the command line.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+
+# Read by gunicorn before it imports the app
+_BOOT_STARTED = time.perf_counter()
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'sync').lower()
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', 5005)}")
+
+CORES = multiprocessing.cpu_count()
+
+if SERVER_MODE == 'async':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # One event loop per core
+    workers = int(os.getenv('WEB_CONCURRENCY', CORES))
+    # Threads for the Flask (WSGI) routes inside each async worker (read by asgi.py)
+    os.environ.setdefault('ASGI_THREADS', os.getenv('THREADS', '16'))
+else:
+    worker_class = 'gthread'
+    # I/O-bound app: a couple of workers per core; more only costs memory
+    workers = int(os.getenv('WEB_CONCURRENCY', CORES * 2 + 1))
+    threads = int(os.getenv('THREADS', 8))
+
+# eSewa calls are bounded by ESEWA_RETRY_BUDGET; SSE streams send a heartbeat
+# every 15s, so a worker silent for longer than this is really stuck
+timeout = int(os.getenv('WORKER_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('KEEPALIVE', 5))
+
+# Recycle workers now and then so slow leaks cannot accumulate
+max_requests = int(os.getenv('MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('MAX_REQUESTS_JITTER', 1000))
+
+accesslog = os.getenv('ACCESS_LOG') or None
+errorlog = '-'
+
+# Import and warm the app once in the master; workers are forked from it
+preload_app = os.getenv('PRELOAD_APP', 'true').lower() != 'false'
+
+# The RECONCILE_INTERVAL scheduler runs in exactly one worker (see pre_fork),
+# never in the master, whose connections and threads workers would inherit
+os.environ['RECONCILE_ON_IMPORT'] = 'false'
+
+
+def _log_startup(log, where: str, booted_at: float) -> None:
+    import serve
+    try:
+        log.info(f"Startup report ({where}): {json.dumps(serve.startup_report(booted_at))}")
+    except Exception as e:
+        log.warning(f"Warm-up failed ({where}): {e}")
+
+
+def when_ready(server):
+    # Runs in the master before the first worker is forked
+    if preload_app:
+        _log_startup(server.log, 'master', _BOOT_STARTED)
+
+
+def pre_fork(server, worker):
+    # Runs in the master; a worker that exits is dropped from server.WORKERS,
+    # so its replacement takes the scheduler over
+    worker.runs_reconciler = not any(getattr(w, 'runs_reconciler', False) for w in server.WORKERS.values())
+
+
+def post_fork(server, worker):
+    worker.booted_at = time.perf_counter()
+
+
+def child_exit(server, worker):
+    # Runs in the master: keep the exited worker's counters, drop its METRICS_DIR file
+    if os.getenv('METRICS_DIR'):
+        import metrics
+        try:
+            metrics.retire_process(os.getenv('METRICS_DIR'), worker.pid)
+        except OSError as e:
+            server.log.warning(f"Could not retire metrics of worker {worker.pid}: {e}")
+
+
+def post_worker_init(worker):
+    if not preload_app:
+        _log_startup(worker.log, f"worker {worker.pid}", worker.booted_at)
+    if worker.runs_reconciler:
+        import app
+        if app.start_reconcile_scheduler():
+            worker.log.info(f"Reconcile scheduler running in worker {worker.pid}")
@@ -0,0 +1,218 @@
+"""
+Idempotency support for payment initiation
+
+Duplicate /api/payment/initiate calls (double clicks, client retries)
+replay the response of the first call instead of creating another order,
+transaction UUID and signature. Keys and responses are kept in the order
+store, so a retry that lands on another gunicorn worker is replayed too:
+the first call claims the key there, and duplicates in other workers poll
+it until the response is stored. Each worker also keeps the responses it
+has seen in a bounded TTL cache with LRU eviction, and concurrent
+duplicates within one worker wait on the first call directly. A key is
+bound to a fingerprint of the request body; reusing it for a different
+body is refused rather than answered with another order's response.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from storage import OrderStore
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 120.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class IdempotencyCache:
+    """Replays stored responses for repeated idempotency keys"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 120.0, wait_timeout: float = 10.0,
+                 store: Optional[OrderStore] = None, lease: float = 30.0, poll_interval: float = 0.05,
+                 purge_interval: float = 60.0):
+        """
+        Args:
+            maxsize: Maximum responses remembered by this process (least recently used evicted first)
+            ttl: Seconds a response is replayed for
+            wait_timeout: Seconds a duplicate waits for an in-flight first call
+            store: Shared store for keys and responses (None: this process only)
+            lease: Seconds a claimed key stays reserved if its owner dies before answering
+            poll_interval: Seconds between store checks while another worker holds the key
+            purge_interval: Minimum seconds between purges of expired keys from the store
+        """
+        self.responses = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.store = store
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._in_flight: Dict[str, Tuple[threading.Event, Optional[str]]] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: str, compute: Callable[[], Tuple[Dict[str, Any], int]],
+            fingerprint: Optional[str] = None) -> Tuple[Dict[str, Any], int, bool]:
+        """
+        Return the stored response for key, or compute and store it
+
+        Only successful (2xx) responses are stored, so a failed attempt can
+        be retried with the same key. A key already used with another
+        fingerprint gets a 422 response.
+
+        Returns:
+            (payload, status_code, replayed)
+        """
+        while True:
+            cached = self.responses.get(key)
+            if cached is not None:
+                return self._replay(cached, fingerprint)
+
+            with self._lock:
+                flight = self._in_flight.get(key)
+                if flight is None:
+                    # Re-check under the lock: the previous owner stores its
+                    # response before leaving _in_flight
+                    cached = self.responses.get(key)
+                    if cached is not None:
+                        return self._replay(cached, fingerprint)
+                    event = threading.Event()
+                    self._in_flight[key] = (event, fingerprint)
+                    owner = True
+                else:
+                    event, owner_fingerprint = flight
+                    owner = False
+
+            if owner:
+                break
+            if owner_fingerprint != fingerprint:
+                return self._mismatch()
+            if not event.wait(self.wait_timeout):
+                return self._in_progress()
+            if self.responses.get(key) is None:
+                # First call failed; let this one try
+                continue
+
+        try:
+            if self.store is not None:
+                state, stored = self._claim(key, fingerprint)
+                if state == 'done':
+                    self.responses.set(key, (stored[0], stored[1], fingerprint))
+                    return stored[0], stored[1], True
+                if state == 'mismatch':
+                    return self._mismatch()
+                if state != 'claimed':
+                    return self._in_progress()
+            try:
+                payload, status_code = compute()
+            except BaseException:
+                self._release(key)
+                raise
+            if 200 <= status_code < 300:
+                self.responses.set(key, (payload, status_code, fingerprint))
+                if self.store is not None:
+                    self.store.complete_idempotency_key(key, payload, status_code, time.time() + self.ttl,
+                                                        fingerprint)
+            else:
+                self._release(key)
+            return payload, status_code, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            event.set()
+
+    @classmethod
+    def _replay(cls, cached: Tuple[Dict[str, Any], int, Optional[str]],
+                fingerprint: Optional[str]) -> Tuple[Dict[str, Any], int, bool]:
+        if cached[2] != fingerprint:
+            return cls._mismatch()
+        return cached[0], cached[1], True
+
+    @staticmethod
+    def _in_progress() -> Tuple[Dict[str, Any], int, bool]:
+        return {'error': 'A request with this idempotency key is still in progress'}, 409, False
+
+    @staticmethod
+    def _mismatch() -> Tuple[Dict[str, Any], int, bool]:
+        return {'error': 'This idempotency key was already used with a different request'}, 422, False
+
+    def _claim(self, key: str, fingerprint: Optional[str]) -> Tuple[str, Optional[Tuple[Dict[str, Any], int]]]:
+        """The store's claim state for key, polling while another worker holds it ('pending' on timeout)"""
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            now = time.time()
+            if now >= self._next_purge:
+                self._next_purge = now + self.purge_interval
+                self.store.purge_idempotency_keys(now)
+            state, stored = self.store.claim_idempotency_key(key, now, now + self.lease, fingerprint)
+            if state != 'pending':
+                return state, stored
+            # Another worker is creating this order
+            if time.monotonic() + self.poll_interval > deadline:
+                return state, None
+            time.sleep(self.poll_interval)
+
+    def _release(self, key: str) -> None:
+        if self.store is not None:
+            self.store.release_idempotency_key(key)
+
+
+def request_fingerprint(data: Dict[str, Any]) -> str:
+    """
+    Derive a stable key from the parts of a checkout request that define the order
+
+    Cart order, display-only fields (names, images) and whitespace/case in
+    the promo code do not change the key. Coordinates count at the delivery
+    quote cache's precision (4 decimal places).
+    """
+    location = data.get('location') or {}
+    coordinates = location.get('coordinates')
+    try:
+        point = [round(float(coordinates['lat']), 4), round(float(coordinates['lng']), 4)] if coordinates else None
+    except (KeyError, TypeError, ValueError, OverflowError):
+        point = str(coordinates)  # rejected by the pricer; still part of the request
+    cart = sorted(
+        (str(item.get('id')), str(item.get('qty', item.get('quantity', 1))), str(item.get('price')))
+        for item in data.get('cart') or []
+    )
+    canonical = {
+        'cart': cart,
+        'district': location.get('district'),
+        'area': location.get('area'),
+        'coordinates': point,
+        'delivery_speed': data.get('delivery_speed', 'standard'),
+        'promo_code': (data.get('promo_code') or '').strip().upper()
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
@@ -0,0 +1,98 @@
+"""
+Time-ordered unique IDs for orders and transactions
+
+IDs follow the ULID layout: a 48-bit millisecond timestamp followed by 80
+random bits, written as 26 Crockford base32 characters (0-9 and A-Z
+without I, L, O, U). They fit eSewa's alphanumeric-and-hyphen
+transaction_uuid rule and sort by creation time as plain strings, so new
+rows land at the end of the order/transaction indexes instead of at
+random pages. Within one millisecond a process increments the previous
+random part instead of drawing a new one, so its IDs are strictly
+increasing even under a coarse or stepped-back clock. Different threads
+share that state under a lock, and forked workers start over from fresh
+randomness, so 80 random bits separate the IDs of concurrent processes.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+ENCODING = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ID_LENGTH = 26
+
+_RANDOM_BITS = 80
+_RANDOM_MAX = (1 << _RANDOM_BITS) - 1
+_TIMESTAMP_MAX = (1 << 48) - 1
+_DECODING = {char: value for value, char in enumerate(ENCODING)}
+# Two characters per 10 bits: 13 lookups instead of 26 divisions per ID
+_PAIRS = [high + low for high in ENCODING for low in ENCODING]
+_SHIFTS = tuple(range(120, -1, -10))
+
+
+def _encode(value: int) -> str:
+    return ''.join([_PAIRS[(value >> shift) & 0x3FF] for shift in _SHIFTS])
+
+
+class IdGenerator:
+    """Monotonic ULID-style ID source, safe to share between threads and forked workers"""
+
+    def __init__(self, clock: Callable[[], int] = time.time_ns, randbytes: Callable[[int], bytes] = os.urandom):
+        """
+        Args:
+            clock: Nanoseconds since the epoch (injectable for tests)
+            randbytes: Source of random bytes
+        """
+        self.clock = clock
+        self.randbytes = randbytes
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        # In a forked child the parent's last value must not be continued
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def new(self) -> str:
+        """A new 26-character ID, greater than every ID this process made before"""
+        now_ms = self.clock() // 1_000_000
+        with self._lock:
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._last_random = int.from_bytes(self.randbytes(10), 'big')
+            elif self._last_random < _RANDOM_MAX:
+                # Same millisecond (or the clock went back): keep the order by counting up
+                self._last_random += 1
+            else:
+                self._last_ms += 1
+                self._last_random = int.from_bytes(self.randbytes(10), 'big') >> 1
+            if self._last_ms > _TIMESTAMP_MAX:
+                raise OverflowError('ID timestamp out of range')
+            return _encode((self._last_ms << _RANDOM_BITS) | self._last_random)
+
+
+def timestamp_of(value: str) -> datetime:
+    """
+    Creation time encoded in an ID (the last ID_LENGTH characters of value)
+
+    Raises:
+        ValueError: Not an ID made by IdGenerator
+    """
+    encoded = value[-ID_LENGTH:].upper()
+    if len(encoded) != ID_LENGTH or any(char not in _DECODING for char in encoded):
+        raise ValueError(f"Not a time-ordered ID: {value}")
+    milliseconds = 0
+    for char in encoded[:10]:
+        milliseconds = milliseconds * 32 + _DECODING[char]
+    return datetime.fromtimestamp(milliseconds / 1000, tz=timezone.utc)
+
+
+_default = IdGenerator()
+
+
+def new_id(prefix: str = '') -> str:
+    """A new time-ordered ID from the process-wide generator, e.g. new_id('ORD')"""
+    return prefix + _default.new()
@@ -0,0 +1,311 @@
+"""
+Append-only payment event journal
+
+Every payment state transition (initiated, callback_received, verified,
+failed) is appended as one JSON line to this process's segment file in
+the journal directory. A writer thread batches pending appends and fsyncs
+once per batch (group commit). Callers wait until their event is durable
+but share the fsync with everyone else who appended meanwhile.
+
+From time to time the journal is folded into a compact snapshot
+(transaction_uuid -> latest status) that also records how far each
+segment was read. Replay loads the newest snapshot and reads only what
+was appended after it, so recovery time depends on the events since the
+last snapshot, not on the whole history. Every worker writes its own
+segment, so replay merges the segments by event time, and an event older
+than a transaction's last applied one never overwrites it. Segments are
+never rewritten and remain the audit trail.
+"""
+
+import heapq
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List, Tuple
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; snapshots are then unguarded
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+EVENT_TYPES = frozenset({'initiated', 'callback_received', 'verified', 'failed'})
+
+SEGMENT_PREFIX = 'events-'
+SNAPSHOT_PREFIX = 'snapshot-'
+SNAPSHOTS_KEPT = 2
+
+JOURNAL_EVENTS = metrics.counter('journal_events_total', 'Payment events appended to the journal', ('type',))
+JOURNAL_BATCH_SECONDS = metrics.histogram(
+    'journal_batch_write_seconds', 'Time to write and fsync one batch of journal events'
+)
+
+
+def _event_time(event: Dict[str, Any]) -> str:
+    # ts is always UTC isoformat, so strings sort chronologically
+    return event['ts']
+
+
+class JournalError(Exception):
+    """Raised for invalid events or an unusable journal directory"""
+
+
+class EventJournal:
+    """Group-committed, append-only event log with snapshots"""
+
+    def __init__(self, directory: str, batch_size: int = 512, snapshot_every: int = 10000,
+                 durable: bool = True, append_timeout: float = 5.0):
+        """
+        Args:
+            directory: Journal directory (segments and snapshots)
+            batch_size: Maximum events written per fsync
+            snapshot_every: Take a snapshot after this many events written by
+                this process (0 disables automatic snapshots)
+            durable: fsync every batch; False only flushes to the OS (tests)
+            append_timeout: Seconds append waits for its batch to be written
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        self.durable = durable
+        self.append_timeout = append_timeout
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        # Also runs in forked workers: each process gets its own queue, writer and segment
+        self._lock = threading.Lock()
+        self._queue: 'queue.Queue[Tuple[Optional[bytes], Optional[threading.Event]]]' = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._segment = None
+        self._since_snapshot = 0
+
+    def append(self, event_type: str, transaction_uuid: str, wait: bool = True, **fields: Any) -> None:
+        """
+        Append an event
+
+        Args:
+            event_type: One of EVENT_TYPES
+            transaction_uuid: Transaction the event belongs to
+            wait: Block until the event is written (and fsynced if durable)
+            fields: Event details; 'status' is the transaction status after the event
+
+        Raises:
+            JournalError: Unknown event type
+        """
+        if event_type not in EVENT_TYPES:
+            raise JournalError(f"Unknown journal event type: {event_type}")
+        event = {
+            'ts': datetime.now(timezone.utc).isoformat(),
+            'type': event_type,
+            'transaction_uuid': transaction_uuid,
+            **fields
+        }
+        line = (json.dumps(event, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+        done = threading.Event() if wait else None
+
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name='journal-writer', daemon=True)
+                self._writer.start()
+            self._queue.put((line, done))
+        JOURNAL_EVENTS.inc(event_type)
+
+        if done is not None and not done.wait(self.append_timeout):
+            log.warning(f"Journal write for {transaction_uuid} is taking longer than {self.append_timeout}s")
+
+    def close(self) -> None:
+        """Write everything queued so far and stop the writer"""
+        with self._lock:
+            writer = self._writer
+            if writer is None or not writer.is_alive():
+                return
+            self._queue.put((None, None))
+        writer.join()
+
+    def _open_segment(self):
+        # Millisecond timestamp first so segments sort in creation order
+        name = f"{SEGMENT_PREFIX}{int(time.time() * 1000):015d}-{os.getpid()}.jsonl"
+        return open(os.path.join(self.directory, name), 'ab')
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = [line for line, _ in batch if line is not None]
+            if lines:
+                started = time.perf_counter()
+                try:
+                    if self._segment is None:
+                        self._segment = self._open_segment()
+                    self._segment.write(b''.join(lines))
+                    self._segment.flush()
+                    if self.durable:
+                        os.fsync(self._segment.fileno())
+                except OSError as e:
+                    log.error(f"Journal write failed, {len(lines)} events lost: {str(e)}")
+                JOURNAL_BATCH_SECONDS.observe(time.perf_counter() - started)
+
+            for _, done in batch:
+                if done is not None:
+                    done.set()
+
+            if any(line is None for line, _ in batch):
+                if self._segment is not None:
+                    self._segment.close()
+                    self._segment = None
+                return
+
+            self._since_snapshot += len(lines)
+            if self.snapshot_every and self._since_snapshot >= self.snapshot_every:
+                self._since_snapshot = 0
+                # Off the writer thread so appends never wait for a snapshot
+                threading.Thread(target=self._snapshot_quietly, name='journal-snapshot', daemon=True).start()
+
+    def _snapshot_quietly(self) -> None:
+        try:
+            self.snapshot()
+        except Exception as e:
+            log.warning(f"Journal snapshot failed: {str(e)}")
+
+    def _files(self, prefix: str) -> List[str]:
+        return sorted(name for name in os.listdir(self.directory) if name.startswith(prefix))
+
+    def _load_snapshot(self) -> Tuple[Optional[str], Dict[str, Dict[str, Any]], Dict[str, int]]:
+        for name in reversed(self._files(SNAPSHOT_PREFIX)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning(f"Skipping unreadable journal snapshot {name}: {str(e)}")
+                continue
+            transactions = {
+                transaction_uuid: {'status': status, 'order_id': order_id, 'updated_at': updated_at}
+                for transaction_uuid, (status, order_id, updated_at) in snapshot['transactions'].items()
+            }
+            return name, transactions, snapshot['offsets']
+        return None, {}, {}
+
+    @staticmethod
+    def _read_events(path: str, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        # A torn last line (crash mid-write) is left for the next replay
+        complete = data.rfind(b'\n') + 1
+        events = []
+        for line in data[:complete].splitlines():
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                log.warning(f"Skipping corrupt journal line in {os.path.basename(path)}")
+        return events, offset + complete
+
+    @staticmethod
+    def _apply(transactions: Dict[str, Dict[str, Any]], event: Dict[str, Any]) -> None:
+        entry = transactions.setdefault(event['transaction_uuid'],
+                                        {'status': None, 'order_id': None, 'updated_at': None})
+        # A late-read event from another worker's segment must not undo a newer one
+        if entry['updated_at'] is not None and event['ts'] < entry['updated_at']:
+            return
+        if event.get('status'):
+            entry['status'] = event['status']
+        if event.get('order_id'):
+            entry['order_id'] = event['order_id']
+        entry['updated_at'] = event['ts']
+
+    def replay(self) -> Dict[str, Any]:
+        """
+        Rebuild the latest status of every transaction
+
+        Returns:
+            {'transactions': {transaction_uuid: {'status', 'order_id', 'updated_at'}},
+             'offsets': {segment: bytes read}, 'snapshot': snapshot file or None,
+             'events_replayed': events read after the snapshot, 'duration_seconds'}
+        """
+        started = time.perf_counter()
+        snapshot, transactions, offsets = self._load_snapshot()
+        segments = []
+        for segment in self._files(SEGMENT_PREFIX):
+            events, offsets[segment] = self._read_events(os.path.join(self.directory, segment),
+                                                         offsets.get(segment, 0))
+            segments.append(sorted(events, key=_event_time))
+        # Segments of different workers overlap in time: apply their events in ts order
+        replayed = 0
+        for event in heapq.merge(*segments, key=_event_time):
+            self._apply(transactions, event)
+            replayed += 1
+        return {
+            'transactions': transactions,
+            'offsets': offsets,
+            'snapshot': snapshot,
+            'events_replayed': replayed,
+            'duration_seconds': round(time.perf_counter() - started, 3)
+        }
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """
+        Fold everything written so far into a new snapshot
+
+        Only one process snapshots at a time; if another one holds the lock
+        this returns None immediately.
+
+        Returns:
+            {'snapshot', 'transactions', 'events_replayed'} or None
+        """
+        with open(os.path.join(self.directory, 'snapshot.lock'), 'w') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+
+            state = self.replay()
+            name = f"{SNAPSHOT_PREFIX}{int(time.time() * 1000):015d}.json"
+            path = os.path.join(self.directory, name)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({
+                    'created_at': datetime.now(timezone.utc).isoformat(),
+                    'offsets': state['offsets'],
+                    # [status, order_id, updated_at] keeps the snapshot small
+                    'transactions': {
+                        transaction_uuid: [entry['status'], entry['order_id'], entry['updated_at']]
+                        for transaction_uuid, entry in state['transactions'].items()
+                    }
+                }, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+
+            snapshots = [name for name in self._files(SNAPSHOT_PREFIX) if name.endswith('.json')]
+            for old in snapshots[:-SNAPSHOTS_KEPT]:
+                os.remove(os.path.join(self.directory, old))
+
+        log.info(f"Journal snapshot {name}: {len(state['transactions'])} transactions, "
+                 f"{state['events_replayed']} new events")
+        return {'snapshot': name, 'transactions': len(state['transactions']),
+                'events_replayed': state['events_replayed']}
+
+    def history(self, transaction_uuid: str) -> List[Dict[str, Any]]:
+        """Every journaled event of one transaction, oldest first (scans all segments)"""
+        events = []
+        for segment in self._files(SEGMENT_PREFIX):
+            segment_events, _ = self._read_events(os.path.join(self.directory, segment), 0)
+            events.extend(event for event in segment_events if event.get('transaction_uuid') == transaction_uuid)
+        return sorted(events, key=_event_time)
@@ -0,0 +1,201 @@
+"""
+Asynchronous, structured logging for Thapa Kirana Pasal
+
+Request threads only put records on a bounded queue (QueueHandler); a
+QueueListener thread formats and writes them, so a slow disk or stdout
+never stalls a checkout. When the queue is full records are dropped and
+counted instead of blocking. Records carry the request's correlation IDs
+(request_id, order_id, transaction_uuid), can be rendered as JSON lines,
+have signatures and secrets redacted, and high-volume INFO logs marked
+with extra={'sample': True} can be sampled per request.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+import metrics
+
+LOG_RECORDS_DROPPED = metrics.counter(
+    'log_records_dropped_total', 'Log records dropped because the logging queue was full'
+)
+
+# Field names whose values never reach the log output
+REDACTED_FIELDS = frozenset({'signature', 'secret_key', 'secret', 'password', 'token', 'authorization'})
+REDACTED = '[REDACTED]'
+_SIGNATURE_IN_TEXT = re.compile(
+    r"""(?P<key>['"]?(?:signature|secret_key|secret|password|token)['"]?\s*[:=]\s*)(?P<quote>['"]?)[^'",}\s]+""",
+    re.IGNORECASE
+)
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_log_context: ContextVar[Dict[str, Any]] = ContextVar('log_context', default={})
+
+
+def bind(**fields: Any) -> None:
+    """Attach correlation fields (order_id, transaction_uuid, ...) to later logs of this request"""
+    _log_context.set({**_log_context.get(), **{key: value for key, value in fields.items() if value}})
+
+
+def clear_context(**fields: Any) -> None:
+    """Start a fresh log context, e.g. at the beginning of a request"""
+    _log_context.set({key: value for key, value in fields.items() if value})
+
+
+def redact(value: Any) -> Any:
+    """Mask secret fields in dicts/lists and signature=... fragments in strings"""
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in REDACTED_FIELDS else redact(item)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return _SIGNATURE_IN_TEXT.sub(lambda m: f"{m.group('key')}{m.group('quote')}{REDACTED}", value)
+    return value
+
+
+class ContextFilter(logging.Filter):
+    """Copies the request's correlation fields onto the record (runs on the request thread)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of INFO/DEBUG records marked sample=True
+
+    The decision is made per request_id, so a sampled request keeps all
+    of its sampled logs. Warnings and errors are never dropped.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.threshold = int(max(0.0, min(1.0, rate)) * 10000)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not getattr(record, 'sample', False):
+            return True
+        key = str(getattr(record, 'request_id', '') or record.created).encode('utf-8')
+        return zlib.crc32(key) % 10000 < self.threshold
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking on a full queue"""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the record's extra fields and correlation IDs"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': redact(record.getMessage())
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key != 'sample':
+                entry[key] = REDACTED if key.lower() in REDACTED_FIELDS else redact(value)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Flask's default line format plus correlation IDs, with secrets redacted"""
+
+    def __init__(self):
+        super().__init__('[%(asctime)s] %(levelname)s in %(module)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = redact(super().format(record))
+        ids = [f"{key}={getattr(record, key)}" for key in ('request_id', 'order_id', 'transaction_uuid')
+               if getattr(record, key, None)]
+        return f"{line} [{' '.join(ids)}]" if ids else line
+
+
+class _Pipeline:
+    def __init__(self, handler: logging.Handler, maxsize: int):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize))
+        self.listener = logging.handlers.QueueListener(self.queue_handler.queue, handler,
+                                                       respect_handler_level=True)
+
+    def start(self) -> None:
+        self.listener.start()
+
+    def restart_after_fork(self) -> None:
+        # The listener thread does not survive fork (gunicorn --preload); give the
+        # worker its own queue and thread
+        self.queue_handler.queue = self.listener.queue = queue.Queue(self.maxsize)
+        self.listener._thread = None
+        self.listener.start()
+
+    def stop(self) -> None:
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+
+_pipeline: Optional[_Pipeline] = None
+
+
+def setup_logging(level: str = 'INFO', json_format: bool = False, sample_rate: float = 1.0,
+                  queue_size: int = 10000, stream=None) -> logging.Handler:
+    """
+    Route all logging through a background QueueListener
+
+    Call before the Flask app logger is created so Flask does not add its
+    own synchronous handler.
+
+    Args:
+        level: Root log level name
+        json_format: Emit JSON lines instead of text
+        sample_rate: Fraction of requests whose sample=True INFO logs are kept
+        queue_size: Records buffered before new ones are dropped
+        stream: Output stream (stderr by default)
+
+    Returns:
+        The queue handler installed on the root logger
+    """
+    global _pipeline
+    if _pipeline is not None:
+        return _pipeline.queue_handler
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if json_format else TextFormatter())
+
+    _pipeline = _Pipeline(output, queue_size)
+    _pipeline.queue_handler.addFilter(ContextFilter())
+    _pipeline.queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    root.addHandler(_pipeline.queue_handler)
+
+    _pipeline.start()
+    atexit.register(_pipeline.stop)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_pipeline.restart_after_fork)
+    return _pipeline.queue_handler
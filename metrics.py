@@ -0,0 +1,398 @@
+"""
+Prometheus-style metrics for Thapa Kirana Pasal
+
+Counters, gauges and histograms are recorded into per-thread shards, so
+the hot path is a couple of dict/list updates with no lock; shards are
+summed when /metrics is scraped. Under gunicorn each worker periodically
+writes its totals to METRICS_DIR and the scraped worker merges every
+worker's file, so the numbers cover the whole server rather than the
+process that happened to answer the scrape. Gauges from workers that
+have stopped writing are dropped; their counters are kept, and the
+master folds an exited worker's file into a shared retired total.
+"""
+
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Totals of workers that have exited, kept next to the per-pid files in METRICS_DIR
+RETIRED_FILE = 'retired.json'
+
+
+class Metric:
+    """Base class: a named metric whose samples live in per-thread shards"""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._reset()
+
+    def _reset(self) -> None:
+        # Samples of threads that have exited, so the shard list only holds live threads
+        self._retired: Dict[Tuple[str, ...], Any] = {}
+        self._shards: List[Dict[Tuple[str, ...], Any]] = [self._retired]
+        self._shards_lock = threading.Lock()
+        # Replaced last: dropping the old one retires its shards, which needs the new lock
+        self._local = threading.local()
+
+    def _shard(self) -> Dict[Tuple[str, ...], Any]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # The thread-local drops the owner when the thread exits; that folds the shard in
+            owner = self._local.owner = _ShardOwner()
+            finalizer = weakref.finalize(owner, self._retire, self._shards, shard)
+            finalizer.atexit = False
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    def _retire(self, shards: List[Dict[Tuple[str, ...], Any]], shard: Dict[Tuple[str, ...], Any]) -> None:
+        with self._shards_lock:
+            if shards is not self._shards:
+                return  # a shard of the parent process, already dropped by _reset
+            for labels, value in shard.copy().items():
+                self._retired[labels] = self._merge(self._retired.get(labels), value)
+            # By identity: list.remove() would match any equal dict, the retired one included
+            shards[:] = [other for other in shards if other is not shard]
+
+    @staticmethod
+    def _merge(total: Any, value: Any) -> Any:
+        return value if total is None else total + value
+
+    def _copies(self) -> List[Dict[Tuple[str, ...], Any]]:
+        # Copied under the lock, so a shard being retired is counted exactly once.
+        # dict.copy() runs under the GIL, so the owning thread cannot resize it mid-copy
+        with self._shards_lock:
+            return [shard.copy() for shard in self._shards]
+
+    def collect(self) -> Dict[Tuple[str, ...], Any]:
+        """Samples summed over every thread, keyed by label values"""
+        totals: Dict[Tuple[str, ...], Any] = {}
+        for shard in self._copies():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+
+class _ShardOwner:
+    """Kept only in a thread's local storage; collected when the thread exits"""
+
+    __slots__ = ('__weakref__',)
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    type = 'counter'
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that goes up and down (e.g. requests in flight)"""
+
+    type = 'gauge'
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observed values (seconds, by convention)"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        shard = self._shard()
+        # [count per bucket ..., count above the last bucket, sum]
+        state = shard.get(labelvalues)
+        if state is None:
+            state = shard[labelvalues] = [0] * (len(self.buckets) + 2)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @staticmethod
+    def _merge(total: Optional[List[float]], state: List[float]) -> List[float]:
+        # A new list, so a copy taken by collect() never sees it change
+        if total is None:
+            return list(state)
+        return [a + b for a, b in zip(total, state)]
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        """Observe the duration of the with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def collect(self) -> Dict[Tuple[str, ...], List[float]]:
+        totals: Dict[Tuple[str, ...], List[float]] = {}
+        for shard in self._copies():
+            for labels, state in shard.items():
+                total = totals.setdefault(labels, [0] * len(state))
+                for i, value in enumerate(list(state)):
+                    total[i] += value
+        return totals
+
+
+class MetricsRegistry:
+    """Holds the metrics of a process and renders the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self.directory: Optional[str] = None
+        self.flush_interval = 5.0
+        self._stop: Optional[threading.Event] = None
+        if hasattr(os, 'register_at_fork'):
+            # A preloaded app forks into workers; each must start from zero
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    # Multiprocess support
+
+    def enable_multiprocess(self, directory: str, flush_interval: float = 5.0) -> None:
+        """Share totals with the other worker processes through files in directory"""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._start_flusher()
+        # A worker's last counts land in its file before the master retires it
+        atexit.register(self._final_flush)
+
+    def _final_flush(self) -> None:
+        try:
+            self.flush()
+        except OSError as e:
+            log.warning(f"Metrics flush failed: {e}")
+
+    def _start_flusher(self) -> None:
+        self._stop = threading.Event()
+        stop = self._stop
+
+        def loop():
+            while not stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except OSError as e:
+                    log.warning(f"Metrics flush failed: {e}")
+
+        threading.Thread(target=loop, name='metrics-flush', daemon=True).start()
+
+    def _after_fork(self) -> None:
+        for metric in self.metrics.values():
+            metric._reset()
+        if self.directory is not None:
+            self._start_flusher()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """This process's totals in a JSON-serializable form"""
+        return {
+            name: {'type': metric.type,
+                   'samples': [[list(labels), value] for labels, value in metric.collect().items()]}
+            for name, metric in self.metrics.items()
+        }
+
+    def flush(self) -> None:
+        """Write this process's totals to the shared directory"""
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'written_at': time.time(), 'metrics': self.snapshot()}, f)
+        os.replace(tmp_path, path)
+
+    def _process_snapshots(self) -> List[Tuple[bool, Dict[str, Any]]]:
+        """(is_live, snapshot) for this process and every other worker's last flush"""
+        snapshots = [(True, self.snapshot())]
+        if self.directory is None:
+            return snapshots
+
+        own = f"{os.getpid()}.json"
+        stale_after = self.flush_interval * 3
+        flushed = []
+        for filename in os.listdir(self.directory):
+            if filename in (own, RETIRED_FILE) or not filename.endswith('.json'):
+                continue
+            data = _read_snapshot(os.path.join(self.directory, filename))
+            if data is not None:
+                flushed.append((filename[:-len('.json')], data))
+
+        # Read after the worker files: retire_process writes it before deleting a
+        # worker's file, so a file gone by now is already counted in it
+        retired = _read_snapshot(os.path.join(self.directory, RETIRED_FILE))
+        merged = retired.get('merged', {}) if retired else {}
+        for pid, data in flushed:
+            written_at = data.get('written_at', 0)
+            if pid in merged and written_at <= merged[pid]:
+                continue
+            snapshots.append((time.time() - written_at <= stale_after, data['metrics']))
+        if retired:
+            snapshots.append((False, retired['metrics']))
+        return snapshots
+
+    def collect(self) -> Dict[str, Dict[Tuple[str, ...], Any]]:
+        """Samples per metric summed over threads and worker processes"""
+        merged: Dict[str, Dict[Tuple[str, ...], Any]] = {name: {} for name in self.metrics}
+        for live, snapshot in self._process_snapshots():
+            for name, data in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and not live):
+                    continue
+                _add_samples(merged[name], data['samples'])
+        return merged
+
+    def render(self) -> str:
+        """Prometheus text exposition of every metric"""
+        lines = []
+        for name, samples in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            if not samples and not metric.labelnames and metric.type != 'histogram':
+                samples = {(): 0}
+            for labels, value in sorted(samples.items()):
+                pairs = list(zip(metric.labelnames, labels))
+                if metric.type != 'histogram':
+                    lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(pairs + [('le', le)])} {_format_value(cumulative)}")
+                lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{_format_labels(pairs)} {_format_value(cumulative)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _add_samples(samples: Dict[Tuple[str, ...], Any], flushed: List[List[Any]]) -> None:
+    """Add flushed [labels, value] pairs (histogram values are lists) into samples"""
+    for labels, value in flushed:
+        key = tuple(labels)
+        if isinstance(value, list):
+            total = samples.setdefault(key, [0] * len(value))
+            for i, item in enumerate(value):
+                total[i] += item
+        else:
+            samples[key] = samples.get(key, 0) + value
+
+
+def _read_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def retire_process(directory: str, pid: int) -> None:
+    """
+    Fold a stopped worker's last flush into the directory's retired totals
+
+    Run by the gunicorn master when a worker exits (child_exit), so per-pid
+    files do not pile up. Counters and histograms are kept; gauges are dropped.
+    """
+    path = os.path.join(directory, f"{pid}.json")
+    data = _read_snapshot(path)
+    if data is None:
+        if os.path.exists(path):
+            os.remove(path)  # unreadable; nothing to keep
+        return
+
+    retired_path = os.path.join(directory, RETIRED_FILE)
+    retired = _read_snapshot(retired_path) or {'written_at': 0, 'metrics': {}}
+    for name, entry in data['metrics'].items():
+        if entry.get('type') == 'gauge':
+            continue
+        target = retired['metrics'].setdefault(name, {'type': entry.get('type'), 'samples': []})
+        samples = {tuple(labels): value for labels, value in target['samples']}
+        _add_samples(samples, entry['samples'])
+        target['samples'] = [[list(labels), value] for labels, value in samples.items()]
+
+    # Scrapers skip a worker file whose flush is already counted here. Entries
+    # are kept only while their file still exists (pids get reused)
+    merged = {
+        other: written_at for other, written_at in retired.get('merged', {}).items()
+        if os.path.exists(os.path.join(directory, f"{other}.json"))
+    }
+    merged[str(pid)] = data.get('written_at', 0)
+    retired['merged'] = merged
+
+    tmp_path = f"{retired_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(retired, f)
+    os.replace(tmp_path, retired_path)
+    os.remove(path)
+
+
+def _format_labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    escaped = (
+        key + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+# Process-wide registry used by the app and its modules
+registry = MetricsRegistry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
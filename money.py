@@ -0,0 +1,91 @@
+"""
+Exact money arithmetic for eSewa amounts
+
+Amounts are integer paisa (1 rupee = 100 paisa), so sums and
+differences are exact. Values are converted only at the edges. to_paisa()
+reads ints, floats, strings and Decimals and rounds half up to the paisa.
+format_amount() writes the one canonical string that is signed, sent to
+eSewa, stored and returned. Whole rupees have no decimals ('550') and
+anything else has two ('449.90'), so a float artefact like
+'449.90000000000003' can never reach a signature.
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any, Dict
+
+PAISA_PER_RUPEE = 100
+
+
+class MoneyError(ValueError):
+    """Raised for amounts that are not finite numbers or break the breakdown rules"""
+
+
+def to_paisa(value: Any) -> int:
+    """
+    Convert a rupee amount to integer paisa, rounding half up
+
+    Floats are read through their shortest repr, so 449.9 is 44990 paisa
+    and 44.99000000000001 rounds to 4499.
+
+    Raises:
+        MoneyError: Not a finite number
+    """
+    if isinstance(value, bool):
+        raise MoneyError(f"Invalid amount: {value!r}")
+    if isinstance(value, int):
+        return value * PAISA_PER_RUPEE
+    try:
+        rupees = value if isinstance(value, Decimal) else Decimal(str(value).strip())
+    except InvalidOperation:
+        raise MoneyError(f"Invalid amount: {value!r}")
+    if not rupees.is_finite():
+        raise MoneyError(f"Invalid amount: {value!r}")
+    return int((rupees * PAISA_PER_RUPEE).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def format_amount(paisa: int) -> str:
+    """Canonical eSewa string for an amount in paisa: '550' or '449.90'"""
+    rupees, remainder = divmod(abs(paisa), PAISA_PER_RUPEE)
+    sign = '-' if paisa < 0 else ''
+    return f"{sign}{rupees}" if remainder == 0 else f"{sign}{rupees}.{remainder:02d}"
+
+
+def breakdown(subtotal: int, discount: int, delivery_charge: int, tax: int = 0,
+              service_charge: int = 0) -> Dict[str, str]:
+    """
+    The eSewa amount fields of a checkout, computed once in paisa
+
+    eSewa requires total_amount = amount + tax_amount +
+    product_service_charge + product_delivery_charge, where amount is the
+    discounted product amount.
+
+    Args:
+        subtotal: Product subtotal in paisa
+        discount: Promotion discount in paisa (at most the subtotal)
+        delivery_charge: Delivery charge in paisa
+        tax: Tax in paisa
+        service_charge: Service charge in paisa
+
+    Returns:
+        Canonical amount strings: subtotal, discount, amount, tax_amount,
+        product_service_charge, product_delivery_charge and total_amount
+
+    Raises:
+        MoneyError: Negative component or a discount larger than the subtotal
+    """
+    if min(subtotal, discount, delivery_charge, tax, service_charge) < 0:
+        raise MoneyError('Amounts must not be negative')
+    if discount > subtotal:
+        raise MoneyError('Discount exceeds the subtotal')
+
+    amount = subtotal - discount
+    total = amount + tax + service_charge + delivery_charge
+    return {
+        'subtotal': format_amount(subtotal),
+        'discount': format_amount(discount),
+        'amount': format_amount(amount),
+        'tax_amount': format_amount(tax),
+        'product_service_charge': format_amount(service_charge),
+        'product_delivery_charge': format_amount(delivery_charge),
+        'total_amount': format_amount(total)
+    }
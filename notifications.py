@@ -0,0 +1,143 @@
+"""
+Payment status notification bus
+
+Browsers waiting for a payment outcome subscribe to its transaction_uuid
+(over SSE or long-poll) instead of polling the status API. Status changes
+made in this process (callbacks, reconciliation) are published directly.
+Changes made by other gunicorn workers or the reconcile CLI are picked up
+by a single watcher thread per process. The watcher looks up every
+watched transaction in one batched store query per interval, so N waiting
+browsers cost one query, not N requests.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Any, Optional, Set
+
+from storage import OrderStore
+
+log = logging.getLogger(__name__)
+
+# Statuses after which a transaction no longer changes through the checkout flow
+TERMINAL_STATUSES = frozenset({'SUCCESS', 'FAILED', 'REFUNDED', 'PARTIALLY_REFUNDED'})
+
+
+class Subscription:
+    """Events for one transaction, delivered to one waiting client"""
+
+    def __init__(self, bus: 'NotificationBus', topic: str):
+        self.bus = bus
+        self.topic = topic
+        self._events: 'queue.Queue[Dict[str, Any]]' = queue.Queue()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None if none arrived within timeout seconds"""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class NotificationBus:
+    """In-process pub/sub keyed by transaction_uuid, kept in sync with the store"""
+
+    def __init__(self, store: Optional[OrderStore] = None, poll_interval: float = 1.0):
+        """
+        Args:
+            store: Store polled for changes made by other processes (None to disable)
+            poll_interval: Seconds between store polls while anyone is subscribed
+        """
+        self.store = store
+        self.poll_interval = poll_interval
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        # Last status seen per watched transaction, to publish only real changes
+        self._known: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+
+    def subscribe(self, topic: str, known_status: Optional[str] = None) -> Subscription:
+        """
+        Start receiving events for a transaction
+
+        Args:
+            topic: transaction_uuid
+            known_status: Status the subscriber already has; the watcher
+                publishes when the stored status differs from it
+
+        Returns:
+            Subscription; close it (or use it as a context manager) when done
+        """
+        subscription = Subscription(self, topic)
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+            self._known.setdefault(topic, known_status)
+            self._ensure_watcher()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.topic]
+                self._known.pop(subscription.topic, None)
+
+    def publish(self, topic: str, event: Dict[str, Any]) -> int:
+        """
+        Deliver an event to every subscriber of topic
+
+        Returns:
+            Number of subscribers the event was delivered to
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+            if topic in self._known:
+                self._known[topic] = event.get('status')
+        for subscription in subscribers:
+            subscription._events.put(event)
+        return len(subscribers)
+
+    @property
+    def watched(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def _ensure_watcher(self) -> None:
+        # Called with self._lock held
+        if self.store is None:
+            return
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch, name='notification-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                known = dict(self._known)
+            if not known:
+                continue
+            try:
+                current = self.store.transaction_statuses(list(known))
+            except Exception as e:
+                log.warning(f"Notification watcher poll failed: {str(e)}")
+                continue
+            for topic, status in current.items():
+                with self._lock:
+                    # A local publish may have delivered this change since the snapshot
+                    changed = topic in self._known and self._known[topic] != status['status']
+                if changed:
+                    self.publish(topic, status)
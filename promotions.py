@@ -0,0 +1,241 @@
+"""
+Promotion engine for Thapa Kirana Pasal
+
+Promotion rules are loaded from a JSON config (see data/promotions.json)
+and compiled once into a code -> rule table plus a short list of
+automatic promotions (e.g. the Friday sale). Evaluating a checkout is a
+dict lookup for the entered code plus the automatic rules, independent of
+how many codes exist. The file is re-read when it changes, so sales can
+be scheduled without a deploy. Redemption caps are enforced atomically
+by the order store. Rule amounts are configured in rupees and compiled to
+integer paisa; discounts are computed in paisa, percentages rounded half
+up to the paisa, so the result never depends on float rounding.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Dict, Any, Optional, List, FrozenSet, Tuple
+
+from money import MoneyError, to_paisa
+
+log = logging.getLogger(__name__)
+
+PROMOTION_TYPES = ('percent', 'flat')
+
+
+class PromotionError(ValueError):
+    """Raised for malformed promotion rules"""
+
+
+class Promotion:
+    """A single compiled promotion rule"""
+
+    __slots__ = ('code', 'type', 'value', 'min_subtotal', 'max_discount', 'categories',
+                 'starts_at', 'expires_at', 'weekdays', 'per_user_limit', 'max_redemptions',
+                 'stackable', 'auto_apply', 'description')
+
+    def __init__(self, rule: Dict[str, Any], tz=None):
+        self.code: str = rule['code'].strip().upper()
+        self.type: str = rule.get('type', 'percent')
+        if self.type not in PROMOTION_TYPES:
+            raise PromotionError(f"{self.code}: unknown promotion type {self.type!r}")
+        # Percent as an exact Decimal; flat value, min_subtotal and max_discount in paisa
+        try:
+            self.value = Decimal(str(rule['value'])) if self.type == 'percent' else to_paisa(rule['value'])
+            self.min_subtotal: int = to_paisa(rule.get('min_subtotal', 0))
+            self.max_discount: Optional[int] = (
+                to_paisa(rule['max_discount']) if rule.get('max_discount') is not None else None
+            )
+        except (InvalidOperation, MoneyError) as e:
+            raise PromotionError(f"{self.code}: invalid amount ({e})")
+        if self.type == 'percent' and not self.value.is_finite():
+            raise PromotionError(f"{self.code}: invalid percentage {rule['value']!r}")
+        self.categories: Optional[FrozenSet[str]] = frozenset(rule['categories']) if rule.get('categories') else None
+        self.starts_at = _parse_datetime(rule.get('starts_at'), tz)
+        self.expires_at = _parse_datetime(rule.get('expires_at'), tz)
+        # Python weekday numbers: Monday=0 ... Friday=4, Sunday=6
+        self.weekdays: Optional[FrozenSet[int]] = frozenset(rule['weekdays']) if rule.get('weekdays') else None
+        self.per_user_limit: Optional[int] = rule.get('per_user_limit')
+        self.max_redemptions: Optional[int] = rule.get('max_redemptions')
+        self.stackable: bool = rule.get('stackable', False)
+        self.auto_apply: bool = rule.get('auto_apply', False)
+        self.description: str = rule.get('description', '')
+
+    @property
+    def limited(self) -> bool:
+        """True if redemptions must be counted"""
+        return self.per_user_limit is not None or self.max_redemptions is not None
+
+    def is_active(self, now: datetime) -> bool:
+        if self.starts_at and now < self.starts_at:
+            return False
+        if self.expires_at and now >= self.expires_at:
+            return False
+        if self.weekdays is not None and now.weekday() not in self.weekdays:
+            return False
+        return True
+
+    def discount_for(self, cart: List[Dict[str, Any]], subtotal: int) -> int:
+        """Discount in paisa this rule gives on a cart with subtotal paisa, 0 if it does not apply"""
+        if subtotal < self.min_subtotal:
+            return 0
+
+        base = subtotal
+        if self.categories is not None:
+            base = sum(to_paisa(item['price']) * item['qty'] for item in cart
+                       if item.get('category') in self.categories)
+        if base <= 0:
+            return 0
+
+        if self.type == 'percent':
+            discount = int((base * self.value / 100).to_integral_value(rounding=ROUND_HALF_UP))
+        else:
+            discount = self.value
+        if self.max_discount is not None:
+            discount = min(discount, self.max_discount)
+        return min(discount, base)
+
+
+class PromotionEngine:
+    """Compiled promotion table with hot reload from the config file"""
+
+    def __init__(self, rules: List[Dict[str, Any]], tz=None):
+        """
+        Args:
+            rules: Promotion rule dicts
+            tz: Timezone that weekdays and dates are evaluated in
+        """
+        self.tz = tz
+        self._compile(rules)
+        self.path: Optional[str] = None
+        self._mtime = 0.0
+        self._checked_at = 0.0
+        self.reload_interval = 30.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, tz=None) -> 'PromotionEngine':
+        with open(path, encoding='utf-8') as f:
+            engine = cls(json.load(f), tz=tz)
+        engine.path = path
+        engine._mtime = os.path.getmtime(path)
+        engine._checked_at = time.monotonic()
+        return engine
+
+    def _compile(self, rules: List[Dict[str, Any]]) -> None:
+        by_code: Dict[str, Promotion] = {}
+        automatic: List[Promotion] = []
+        for rule in rules:
+            promotion = Promotion(rule, self.tz)
+            if promotion.auto_apply:
+                automatic.append(promotion)
+            else:
+                by_code[promotion.code] = promotion
+        # Swap both tables in one assignment so readers never see a mix
+        self._tables = (by_code, tuple(automatic))
+        self.version = getattr(self, 'version', 0) + 1
+
+    def maybe_reload(self) -> None:
+        """Recompile the rules if the config file changed (checked every reload_interval)"""
+        if self.path is None or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.path)
+                if mtime == self._mtime:
+                    return
+                with open(self.path, encoding='utf-8') as f:
+                    self._compile(json.load(f))
+                self._mtime = mtime
+                log.info(f"Promotions reloaded from {self.path}")
+            except (OSError, ValueError, KeyError) as e:
+                log.error(f"Promotion reload failed, keeping previous rules: {e}")
+
+    def active_automatic(self, now: Optional[datetime] = None) -> List[Promotion]:
+        """Automatic promotions running right now (for sale banners)"""
+        self.maybe_reload()
+        now = now or datetime.now(self.tz)
+        return [promotion for promotion in self._tables[1] if promotion.is_active(now)]
+
+    def state_key(self, code: Optional[str], now: Optional[datetime] = None) -> Tuple[Any, ...]:
+        """
+        Everything besides the cart that evaluate() depends on right now
+
+        Two evaluations with the same cart and state key give the same
+        result, so it can key a cache of computed totals.
+        """
+        self.maybe_reload()
+        now = now or datetime.now(self.tz)
+        entered = self.get(code)
+        return (
+            self.version,
+            entered.code if entered is not None and entered.is_active(now) else None,
+            tuple(promotion.code for promotion in self.active_automatic(now))
+        )
+
+    def get(self, code: Optional[str]) -> Optional[Promotion]:
+        if not code:
+            return None
+        return self._tables[0].get(code.strip().upper())
+
+    def evaluate(self, code: Optional[str], cart: List[Dict[str, Any]], subtotal: int,
+                 now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Work out which promotions apply to a cart
+
+        The entered code and every active automatic promotion are
+        considered. Stackable promotions add up; otherwise the single
+        largest discount wins. The total never exceeds the subtotal.
+
+        Args:
+            code: Entered promo code, if any
+            cart: Priced cart lines (rupee prices)
+            subtotal: Cart subtotal in paisa
+            now: Evaluation time (default: now in the engine's timezone)
+
+        Returns:
+            {'discount': total discount in paisa, 'promotions': [applied Promotion, ...]}
+        """
+        self.maybe_reload()
+        now = now or datetime.now(self.tz)
+        by_code, automatic = self._tables
+
+        candidates = []
+        entered = by_code.get(code.strip().upper()) if code else None
+        for promotion in ((entered,) if entered else ()) + automatic:
+            if not promotion.is_active(now):
+                continue
+            discount = promotion.discount_for(cart, subtotal)
+            if discount > 0:
+                candidates.append((discount, promotion))
+
+        if not candidates:
+            return {'discount': 0, 'promotions': []}
+
+        stacked = [candidate for candidate in candidates if candidate[1].stackable]
+        best = max(candidates, key=lambda candidate: candidate[0])
+        if len(stacked) > 1 and sum(discount for discount, _ in stacked) > best[0]:
+            chosen = stacked
+        else:
+            chosen = [best]
+
+        return {
+            'discount': min(subtotal, sum(discount for discount, _ in chosen)),
+            'promotions': [promotion for _, promotion in chosen]
+        }
+
+
+def _parse_datetime(value: Optional[str], tz) -> Optional[datetime]:
+    """Parse an ISO-8601 config value; naive values are taken to be in tz"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None and tz is not None:
+        parsed = parsed.replace(tzinfo=tz)
+    return parsed
@@ -0,0 +1,225 @@
+"""
+Token-bucket rate limiting
+
+Each bucket holds up to `burst` tokens and refills at `rate` tokens per
+second; a request spends one token and is rejected with 429 when the
+bucket is empty. A check is one keyed lookup and update per bucket, so the
+per-request cost does not grow with traffic. Buckets live in SQLite (shared
+by all gunicorn workers on the host) or in process memory (tests, single
+process).
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+from storage import SQLiteConnectionPool, StoreError
+
+log = logging.getLogger(__name__)
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$', re.IGNORECASE)
+
+
+class Limit:
+    """A bucket size and refill rate"""
+
+    __slots__ = ('burst', 'rate')
+
+    def __init__(self, burst: int, period: float):
+        """
+        Args:
+            burst: Requests allowed at once (bucket size)
+            period: Seconds in which a full bucket refills
+        """
+        self.burst = burst
+        self.rate = burst / period
+
+    @classmethod
+    def parse(cls, value: Optional[str]) -> Optional['Limit']:
+        """
+        Parse '10/minute', '5/second' or '100/15minutes'; '' or 'off' disables the limit
+
+        Raises:
+            ValueError: Unrecognised format
+        """
+        if not value or value.strip().lower() in ('off', 'none', '0'):
+            return None
+        match = _LIMIT_PATTERN.match(value)
+        if match is None:
+            raise ValueError(f"Invalid rate limit: {value!r}")
+        count, multiplier, unit = match.groups()
+        return cls(int(count), int(multiplier or 1) * _PERIODS[unit.lower()])
+
+    def __repr__(self) -> str:
+        return f"Limit(burst={self.burst}, rate={self.rate:.4g}/s)"
+
+
+def _refill(tokens: float, updated_at: float, limit: Limit, now: float) -> float:
+    return min(float(limit.burst), tokens + max(0.0, now - updated_at) * limit.rate)
+
+
+class BucketBackend:
+    """Storage for bucket states; acquire is atomic across all given buckets"""
+
+    def acquire(self, buckets: List[Tuple[str, Limit]], now: float) -> float:
+        """
+        Take one token from every bucket, or from none if any is empty
+
+        Returns:
+            0 if the request is allowed, else seconds until it would be
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the backend"""
+
+
+def _decide(states: List[Tuple[float, float]], buckets: List[Tuple[str, Limit]],
+            now: float) -> Tuple[float, List[float]]:
+    # (retry_after, refilled token counts) for the current states
+    levels = [_refill(tokens, updated_at, limit, now) for (tokens, updated_at), (_, limit) in zip(states, buckets)]
+    waits = [(1.0 - level) / limit.rate for level, (_, limit) in zip(levels, buckets) if level < 1.0]
+    return (max(waits) if waits else 0.0), levels
+
+
+class MemoryBuckets(BucketBackend):
+    """Process-local buckets, least recently used evicted beyond maxsize"""
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self._states: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, buckets, now):
+        with self._lock:
+            states = [self._states.get(key) or (float(limit.burst), now) for key, limit in buckets]
+            retry_after, levels = _decide(states, buckets, now)
+            # A rejected request still refreshes the levels; it spends nothing
+            spend = 0.0 if retry_after else 1.0
+            for (key, _), level in zip(buckets, levels):
+                self._states[key] = (level - spend, now)
+                self._states.move_to_end(key)
+            while len(self._states) > self.maxsize:
+                self._states.popitem(last=False)
+        return retry_after
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    key        TEXT PRIMARY KEY,
+    tokens     REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated_at ON rate_limit_buckets (updated_at);
+"""
+
+
+class SQLiteBuckets(BucketBackend):
+    """
+    Buckets in a SQLite (WAL) file shared by every worker on the host
+
+    Kept apart from the order database so limiter writes never queue
+    behind checkout writes.
+    """
+
+    def __init__(self, path: str, pool_size: int = 8, timeout: float = 1.0, idle_ttl: float = 86400.0):
+        """
+        Args:
+            path: Database file
+            pool_size: Maximum connections per process
+            timeout: Seconds to wait for the write lock
+            idle_ttl: Buckets untouched this long are pruned (they would be full anyway)
+        """
+        self.pool = SQLiteConnectionPool(path, size=pool_size, timeout=timeout)
+        self.idle_ttl = idle_ttl
+        self._next_prune = 0.0
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def acquire(self, buckets, now):
+        keys = [key for key, _ in buckets]
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = {row['key']: (row['tokens'], row['updated_at']) for row in conn.execute(
+                    f"SELECT key, tokens, updated_at FROM rate_limit_buckets WHERE key IN ({','.join('?' * len(keys))})",
+                    keys
+                )}
+                states = [rows.get(key) or (float(limit.burst), now) for key, limit in buckets]
+                retry_after, levels = _decide(states, buckets, now)
+                spend = 0.0 if retry_after else 1.0
+                conn.executemany(
+                    'INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                    [(key, level - spend, now) for key, level in zip(keys, levels)]
+                )
+                if now >= self._next_prune:
+                    self._next_prune = now + 3600
+                    conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?', (now - self.idle_ttl,))
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        return retry_after
+
+    def close(self):
+        self.pool.close()
+
+
+def create_buckets(url: str) -> BucketBackend:
+    """
+    Build a bucket backend from a DATABASE_URL style string
+
+    Args:
+        url: 'sqlite:///path/to/file.db' or 'memory://'
+    """
+    if url.startswith('memory://'):
+        return MemoryBuckets()
+    if url.startswith('sqlite:///'):
+        return SQLiteBuckets(url[len('sqlite:///'):])
+    raise StoreError(f"Unsupported RATE_LIMIT_STORAGE: {url}")
+
+
+class RateLimiter:
+    """Per-client and global token buckets for named groups of routes"""
+
+    def __init__(self, backend: BucketBackend, rules: Dict[str, Dict[str, Optional[Limit]]],
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            backend: Bucket storage
+            rules: group -> {'client': Limit or None, 'global': Limit or None}
+            clock: Time source (epoch seconds), injectable for tests
+        """
+        self.backend = backend
+        self.rules = rules
+        self.clock = clock
+
+    def check(self, group: str, client: str) -> Dict[str, Any]:
+        """
+        Spend one request of a client in a route group
+
+        Returns:
+            {'allowed': bool, 'retry_after': whole seconds (0 if allowed)}
+        """
+        rule = self.rules.get(group) or {}
+        buckets = []
+        if rule.get('client'):
+            buckets.append((f"{group}:client:{client}", rule['client']))
+        if rule.get('global'):
+            buckets.append((f"{group}:global", rule['global']))
+        if not buckets:
+            return {'allowed': True, 'retry_after': 0}
+
+        try:
+            retry_after = self.backend.acquire(buckets, self.clock())
+        except Exception as e:
+            # Never turn a limiter outage into a checkout outage
+            log.warning(f"Rate limiter unavailable, allowing request: {str(e)}")
+            return {'allowed': True, 'retry_after': 0}
+        return {'allowed': retry_after == 0, 'retry_after': math.ceil(retry_after)}
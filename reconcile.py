@@ -0,0 +1,160 @@
+"""
+Background reconciliation of stale PENDING transactions
+
+Customers who close the tab before eSewa redirects back leave their
+transaction PENDING forever. The reconciler scans transactions older than
+a cut-off, checks each one against the eSewa status API on a bounded
+thread pool and writes the outcomes back in one store transaction per
+batch. Run it from the CLI (`flask --app app reconcile`) or as a
+scheduler thread (RECONCILE_INTERVAL).
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple, Callable, List
+
+from esewa_client import EsewaClient, CircuitOpenError, EsewaUnavailable, EsewaResponseError
+from storage import OrderStore
+
+log = logging.getLogger(__name__)
+
+# eSewa status -> (transaction status, order status, timestamp field)
+# PENDING and AMBIGUOUS are still in progress at eSewa and are left alone.
+ESEWA_STATUS_TRANSITIONS = {
+    'COMPLETE': ('SUCCESS', 'PAID', 'verified_at'),
+    'NOT_FOUND': ('FAILED', 'PAYMENT_FAILED', 'failed_at'),
+    'CANCELED': ('FAILED', 'PAYMENT_FAILED', 'failed_at'),
+    'FULL_REFUND': ('REFUNDED', 'REFUNDED', 'refunded_at'),
+    'PARTIAL_REFUND': ('PARTIALLY_REFUNDED', 'PARTIALLY_REFUNDED', 'refunded_at'),
+}
+
+
+def transition_for(esewa_response: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Map an eSewa status response to (transaction_fields, order_fields)
+
+    Returns:
+        Store updates, or None if the payment is still in progress
+    """
+    transition = ESEWA_STATUS_TRANSITIONS.get(esewa_response.get('status'))
+    if transition is None:
+        return None
+
+    transaction_status, order_status, timestamp_field = transition
+    now = datetime.now(timezone.utc).isoformat()
+    transaction_fields = {'status': transaction_status, timestamp_field: now, 'reconciled_at': now}
+    order_fields = {'status': order_status}
+    if esewa_response.get('ref_id'):
+        transaction_fields['transaction_code'] = esewa_response['ref_id']
+        order_fields['transaction_code'] = esewa_response['ref_id']
+    if transaction_status == 'SUCCESS':
+        order_fields['payment_verified_at'] = now
+    return transaction_fields, order_fields
+
+
+class Reconciler:
+    """Verifies stale PENDING transactions against eSewa in batches"""
+
+    def __init__(self, store: OrderStore, client: EsewaClient, product_code: str,
+                 max_workers: int = 16, batch_size: int = 500,
+                 on_settled: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        """
+        Args:
+            store: Order/transaction store
+            client: eSewa status client (its pool should hold max_workers connections)
+            product_code: Merchant code the transactions were signed with
+            max_workers: Concurrent status checks
+            batch_size: Transactions fetched and written back per batch
+            on_settled: Called with the transactions settled by each batch
+        """
+        self.store = store
+        self.client = client
+        self.product_code = product_code
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.on_settled = on_settled
+
+    def _check(self, transaction: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        try:
+            response = self.client.check_status(
+                self.product_code, str(transaction['total_amount']), transaction['transaction_uuid']
+            )
+        except CircuitOpenError:
+            return 'skipped', None
+        except (EsewaUnavailable, EsewaResponseError) as e:
+            log.warning(f"Reconciliation check failed for {transaction['transaction_uuid']}: {e}")
+            return 'errors', None
+        return response.get('status') or 'UNKNOWN', response
+
+    def run_once(self, older_than_minutes: float = 15, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Reconcile every PENDING transaction older than the cut-off
+
+        Args:
+            older_than_minutes: Only transactions created at least this long ago
+            limit: Stop after scanning this many transactions
+
+        Returns:
+            Summary counts per eSewa status plus totals
+        """
+        started = time.monotonic()
+        cutoff = (datetime.now(timezone.utc) - timedelta(minutes=older_than_minutes)).isoformat()
+        summary: Dict[str, Any] = {'scanned': 0, 'updated': 0, 'errors': 0, 'skipped': 0, 'by_status': {}}
+        after = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='reconcile') as pool:
+            while limit is None or summary['scanned'] < limit:
+                batch_size = self.batch_size if limit is None else min(self.batch_size, limit - summary['scanned'])
+                batch = self.store.pending_transactions(cutoff, after=after, limit=batch_size)
+                if not batch:
+                    break
+                after = (batch[-1]['created_at'], batch[-1]['transaction_uuid'])
+                summary['scanned'] += len(batch)
+
+                updates = []
+                for transaction, (outcome, response) in zip(batch, pool.map(self._check, batch)):
+                    if response is None:
+                        summary[outcome] += 1
+                        continue
+                    summary['by_status'][outcome] = summary['by_status'].get(outcome, 0) + 1
+                    fields = transition_for(response)
+                    if fields is not None:
+                        updates.append((transaction['transaction_uuid'], fields[0], fields[1]))
+
+                if updates:
+                    # Only settle rows that are still PENDING; a callback may have won the race
+                    settled = self.store.apply_updates(updates, expected_status='PENDING')
+                    summary['updated'] += len(settled)
+                    if settled and self.on_settled is not None:
+                        self.on_settled(settled)
+
+                if len(batch) < batch_size:
+                    break
+
+        summary['duration_seconds'] = round(time.monotonic() - started, 3)
+        log.info(f"Reconciliation finished: {summary}")
+        return summary
+
+
+def start_scheduler(reconciler: Reconciler, interval: float,
+                    older_than_minutes: float = 15) -> threading.Event:
+    """
+    Run reconciler.run_once every interval seconds on a daemon thread
+
+    Returns:
+        Event that stops the scheduler when set
+    """
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                reconciler.run_once(older_than_minutes)
+            except Exception as e:
+                log.error(f"Scheduled reconciliation failed: {str(e)}")
+
+    threading.Thread(target=loop, name='reconcile-scheduler', daemon=True).start()
+    return stop
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Production launcher for Thapa Kirana Pasal
+
+    python serve.py              # gunicorn with gunicorn.conf.py; SERVER_MODE picks app:app or asgi:application
+    python serve.py --report     # import and warm-up time profile, then exit
+    python serve.py --dev        # Flask development server with the debugger
+
+Importing the app is the expensive part of starting a worker: Flask and
+requests, .env and the eSewa config, SQLite schema checks, the catalog,
+delivery zones and promotions. warm_up() then fills the template, pricing
+and page caches. gunicorn.conf.py calls startup_report() from its hooks
+and logs the result, so slow cold starts and worker recycles show up in
+the logs. --report prints the same profile with a per-package import
+breakdown.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from typing import Dict, Any, Optional
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Third-party packages timed separately by --report, in import order
+PACKAGES = ('werkzeug', 'jinja2', 'flask', 'requests', 'dotenv')
+
+
+def _timed_import(name: str) -> Optional[float]:
+    # None if the module was already imported (e.g. preloaded in the gunicorn master)
+    if name in sys.modules:
+        return None
+    started = time.perf_counter()
+    importlib.import_module(name)
+    return round(time.perf_counter() - started, 4)
+
+
+def startup_report(booted_at: Optional[float] = None, packages: bool = False) -> Dict[str, Any]:
+    """
+    Import the app if needed, warm it up and time both
+
+    Args:
+        booted_at: perf_counter() value when the process started booting;
+            adds 'boot_seconds' (time from then until warm)
+        packages: Also time the third-party packages before the app
+
+    Returns:
+        {'imports': {package: seconds}, 'app_import_seconds',
+         'warm_up': {step: seconds}, 'boot_seconds'} ('app_import_seconds'
+        is None when the app was already imported)
+    """
+    report: Dict[str, Any] = {}
+    if packages:
+        report['imports'] = {name: _timed_import(name) for name in PACKAGES}
+    report['app_import_seconds'] = _timed_import('app')
+    report['warm_up'] = sys.modules['app'].warm_up()
+    if booted_at is not None:
+        report['boot_seconds'] = round(time.perf_counter() - booted_at, 4)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run Thapa Kirana Pasal')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--report', action='store_true', help='Print the startup profile and exit')
+    mode.add_argument('--dev', action='store_true', help='Run the Flask development server')
+    args, gunicorn_args = parser.parse_known_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+
+    if args.report:
+        print(json.dumps(startup_report(time.perf_counter(), packages=True), indent=2))
+        return
+    if args.dev:
+        import app
+        app.app.run(debug=True, host='0.0.0.0', port=int(os.getenv('PORT', 5005)))
+        return
+
+    target = 'asgi:application' if os.getenv('SERVER_MODE', 'sync').lower() == 'async' else 'app:app'
+    # Replace this process so gunicorn's master gets the signals (SIGTERM, SIGHUP) directly
+    os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', target,
+                               '-c', os.path.join(ROOT, 'gunicorn.conf.py'), *gunicorn_args])
+
+
+if __name__ == '__main__':
+    main()
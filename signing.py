@@ -0,0 +1,61 @@
+"""
+HMAC-SHA256 signing for eSewa requests and callbacks
+
+The secret key is absorbed into an HMAC state once; each signature clones
+that state instead of re-deriving the inner/outer pads from the key.
+Verification uses a constant-time comparison.
+"""
+
+import base64
+import hashlib
+import hmac
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+
+class HmacSigner:
+    """Pre-keyed HMAC-SHA256 signer producing eSewa style base64 signatures"""
+
+    def __init__(self, secret_key: str):
+        self._keyed = hmac.new(secret_key.encode('utf-8'), digestmod=hashlib.sha256)
+
+    def sign(self, message: str) -> str:
+        """Return the base64 HMAC-SHA256 signature of message"""
+        mac = self._keyed.copy()
+        mac.update(message.encode('utf-8'))
+        return base64.b64encode(mac.digest()).decode('ascii')
+
+    def verify(self, message: str, signature: Any) -> bool:
+        """Check a base64 signature in constant time"""
+        if not isinstance(signature, str):
+            return False
+        return hmac.compare_digest(self.sign(message).encode('ascii'), signature.encode('utf-8'))
+
+    @staticmethod
+    def message_for(fields: Dict[str, Any], signed_field_names: Sequence[str]) -> str:
+        """Build the 'name=value,name=value' message eSewa signs"""
+        return ','.join(f"{name}={fields[name]}" for name in signed_field_names)
+
+    def sign_fields(self, fields: Dict[str, Any], signed_field_names: Sequence[str]) -> str:
+        """Sign the given fields in signed_field_names order"""
+        return self.sign(self.message_for(fields, signed_field_names))
+
+    def sign_many(self, messages: Iterable[str]) -> List[str]:
+        """Sign a batch of messages (reconciliation and bulk re-signing jobs)"""
+        keyed = self._keyed
+        encode = base64.b64encode
+        signatures = []
+        for message in messages:
+            mac = keyed.copy()
+            mac.update(message.encode('utf-8'))
+            signatures.append(encode(mac.digest()).decode('ascii'))
+        return signatures
+
+    def verify_many(self, pairs: Iterable[Tuple[str, Any]]) -> List[bool]:
+        """Verify a batch of (message, signature) pairs"""
+        pairs = list(pairs)
+        expected = self.sign_many(message for message, _ in pairs)
+        return [
+            isinstance(signature, str)
+            and hmac.compare_digest(good.encode('ascii'), signature.encode('utf-8'))
+            for good, (_, signature) in zip(expected, pairs)
+        ]
@@ -47,6 +47,35 @@ passwordInput.addEventListener('input', function() {
     this.style.borderColor = '#dee2e6';
 });
 
+// Fold the cart built before logging in (kept in localStorage) into the
+// session's server-side cart, and mirror the merged result locally
+async function mergeGuestCart() {
+    try {
+        const savedCart = JSON.parse(localStorage.getItem('thapaKiranaCart') || '[]');
+        if (!savedCart.length) return;
+        
+        const response = await fetch('/api/cart/merge', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                cart: savedCart.map(item => ({ id: item.id, qty: item.quantity }))
+            })
+        });
+        const result = await response.json();
+        if (!response.ok || !result.cart) return;
+        
+        localStorage.setItem('thapaKiranaCart', JSON.stringify(result.cart.map(line => ({
+            id: line.id,
+            name: line.name,
+            price: line.price,
+            image: line.image,
+            quantity: line.qty
+        }))));
+    } catch (e) {
+        console.log('Unable to merge cart');
+    }
+}
+
 // Form submission
 loginForm.addEventListener('submit', function(e) {
     e.preventDefault();
@@ -88,13 +117,15 @@ loginForm.addEventListener('submit', function(e) {
         loginButton.disabled = true;
         
         // Simulate API call
-        setTimeout(() => {
+        setTimeout(async () => {
             console.log('Login Data:', {
                 email: email,
                 password: password,
                 rememberMe: rememberMe
             });
             
+            await mergeGuestCart();
+            
             // Reset button
             loginButton.textContent = originalText;
             loginButton.disabled = false;
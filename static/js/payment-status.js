@@ -0,0 +1,84 @@
+// Live payment status for the payment result pages.
+// Listens on the SSE stream and falls back to long-polling when
+// EventSource is unavailable or the stream cannot be opened.
+
+const FINAL_PAYMENT_STATUSES = ['SUCCESS', 'FAILED', 'REFUNDED', 'PARTIALLY_REFUNDED'];
+
+function watchPaymentStatus(transactionUuid, onStatus) {
+    const base = `/api/payment/status/${encodeURIComponent(transactionUuid)}`;
+    let lastStatus = null;
+    let finished = false;
+
+    function deliver(transaction) {
+        if (transaction.status === lastStatus) return;
+        lastStatus = transaction.status;
+        onStatus(transaction);
+        finished = FINAL_PAYMENT_STATUSES.includes(transaction.status);
+    }
+
+    const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+    async function longPoll() {
+        // Doubles after each failed request (up to 30s) and resets on success
+        let backoff = 1000;
+        while (!finished) {
+            let delay = 0;
+            try {
+                const query = lastStatus ? `?status=${encodeURIComponent(lastStatus)}&timeout=25` : '?timeout=0';
+                const response = await fetch(`${base}/wait${query}`);
+                if (response.status === 404) return;
+                if (response.ok) {
+                    const result = await response.json();
+                    if (result.transaction) deliver(result.transaction);
+                    backoff = 1000;
+                } else {
+                    // Rate limited (429 with Retry-After) or a server error
+                    const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+                    delay = retryAfter > 0 ? retryAfter * 1000 : backoff;
+                }
+            } catch (e) {
+                // Network hiccup; back off before asking again
+                delay = backoff;
+            }
+            if (delay) {
+                backoff = Math.min(backoff * 2, 30000);
+                // Jitter, so pages that failed together do not retry together
+                await sleep(delay + Math.random() * 500);
+            }
+        }
+    }
+
+    if (!window.EventSource) {
+        longPoll();
+        return;
+    }
+
+    const source = new EventSource(`${base}/stream`);
+    source.addEventListener('status', (event) => {
+        deliver(JSON.parse(event.data));
+        if (finished) source.close();
+    });
+    source.onerror = () => {
+        // The server closes the stream after a final status or its timeout;
+        // keep waiting with long-polling if we still have no outcome
+        source.close();
+        if (!finished) longPoll();
+    };
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    const statusBox = document.getElementById('paymentStatus');
+    if (!statusBox || !statusBox.dataset.transactionUuid) return;
+
+    watchPaymentStatus(statusBox.dataset.transactionUuid, (transaction) => {
+        if (transaction.status === 'SUCCESS') {
+            window.location.href = `/payment-success.html?order_id=${encodeURIComponent(transaction.order_id)}`;
+        } else if (transaction.status === 'FAILED') {
+            statusBox.textContent = 'eSewa reported that this payment was not completed.';
+        } else {
+            statusBox.textContent = 'Waiting for eSewa to confirm your payment...';
+        }
+    });
+});
+
+window.watchPaymentStatus = watchPaymentStatus;
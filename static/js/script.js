@@ -1,5 +1,4 @@
 let cart = [];
-const today = new Date();
 
 // eSewa Configuration
 const ESEWA_CONFIG = {
@@ -16,14 +15,36 @@ let selectedLocation = {
     fullAddress: ''
 };
 
-const areas = {
-    kathmandu: ['Koteshwor', 'Baneshwor', 'New Baneshwor', 'Kalanki', 'Balaju', 'Maharajgunj', 'Chabahil', 'Bouddha', 'Jorpati', 'Thamel', 'Lazimpat', 'Durbarmarg', 'Putalisadak', 'Naxal', 'Sinamangal'],
-    lalitpur: ['Patan Dhoka', 'Jawalakhel', 'Pulchowk', 'Lagankhel', 'Kupondole', 'Sanepa', 'Jhamsikhel', 'Ekantakuna', 'Satdobato', 'Gwarko'],
-    bhaktapur: ['Bhaktapur Durbar Square', 'Suryabinayak', 'Madhyapur Thimi', 'Sipadol', 'Changunarayan', 'Nagarkot']
-};
+// Delivery areas per district, loaded from /api/delivery/areas
+let deliveryAreas = {};
 
 let map, marker, mapSelectedCoords = null;
 
+// Product grid pagination (served by /api/products)
+const PRODUCT_PAGE_SIZE = 24;
+let productCursor = null;
+let productRequestId = 0;
+let productFilterTimer = null;
+
+// The cart lives on the server (/api/cart); `cart` and localStorage mirror it
+// so counts render immediately and a guest cart can be merged into a new session
+let cartRequestId = 0;
+let cartSync = Promise.resolve();
+
+// Reused for every checkout attempt of the same cart so the backend can
+// replay the first response instead of creating duplicate orders
+let checkoutIdempotencyKey = null;
+
+// Order totals are quoted by the backend (/api/delivery/quote)
+let appliedPromoCode = '';
+let appliedPromotions = [];
+let quoteRequestId = 0;
+let quoteTimer = null;
+
+// Support chat (/api/support/messages): ids already shown, and the open event stream
+let supportMessageIds = new Set();
+let supportStream = null;
+
 const elements = {
     mobileMenuBtn: document.getElementById('mobileMenuBtn'),
     mainNav: document.getElementById('mainNav'),
@@ -35,14 +56,14 @@ const elements = {
     sidebar: document.getElementById('sidebar'),
     sidebarToggle: document.getElementById('sidebarToggle'),
     sidebarClose: document.getElementById('sidebarClose'),
-    products: document.querySelectorAll('.product'),
+    productContainer: document.getElementById('productContainer'),
+    loadMoreProducts: document.getElementById('loadMoreProducts'),
     chatBtn: document.getElementById('chatBtn'),
     messageBox: document.getElementById('messageBox'),
     closeBtn: document.getElementById('closeBtn'),
     messageContent: document.getElementById('messageContent'),
     messageInput: document.getElementById('messageInput'),
     sendBtn: document.getElementById('sendBtn'),
-    saleBanner: document.getElementById('saleBanner'),
     heroSlider: document.getElementById('heroSlider'),
     prevBtn: document.getElementById('prevBtn'),
     nextBtn: document.getElementById('nextBtn'),
@@ -51,9 +72,9 @@ const elements = {
 
 function init() {
     setupEventListeners();
-    checkFridaySale();
     loadCartFromStorage();
-    filterProducts();
+    syncCartWithServer();
+    initProductGrid();
     initSlider();
     initCartPage();
     setupLocationSelectors();
@@ -93,7 +114,9 @@ function setupEventListeners() {
     if (elements.priceRange) {
         elements.priceRange.addEventListener('input', () => {
             elements.priceValue.textContent = elements.priceRange.value;
-            filterProducts();
+            // Debounce so dragging the slider doesn't fire a request per step
+            clearTimeout(productFilterTimer);
+            productFilterTimer = setTimeout(filterProducts, 200);
         });
     }
     
@@ -107,15 +130,31 @@ function setupEventListeners() {
         elements.clearFilters.addEventListener('click', clearAllFilters);
     }
     
+    if (elements.productContainer) {
+        elements.productContainer.addEventListener('click', (e) => {
+            const button = e.target.closest('.add-to-cart');
+            if (button) {
+                addToCart(parseInt(button.dataset.id), button.dataset.name,
+                          parseInt(button.dataset.price), button.dataset.image);
+            }
+        });
+    }
+    
+    if (elements.loadMoreProducts) {
+        elements.loadMoreProducts.addEventListener('click', () => filterProducts(true));
+    }
+    
     if (elements.chatBtn) {
         elements.chatBtn.addEventListener('click', () => {
             elements.messageBox.style.display = 'block';
+            openSupportChat();
         });
     }
     
     if (elements.closeBtn) {
         elements.closeBtn.addEventListener('click', () => {
             elements.messageBox.style.display = 'none';
+            closeSupportChat();
         });
     }
     
@@ -136,10 +175,16 @@ function toggleMobileMenu() {
     elements.mainNav.classList.toggle('active');
 }
 
-function filterProducts() {
-    if (!elements.priceRange || !elements.products) return;
+function initProductGrid() {
+    if (!elements.productContainer) return;
+    
+    // The first page is rendered by the server
+    productCursor = elements.productContainer.dataset.nextCursor || null;
+}
+
+async function filterProducts(append = false) {
+    if (!elements.priceRange || !elements.productContainer) return;
     
-    const maxPrice = parseInt(elements.priceRange.value);
     const selectedCategories = Array.from(elements.categoryCheckboxes)
         .filter(cb => cb.checked && cb.value !== 'all')
         .map(cb => cb.value);
@@ -147,18 +192,100 @@ function filterProducts() {
     const showAll = document.querySelector('input[name="category"][value="all"]')?.checked || 
                     selectedCategories.length === 0;
     
-    elements.products.forEach(product => {
-        const price = parseInt(product.getAttribute('data-price'));
-        const category = product.getAttribute('data-category');
+    const params = new URLSearchParams({
+        max_price: elements.priceRange.value,
+        limit: PRODUCT_PAGE_SIZE
+    });
+    if (!showAll) {
+        params.set('category', selectedCategories.join(','));
+    }
+    if (append && productCursor) {
+        params.set('cursor', productCursor);
+    }
+    
+    const requestId = ++productRequestId;
+    
+    try {
+        const response = await fetch(`/api/products?${params}`);
+        const result = await response.json();
         
-        const matchesPrice = price <= maxPrice;
-        const matchesCategory = showAll || selectedCategories.includes(category);
+        // A newer filter change has already been issued
+        if (requestId !== productRequestId) return;
         
-        if (matchesPrice && matchesCategory) {
-            product.style.display = 'block';
+        renderProducts(result.products || [], append);
+        productCursor = result.next_cursor;
+        if (elements.loadMoreProducts) {
+            elements.loadMoreProducts.style.display = productCursor ? 'block' : 'none';
+        }
+    } catch (e) {
+        console.log('Unable to load products');
+    }
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+// Thumbnail URLs per image slug, embedded by the page (built assets) or plain /static files
+function productImageUrl(slug) {
+    const image = (window.PRODUCT_IMAGES || {})[slug];
+    return image ? image.src : `/static/images/kirana/${encodeURIComponent(slug)}.jpg`;
+}
+
+function productImageHtml(slug, alt) {
+    const image = (window.PRODUCT_IMAGES || {})[slug];
+    const source = image && image.srcset
+        ? `<source type="image/webp" srcset="${escapeHtml(image.srcset)}" sizes="(max-width: 600px) 50vw, 320px">`
+        : '';
+    return `<picture>${source}<img src="${escapeHtml(productImageUrl(slug))}" alt="${escapeHtml(alt)}" loading="lazy" /></picture>`;
+}
+
+function renderRating(rating) {
+    let stars = '';
+    for (let star = 0; star < 5; star++) {
+        if (rating >= star + 1) {
+            stars += '<i class="fas fa-star"></i>';
+        } else if (rating >= star + 0.5) {
+            stars += '<i class="fas fa-star-half-alt"></i>';
         } else {
-            product.style.display = 'none';
+            stars += '<i class="far fa-star"></i>';
         }
+    }
+    return stars;
+}
+
+function renderProducts(products, append) {
+    if (!append) {
+        elements.productContainer.querySelectorAll('.product').forEach(product => product.remove());
+    }
+    
+    products.forEach(product => {
+        const card = document.createElement('div');
+        card.className = 'product';
+        card.dataset.price = product.price;
+        card.dataset.category = product.category;
+        card.innerHTML = `
+            ${product.badge ? `<div class="badge ${escapeHtml(product.badge.style)}">${escapeHtml(product.badge.label)}</div>` : ''}
+            <div class="product-image">
+                ${productImageHtml(product.image, product.name)}
+            </div>
+            <div class="product-info">
+                <h3>${escapeHtml(product.name)}</h3>
+                <div class="rating">${renderRating(product.rating || 0)}</div>
+                <div class="price">Rs. ${product.price}${product.original_price ? ` <span class="original-price">Rs. ${product.original_price}</span>` : ''}</div>
+                <button class="add-to-cart">
+                    <i class="fas fa-cart-plus"></i> Add to Cart
+                </button>
+            </div>
+        `;
+        const button = card.querySelector('.add-to-cart');
+        button.dataset.id = product.id;
+        button.dataset.name = product.name;
+        button.dataset.price = product.price;
+        button.dataset.image = product.image;
+        elements.productContainer.insertBefore(card, elements.loadMoreProducts);
     });
 }
 
@@ -186,12 +313,6 @@ function clearAllFilters() {
     filterProducts();
 }
 
-function checkFridaySale() {
-    if (today.getDay() === 5 && elements.saleBanner) {
-        elements.saleBanner.style.display = 'block';
-    }
-}
-
 function addToCart(id, name, price, image) {
     const existingItem = cart.find(item => item.id === id);
     
@@ -209,6 +330,7 @@ function addToCart(id, name, price, image) {
     
     updateCartCount();
     saveCartToStorage();
+    sendCartUpdate('POST', '/api/cart/items', { id, qty: 1 });
     showNotification(`${name} added to cart!`);
     
     if (elements.cartCount) {
@@ -232,6 +354,7 @@ function updateQuantity(id, change) {
             saveCartToStorage();
             renderCartPage();
             updateEsewaFields();
+            sendCartUpdate('PUT', `/api/cart/items/${id}`, { qty: item.quantity });
         }
     }
 }
@@ -244,6 +367,7 @@ function removeFromCart(id) {
         saveCartToStorage();
         renderCartPage();
         updateEsewaFields();
+        sendCartUpdate('DELETE', `/api/cart/items/${id}`);
         showNotification(`${item.name} removed from cart`);
     }
 }
@@ -265,6 +389,7 @@ function updateCartCount() {
 }
 
 function saveCartToStorage() {
+    checkoutIdempotencyKey = null;
     try {
         localStorage.setItem('thapaKiranaCart', JSON.stringify(cart));
     } catch (e) {
@@ -284,6 +409,65 @@ function loadCartFromStorage() {
     }
 }
 
+function applyServerCart(result) {
+    if (!result || !result.cart) return;
+    cart = result.cart.map(line => ({
+        id: line.id,
+        name: line.name,
+        price: line.price,
+        image: line.image,
+        quantity: line.qty
+    }));
+    updateCartCount();
+    saveCartToStorage();
+    renderCartPage();
+}
+
+async function fetchCart(method, url, body) {
+    const response = await fetch(url, {
+        method,
+        headers: { 'Content-Type': 'application/json' },
+        body: body ? JSON.stringify(body) : undefined
+    });
+    const result = await response.json();
+    if (!response.ok) throw new Error(result.error || 'Unable to update cart');
+    return result;
+}
+
+function sendCartUpdate(method, url, body) {
+    // The local cart is already updated; apply the server's copy only if no
+    // newer change was sent meanwhile
+    const requestId = ++cartRequestId;
+    cartSync = fetchCart(method, url, body)
+        .then(result => {
+            if (requestId === cartRequestId) applyServerCart(result);
+        })
+        .catch(error => {
+            showNotification(error.message);
+            return syncCartWithServer();
+        });
+    return cartSync;
+}
+
+function syncCartWithServer() {
+    const requestId = ++cartRequestId;
+    cartSync = (async () => {
+        try {
+            let result = await fetchCart('GET', '/api/cart');
+            if (result.cart.length === 0 && cart.length > 0) {
+                // New session: keep the cart this browser built as a guest
+                result = await fetchCart('POST', '/api/cart/merge', {
+                    cart: cart.map(item => ({ id: item.id, qty: item.quantity }))
+                });
+            }
+            if (requestId === cartRequestId) applyServerCart(result);
+        } catch (e) {
+            console.log('Unable to sync cart');
+        }
+    })();
+    return cartSync;
+}
+
 // eSewa Integration Functions
 function generateTransactionUUID() {
     return 'TXN-' + Date.now() + '-' + Math.random().toString(36).substr(2, 9);
@@ -296,45 +480,68 @@ function generateEsewaSignature(totalAmount, transactionUuid, productCode) {
     return signature;
 }
 
-function calculateCartTotals() {
-    const subtotal = cart.reduce((total, item) => total + (item.price * item.quantity), 0);
-    const deliveryCharge = subtotal >= 500 ? 0 : 50;
-    let discount = 0;
-    
-    if (today.getDay() === 5) {
-        discount = Math.round(subtotal * 0.2);
+function getDeliverySpeed() {
+    return document.querySelector('input[name="cartDelivery"]:checked')?.value || 'express';
+}
+
+function updateEsewaFields() {
+    // Totals are computed by the backend; coalesce bursts of cart changes
+    clearTimeout(quoteTimer);
+    quoteTimer = setTimeout(refreshQuote, 100);
+}
+
+async function refreshQuote() {
+    if (cart.length === 0) {
+        renderSummary({ subtotal: 0, product_delivery_charge: 0, discount: 0, total_amount: 0, promotions: [] });
+        return;
     }
     
-    const taxAmount = 0; // No tax for now
-    const serviceCharge = 0; // No service charge
-    const amount = subtotal - discount;
-    const total = amount + deliveryCharge + taxAmount + serviceCharge;
+    const requestId = ++quoteRequestId;
     
-    return {
-        subtotal,
-        deliveryCharge,
-        discount,
-        taxAmount,
-        serviceCharge,
-        amount,
-        total
-    };
+    try {
+        const response = await fetch('/api/delivery/quote', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                cart: cart.map(item => ({ id: item.id, qty: item.quantity })),
+                location: selectedLocation,
+                delivery_speed: getDeliverySpeed(),
+                promo_code: appliedPromoCode
+            })
+        });
+        const result = await response.json();
+        
+        // Ignore responses overtaken by a newer quote
+        if (requestId !== quoteRequestId || !result.totals) return;
+        
+        renderSummary(result.totals);
+    } catch (e) {
+        console.log('Unable to fetch delivery quote');
+    }
 }
 
-function updateEsewaFields() {
-    // This function now just updates the cart UI since eSewa fields are handled by the backend
-    const totals = calculateCartTotals();
-    
-    // Update summary fields if they exist
+function renderSummary(totals) {
     const summarySubtotal = document.getElementById('summarySubtotal');
     const summaryDelivery = document.getElementById('summaryDelivery');
     const summaryDiscount = document.getElementById('summaryDiscount');
     const summaryTotal = document.getElementById('summaryTotal');
+    const discountBadge = document.getElementById('discountBadge');
     
     if (summarySubtotal) summarySubtotal.textContent = `Rs. ${totals.subtotal}`;
-    if (summaryDelivery) summaryDelivery.textContent = `Rs. ${totals.deliveryCharge}`;
+    if (summaryDelivery) summaryDelivery.textContent = `Rs. ${totals.product_delivery_charge}`;
     if (summaryDiscount) summaryDiscount.textContent = `- Rs. ${totals.discount}`;
-    if (summaryTotal) summaryTotal.textContent = `Rs. ${totals.total}`;
+    if (summaryTotal) summaryTotal.textContent = `Rs. ${totals.total_amount}`;
+    
+    appliedPromotions = totals.promotions || [];
+    
+    if (discountBadge) {
+        if (totals.discount > 0 && appliedPromotions.length) {
+            discountBadge.textContent = appliedPromotions.join(' + ');
+            discountBadge.style.display = 'inline-block';
+        } else {
+            discountBadge.style.display = 'none';
+        }
+    }
 }
 
 function validateCheckout() {
@@ -363,25 +570,27 @@ async function proceedToCheckout() {
         // Show loading notification
         showNotification('Preparing payment...');
         
-        const totals = calculateCartTotals();
+        // The backend checks out the session's server-side cart
+        await cartSync;
+        
         const paymentData = {
-            cart: cart.map(item => ({
-                id: item.id,
-                name: item.name,
-                price: item.price,
-                qty: item.quantity,
-                image: item.image
-            })),
             location: selectedLocation,
-            delivery_speed: document.querySelector('input[name="cartDelivery"]:checked')?.value || 'express',
-            promo_code: document.getElementById('promoInput')?.value || ''
+            delivery_speed: getDeliverySpeed(),
+            promo_code: appliedPromoCode
         };
         
+        if (!checkoutIdempotencyKey) {
+            checkoutIdempotencyKey = window.crypto && crypto.randomUUID
+                ? crypto.randomUUID()
+                : `${Date.now()}-${Math.random().toString(36).substr(2, 12)}`;
+        }
+        
         // Call Flask backend to initiate payment
         const response = await fetch('/api/payment/initiate', {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'Idempotency-Key': checkoutIdempotencyKey
             },
             body: JSON.stringify(paymentData)
         });
@@ -435,33 +644,69 @@ function addMessage(text, isUser) {
     
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${isUser ? 'user' : 'admin'}`;
-    messageDiv.innerHTML = `<p>${text}</p>`;
+    const paragraph = document.createElement('p');
+    paragraph.textContent = text;
+    messageDiv.appendChild(paragraph);
     elements.messageContent.appendChild(messageDiv);
     elements.messageContent.scrollTop = elements.messageContent.scrollHeight;
 }
 
-function sendMessage() {
+function showSupportMessages(messages) {
+    // The stream and the POST response may both deliver a message; show it once
+    messages.forEach(message => {
+        if (supportMessageIds.has(message.id)) return;
+        supportMessageIds.add(message.id);
+        addMessage(message.body, message.sender === 'customer');
+    });
+}
+
+async function openSupportChat() {
+    if (supportStream) return;
+    
+    try {
+        // Loads the kept history and starts the session the stream is tied to
+        const response = await fetch('/api/support/messages');
+        const result = await response.json();
+        if (!response.ok) throw new Error(result.error);
+        showSupportMessages(result.messages);
+        
+        // The chat may have been opened (or closed) again while loading
+        if (supportStream || elements.messageBox.style.display === 'none') return;
+        const lastId = result.messages.length ? result.messages[result.messages.length - 1].id : 0;
+        // EventSource reconnects by itself, resuming from the last event id it saw
+        supportStream = new EventSource(`/api/support/messages/stream?after=${lastId}`);
+        supportStream.onmessage = (event) => showSupportMessages([JSON.parse(event.data)]);
+    } catch (e) {
+        console.log('Unable to load support messages');
+    }
+}
+
+function closeSupportChat() {
+    if (supportStream) {
+        supportStream.close();
+        supportStream = null;
+    }
+}
+
+async function sendMessage() {
     if (!elements.messageInput) return;
     
     const message = elements.messageInput.value.trim();
-    if (message) {
-        addMessage(message, true);
-        elements.messageInput.value = '';
-        
-        setTimeout(() => {
-            const responses = [
-                "Thanks for your message! How can I assist you?",
-                "We'll look into your query and get back to you shortly.",
-                "Is there anything specific you'd like to know about our products?",
-                "Our delivery time is usually within 30 minutes for Koteshwor-32.",
-                "We offer free delivery for orders above Rs. 500.",
-                "All our products are fresh and of the highest quality!",
-                "You can track your order status in real-time.",
-                "We accept cash on delivery and online payments."
-            ];
-            const randomResponse = responses[Math.floor(Math.random() * responses.length)];
-            addMessage(randomResponse, false);
-        }, 1000);
+    if (!message) return;
+    elements.messageInput.value = '';
+    
+    try {
+        const response = await fetch('/api/support/messages', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ message })
+        });
+        const result = await response.json();
+        if (!response.ok) throw new Error(result.error || 'Unable to send message');
+        showSupportMessages([result.message]);
+    } catch (error) {
+        elements.messageInput.value = message;
+        showNotification(error.message);
     }
 }
 
@@ -614,11 +859,6 @@ function initCartPage() {
 function renderCartPage() {
     const emptyMessage = document.getElementById('emptyCartMessage');
     const cartItemsList = document.getElementById('cartItemsList');
-    const summarySubtotal = document.getElementById('summarySubtotal');
-    const summaryDelivery = document.getElementById('summaryDelivery');
-    const summaryDiscount = document.getElementById('summaryDiscount');
-    const summaryTotal = document.getElementById('summaryTotal');
-    const discountBadge = document.getElementById('discountBadge');
     const checkoutBtn = document.getElementById('checkoutBtn');
     
     if (!cartItemsList) return;
@@ -640,7 +880,7 @@ function renderCartPage() {
         cartItem.className = 'cart-item-card';
         cartItem.innerHTML = `
             <div class="cart-item-img">
-                <img src="/static/images/kirana/${item.image}.jpg" alt="${item.name}" 
+                <img src="${productImageUrl(item.image)}" alt="${escapeHtml(item.name)}" 
                      onerror="this.src='data:image/svg+xml,%3Csvg xmlns=\\'http://www.w3.org/2000/svg\\' width=\\'100\\' height=\\'100\\'%3E%3Crect fill=\\'%23f0f0f0\\' width=\\'100\\' height=\\'100\\'/%3E%3Ctext x=\\'50%25\\' y=\\'50%25\\' dominant-baseline=\\'middle\\' text-anchor=\\'middle\\' fill=\\'%23999\\' font-size=\\'12\\'%3EProduct%3C/text%3E%3C/svg%3E'" />
             </div>
             <div class="cart-item-details">
@@ -665,23 +905,7 @@ function renderCartPage() {
         cartItemsList.appendChild(cartItem);
     });
     
-    const totals = calculateCartTotals();
-    
-    if (totals.discount > 0) {
-        if (discountBadge) {
-            discountBadge.textContent = '20% OFF';
-            discountBadge.style.display = 'inline-block';
-        }
-    } else {
-        if (discountBadge) {
-            discountBadge.style.display = 'none';
-        }
-    }
-    
-    if (summarySubtotal) summarySubtotal.textContent = `Rs. ${totals.subtotal}`;
-    if (summaryDelivery) summaryDelivery.textContent = `Rs. ${totals.deliveryCharge}`;
-    if (summaryDiscount) summaryDiscount.textContent = `- Rs. ${totals.discount}`;
-    if (summaryTotal) summaryTotal.textContent = `Rs. ${totals.total}`;
+    updateEsewaFields();
     
     // Enable/disable checkout based on location
     if (checkoutBtn) {
@@ -689,18 +913,19 @@ function renderCartPage() {
     }
 }
 
-function applyPromo() {
+async function applyPromo() {
     const promoInput = document.getElementById('promoInput');
     if (!promoInput) return;
     
-    const code = promoInput.value.trim().toUpperCase();
+    appliedPromoCode = promoInput.value.trim().toUpperCase();
+    await refreshQuote();
     
-    if (code === 'SAVE10') {
-        showNotification('Promo code applied! 10% discount added.');
-    } else if (code === 'FREESHIP') {
-        showNotification('Promo code applied! Free shipping added.');
-    } else if (code) {
+    if (appliedPromoCode && appliedPromotions.includes(appliedPromoCode)) {
+        showNotification(`Promo code ${appliedPromoCode} applied!`);
+    } else if (appliedPromoCode) {
         showNotification('Invalid promo code.');
+        appliedPromoCode = '';
+        refreshQuote();
     }
     
     promoInput.value = '';
@@ -716,16 +941,21 @@ function setupLocationSelectors() {
     const confirmLocationBtn = document.getElementById('confirmLocationBtn');
     
     if (districtSelect) {
+        fetch('/api/delivery/areas')
+            .then(response => response.json())
+            .then(result => { deliveryAreas = result.areas || {}; })
+            .catch(() => console.log('Unable to load delivery areas'));
+        
         districtSelect.addEventListener('change', function() {
             const district = this.value;
             areaSelect.innerHTML = '<option value="">Select Area</option>';
             
-            if (district && areas[district]) {
+            if (district && deliveryAreas[district]) {
                 areaSelect.disabled = false;
-                areas[district].forEach(area => {
+                deliveryAreas[district].forEach(area => {
                     const option = document.createElement('option');
-                    option.value = area.toLowerCase().replace(/\s+/g, '-');
-                    option.textContent = area;
+                    option.value = area.value;
+                    option.textContent = area.label;
                     areaSelect.appendChild(option);
                 });
             } else {
@@ -740,6 +970,10 @@ function setupLocationSelectors() {
         areaSelect.addEventListener('change', updateSelectedLocation);
     }
     
+    document.querySelectorAll('input[name="cartDelivery"]').forEach(radio => {
+        radio.addEventListener('change', updateEsewaFields);
+    });
+    
     if (mapBtn) {
         mapBtn.addEventListener('click', () => {
             mapModal.style.display = 'block';
@@ -778,6 +1012,7 @@ function updateSelectedLocation() {
     const area = areaSelect.options[areaSelect.selectedIndex].text;
     
     if (districtSelect.value && areaSelect.value) {
+        selectedLocation.coordinates = null;
         selectedLocation.district = districtSelect.value;
         selectedLocation.area = areaSelect.value;
         selectedLocation.fullAddress = `${area}, ${district}`;
@@ -790,6 +1025,7 @@ function updateSelectedLocation() {
         if (cart && cart.length > 0) {
             checkoutBtn.disabled = false;
         }
+        updateEsewaFields();
     } else {
         selectedLocation.district = '';
         selectedLocation.area = '';
@@ -845,6 +1081,7 @@ function confirmMapLocation() {
         if (cart && cart.length > 0) {
             document.getElementById('checkoutBtn').disabled = false;
         }
+        updateEsewaFields();
         
         showNotification('Location selected successfully!');
     } else {
@@ -0,0 +1,825 @@
+"""
+Order and transaction storage for Thapa Kirana Pasal
+
+Pluggable persistence layer shared by every gunicorn worker. The SQLite
+backend runs in WAL mode behind a small connection pool so readers never
+block the writer; the in-memory backend keeps the original dict behaviour
+and is meant for tests and local experiments only.
+"""
+
+import functools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Iterator, Tuple, Callable
+
+import metrics
+
+# Filters understood by query_orders/iter_orders
+ORDER_FILTERS = ('status', 'district', 'promo_code', 'created_from', 'created_to')
+
+# A cart is a {product_id: qty} map; the updater passed to update_cart returns the new map
+CartItems = Dict[int, int]
+CartUpdater = Callable[[CartItems], CartItems]
+
+# (payload, status_code) of a response stored under an idempotency key
+IdempotentResponse = Tuple[Dict[str, Any], int]
+
+STORE_OPERATION_SECONDS = metrics.histogram(
+    'store_operation_seconds', 'Order store call latency', ('operation',)
+)
+
+
+def timed(operation: str):
+    """Record the latency of a store method in STORE_OPERATION_SECONDS"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                STORE_OPERATION_SECONDS.observe(time.perf_counter() - started, operation)
+        return wrapper
+    return decorate
+
+
+class StoreError(Exception):
+    """Raised when the storage backend cannot complete an operation"""
+
+
+class OrderStore:
+    """Interface implemented by every storage backend"""
+
+    def create_payment(self, order: Dict[str, Any], transaction: Dict[str, Any]) -> None:
+        """Persist a new order together with its eSewa transaction"""
+        raise NotImplementedError
+
+    def get_order(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """Return an order by id, or None"""
+        raise NotImplementedError
+
+    def get_transaction(self, transaction_uuid: str) -> Optional[Dict[str, Any]]:
+        """Return a transaction by its eSewa transaction_uuid, or None"""
+        raise NotImplementedError
+
+    def transaction_statuses(self, transaction_uuids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Look up the status of many transactions in one call
+
+        Returns:
+            transaction_uuid -> {'transaction_uuid', 'order_id', 'status'} for those that exist
+        """
+        raise NotImplementedError
+
+    def update_order(self, order_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Merge fields into an order and return the updated order, or None if missing"""
+        raise NotImplementedError
+
+    def update_transaction(self, transaction_uuid: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Merge fields into a transaction and return it, or None if missing"""
+        raise NotImplementedError
+
+    def update_payment(self, transaction_uuid: str, transaction_fields: Dict[str, Any],
+                       order_fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Atomically update a transaction and the order it belongs to
+
+        Returns:
+            The updated transaction, or None if the transaction does not exist
+        """
+        raise NotImplementedError
+
+    def apply_updates(self, updates: List[Tuple[str, Dict[str, Any], Dict[str, Any]]],
+                      expected_status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Apply many (transaction_uuid, transaction_fields, order_fields) updates in one write
+
+        Args:
+            updates: Payment updates, as for update_payment
+            expected_status: Skip transactions whose current status differs
+                (guards against racing a callback that already settled them)
+
+        Returns:
+            The updated transactions, in the order of updates; missing and
+            skipped transactions are left out, so an empty list means no
+            row changed
+        """
+        raise NotImplementedError
+
+    def redeem_promotion(self, code: str, customer: str, max_redemptions: Optional[int],
+                         per_user_limit: Optional[int]) -> bool:
+        """
+        Atomically count one redemption of a promotion if its caps allow it
+
+        Args:
+            code: Promotion code
+            customer: Customer key the per-user cap applies to
+            max_redemptions: Global cap (None for unlimited)
+            per_user_limit: Per-customer cap (None for unlimited)
+
+        Returns:
+            True if the redemption was recorded, False if a cap was reached
+        """
+        raise NotImplementedError
+
+    def release_promotion(self, code: str, customer: str) -> None:
+        """Give back a redemption recorded by redeem_promotion (e.g. the payment failed)"""
+        raise NotImplementedError
+
+    def pending_transactions(self, older_than: str, after: Optional[Tuple[str, str]] = None,
+                             limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        Return PENDING transactions created before older_than, oldest first
+
+        Args:
+            older_than: ISO-8601 UTC cut-off on created_at (exclusive)
+            after: (created_at, transaction_uuid) of the last row of the previous batch
+            limit: Maximum number of transactions to return
+        """
+        raise NotImplementedError
+
+    def query_orders(self, filters: Optional[Dict[str, Any]] = None,
+                     after: Optional[Tuple[str, str]] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Return one page of orders, newest first, using keyset pagination
+
+        Args:
+            filters: Optional ORDER_FILTERS values; created_from is inclusive,
+                created_to exclusive (ISO-8601 UTC strings)
+            after: (created_at, order_id) of the last order on the previous page
+            limit: Maximum number of orders to return
+
+        Returns:
+            List of order documents
+        """
+        raise NotImplementedError
+
+    def iter_orders(self, filters: Optional[Dict[str, Any]] = None,
+                    batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Yield every matching order, newest first, fetching batch_size rows at a time"""
+        after = None
+        while True:
+            page = self.query_orders(filters, after=after, limit=batch_size)
+            yield from page
+            if len(page) < batch_size:
+                return
+            after = (page[-1]['created_at'], page[-1]['id'])
+
+    def get_cart(self, session_id: str, now: float) -> CartItems:
+        """Return a session's cart, or {} if it has none or it expired before now (epoch seconds)"""
+        raise NotImplementedError
+
+    def update_cart(self, session_id: str, updater: CartUpdater, expires_at: float,
+                    now: float) -> CartItems:
+        """
+        Atomically replace a session's cart with updater(current cart)
+
+        Args:
+            session_id: Cart owner
+            updater: Receives a copy of the current (unexpired) cart and
+                returns the new one; an empty result deletes the cart
+            expires_at: New expiry (epoch seconds)
+            now: Current time, carts that expired before it count as empty
+
+        Returns:
+            The stored cart
+        """
+        raise NotImplementedError
+
+    def purge_carts(self, now: float) -> int:
+        """Delete carts that expired before now and return how many were removed"""
+        raise NotImplementedError
+
+    def claim_idempotency_key(self, key: str, now: float, lease_until: float,
+                              fingerprint: Optional[str] = None) -> Tuple[str, Optional[IdempotentResponse]]:
+        """
+        Atomically claim an idempotency key for the caller, unless it is live
+
+        Args:
+            key: Idempotency key
+            now: Current time (epoch seconds); entries expired before it are replaced
+            lease_until: Expiry of the claim, so a crashed owner cannot hold the key forever
+            fingerprint: Digest of the request body the key is used with
+
+        Returns:
+            ('claimed', None) if the caller now owns the key,
+            ('mismatch', None) if the key is live with another fingerprint,
+            ('pending', None) while another call holds it, or
+            ('done', (payload, status_code)) with the stored response
+        """
+        raise NotImplementedError
+
+    def complete_idempotency_key(self, key: str, payload: Dict[str, Any], status_code: int,
+                                 expires_at: float, fingerprint: Optional[str] = None) -> None:
+        """Store the response of a claimed key, replayed until expires_at"""
+        raise NotImplementedError
+
+    def release_idempotency_key(self, key: str) -> None:
+        """Drop a claimed key without a response (the call failed and may be retried)"""
+        raise NotImplementedError
+
+    def purge_idempotency_keys(self, now: float) -> int:
+        """Delete idempotency keys that expired before now and return how many were removed"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the backend"""
+
+
+class MemoryStore(OrderStore):
+    """Process-local dict backend (test stand-in, not shared between workers)"""
+
+    def __init__(self):
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.transactions: Dict[str, Dict[str, Any]] = {}
+        self.redemptions: Dict[Tuple[str, Optional[str]], int] = {}
+        self.carts: Dict[str, Tuple[float, CartItems]] = {}
+        # key -> (expires_at, fingerprint, response or None while claimed)
+        self.idempotency_keys: Dict[str, Tuple[float, Optional[str], Optional[IdempotentResponse]]] = {}
+        self._lock = threading.RLock()
+
+    def create_payment(self, order, transaction):
+        with self._lock:
+            self.orders[order['id']] = dict(order)
+            self.transactions[transaction['transaction_uuid']] = dict(transaction)
+
+    def get_order(self, order_id):
+        order = self.orders.get(order_id)
+        return dict(order) if order is not None else None
+
+    def get_transaction(self, transaction_uuid):
+        transaction = self.transactions.get(transaction_uuid)
+        return dict(transaction) if transaction is not None else None
+
+    def transaction_statuses(self, transaction_uuids):
+        with self._lock:
+            return {
+                uuid: {'transaction_uuid': uuid, 'order_id': transaction['order_id'], 'status': transaction['status']}
+                for uuid, transaction in ((uuid, self.transactions.get(uuid)) for uuid in transaction_uuids)
+                if transaction is not None
+            }
+
+    def update_order(self, order_id, fields):
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return None
+            order.update(fields)
+            return dict(order)
+
+    def update_transaction(self, transaction_uuid, fields):
+        with self._lock:
+            transaction = self.transactions.get(transaction_uuid)
+            if transaction is None:
+                return None
+            transaction.update(fields)
+            return dict(transaction)
+
+    def update_payment(self, transaction_uuid, transaction_fields, order_fields):
+        with self._lock:
+            transaction = self.update_transaction(transaction_uuid, transaction_fields)
+            if transaction is not None and order_fields:
+                self.update_order(transaction['order_id'], order_fields)
+            return transaction
+
+    def apply_updates(self, updates, expected_status=None):
+        applied = []
+        with self._lock:
+            for transaction_uuid, transaction_fields, order_fields in updates:
+                current = self.transactions.get(transaction_uuid)
+                if current is None or (expected_status and current['status'] != expected_status):
+                    continue
+                applied.append(self.update_payment(transaction_uuid, transaction_fields, order_fields))
+        return applied
+
+    def redeem_promotion(self, code, customer, max_redemptions, per_user_limit):
+        with self._lock:
+            total = self.redemptions.get((code, None), 0)
+            used = self.redemptions.get((code, customer), 0)
+            if max_redemptions is not None and total >= max_redemptions:
+                return False
+            if per_user_limit is not None and used >= per_user_limit:
+                return False
+            self.redemptions[(code, None)] = total + 1
+            self.redemptions[(code, customer)] = used + 1
+            return True
+
+    def release_promotion(self, code, customer):
+        with self._lock:
+            for key in ((code, None), (code, customer)):
+                if self.redemptions.get(key, 0) > 0:
+                    self.redemptions[key] -= 1
+
+    def pending_transactions(self, older_than, after=None, limit=500):
+        with self._lock:
+            selected = [
+                dict(transaction) for transaction in self.transactions.values()
+                if transaction['status'] == 'PENDING' and transaction['created_at'] < older_than
+                and (not after or (transaction['created_at'], transaction['transaction_uuid']) > tuple(after))
+            ]
+        selected.sort(key=lambda transaction: (transaction['created_at'], transaction['transaction_uuid']))
+        return selected[:limit]
+
+    def query_orders(self, filters=None, after=None, limit=50):
+        filters = filters or {}
+
+        def matches(order):
+            if filters.get('status') and order['status'] != filters['status']:
+                return False
+            if filters.get('district') and (order.get('location') or {}).get('district') != filters['district']:
+                return False
+            if filters.get('promo_code') and order.get('promo_code') != filters['promo_code']:
+                return False
+            if filters.get('created_from') and order['created_at'] < filters['created_from']:
+                return False
+            if filters.get('created_to') and order['created_at'] >= filters['created_to']:
+                return False
+            if after and (order['created_at'], order['id']) >= tuple(after):
+                return False
+            return True
+
+        with self._lock:
+            selected = [dict(order) for order in self.orders.values() if matches(order)]
+        selected.sort(key=lambda order: (order['created_at'], order['id']), reverse=True)
+        return selected[:limit]
+
+    def get_cart(self, session_id, now):
+        entry = self.carts.get(session_id)
+        return dict(entry[1]) if entry is not None and entry[0] > now else {}
+
+    def update_cart(self, session_id, updater, expires_at, now):
+        with self._lock:
+            items = {product_id: qty for product_id, qty in updater(self.get_cart(session_id, now)).items() if qty > 0}
+            if items:
+                self.carts[session_id] = (expires_at, items)
+            else:
+                self.carts.pop(session_id, None)
+            return dict(items)
+
+    def purge_carts(self, now):
+        with self._lock:
+            expired = [session_id for session_id, (expires_at, _) in self.carts.items() if expires_at <= now]
+            for session_id in expired:
+                del self.carts[session_id]
+            return len(expired)
+
+    def claim_idempotency_key(self, key, now, lease_until, fingerprint=None):
+        with self._lock:
+            entry = self.idempotency_keys.get(key)
+            if entry is not None and entry[0] > now:
+                if entry[1] != fingerprint:
+                    return 'mismatch', None
+                return ('pending', None) if entry[2] is None else ('done', entry[2])
+            self.idempotency_keys[key] = (lease_until, fingerprint, None)
+            return 'claimed', None
+
+    def complete_idempotency_key(self, key, payload, status_code, expires_at, fingerprint=None):
+        with self._lock:
+            self.idempotency_keys[key] = (expires_at, fingerprint, (payload, status_code))
+
+    def release_idempotency_key(self, key):
+        with self._lock:
+            self.idempotency_keys.pop(key, None)
+
+    def purge_idempotency_keys(self, now):
+        with self._lock:
+            expired = [key for key, (expires_at, _, _) in self.idempotency_keys.items() if expires_at <= now]
+            for key in expired:
+                del self.idempotency_keys[key]
+            return len(expired)
+
+
+class SQLiteConnectionPool:
+    """Bounded pool of SQLite connections shared by the threads of one process"""
+
+    def __init__(self, path: str, size: int = 8, timeout: float = 5.0):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._inherited: List[sqlite3.Connection] = []
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self) -> None:
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=self.size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _after_fork(self) -> None:
+        # A SQLite connection must not be used across fork (e.g. gunicorn preload_app).
+        # Keep the parent's connections referenced but unused: closing them here
+        # could release locks or checkpoint the WAL on behalf of the parent.
+        while True:
+            try:
+                self._inherited.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        self._reset()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: we issue BEGIN/COMMIT ourselves
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.timeout * 1000)}')
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise StoreError('Timed out waiting for a database connection')
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id         TEXT PRIMARY KEY,
+    transaction_uuid TEXT NOT NULL,
+    status           TEXT NOT NULL,
+    created_at       TEXT NOT NULL,
+    data             TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_transaction_uuid ON orders (transaction_uuid);
+CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status, created_at, order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at, order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_district ON orders (json_extract(data, '$.location.district'), created_at, order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_promo_code ON orders (json_extract(data, '$.promo_code'), created_at, order_id);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_uuid TEXT PRIMARY KEY,
+    order_id         TEXT NOT NULL,
+    status           TEXT NOT NULL,
+    created_at       TEXT NOT NULL,
+    data             TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_order_id ON transactions (order_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions (status, created_at, transaction_uuid);
+
+CREATE TABLE IF NOT EXISTS promotion_redemptions (
+    code     TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    count    INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (code, customer)
+);
+
+CREATE TABLE IF NOT EXISTS carts (
+    session_id TEXT PRIMARY KEY,
+    items      TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_carts_expires_at ON carts (expires_at);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key         TEXT PRIMARY KEY,
+    fingerprint TEXT,
+    response    TEXT,
+    expires_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys (expires_at);
+"""
+
+
+def _encode_cart(items: CartItems) -> str:
+    # {"12":2,"5":1}: ids and quantities only, names and prices come from the catalog
+    return json.dumps({str(product_id): qty for product_id, qty in items.items()}, separators=(',', ':'))
+
+
+def _decode_cart(data: str) -> CartItems:
+    return {int(product_id): qty for product_id, qty in json.loads(data).items()}
+
+
+class SQLiteStore(OrderStore):
+    """
+    SQLite (WAL) backend
+
+    Documents are stored as JSON with the indexed fields (ids, status,
+    created_at) mirrored into real columns, so lookups by any of them are
+    B-tree searches rather than scans.
+    """
+
+    def __init__(self, path: str, pool_size: int = 8, timeout: float = 5.0):
+        self.path = path
+        self.pool = SQLiteConnectionPool(path, size=pool_size, timeout=timeout)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE takes the write lock up front so read-modify-write
+        # sequences cannot interleave between workers
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    @staticmethod
+    def _insert_order(conn: sqlite3.Connection, order: Dict[str, Any]) -> None:
+        conn.execute(
+            'INSERT INTO orders (order_id, transaction_uuid, status, created_at, data) VALUES (?, ?, ?, ?, ?)',
+            (order['id'], order['transaction_uuid'], order['status'], order['created_at'], json.dumps(order))
+        )
+
+    @staticmethod
+    def _insert_transaction(conn: sqlite3.Connection, transaction: Dict[str, Any]) -> None:
+        conn.execute(
+            'INSERT INTO transactions (transaction_uuid, order_id, status, created_at, data) VALUES (?, ?, ?, ?, ?)',
+            (transaction['transaction_uuid'], transaction['order_id'], transaction['status'],
+             transaction['created_at'], json.dumps(transaction))
+        )
+
+    @staticmethod
+    def _merge(conn: sqlite3.Connection, table: str, key_column: str, key: str,
+               fields: Dict[str, Any], expected_status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        row = conn.execute(f'SELECT status, data FROM {table} WHERE {key_column} = ?', (key,)).fetchone()
+        if row is None or (expected_status and row['status'] != expected_status):
+            return None
+        document = json.loads(row['data'])
+        document.update(fields)
+        conn.execute(
+            f'UPDATE {table} SET status = ?, data = ? WHERE {key_column} = ?',
+            (document['status'], json.dumps(document), key)
+        )
+        return document
+
+    def _fetch(self, sql: str, params: tuple) -> Optional[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            row = conn.execute(sql, params).fetchone()
+        return json.loads(row['data']) if row is not None else None
+
+    @timed('create_payment')
+    def create_payment(self, order, transaction):
+        with self._write() as conn:
+            self._insert_order(conn, order)
+            self._insert_transaction(conn, transaction)
+
+    @timed('get_order')
+    def get_order(self, order_id):
+        return self._fetch('SELECT data FROM orders WHERE order_id = ?', (order_id,))
+
+    @timed('get_transaction')
+    def get_transaction(self, transaction_uuid):
+        return self._fetch('SELECT data FROM transactions WHERE transaction_uuid = ?', (transaction_uuid,))
+
+    @timed('transaction_statuses')
+    def transaction_statuses(self, transaction_uuids):
+        statuses = {}
+        uuids = list(transaction_uuids)
+        with self.pool.connection() as conn:
+            # Reads the indexed columns only; stays under SQLite's bound-parameter limit
+            for start in range(0, len(uuids), 500):
+                chunk = uuids[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT transaction_uuid, order_id, status FROM transactions "
+                    f"WHERE transaction_uuid IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for row in rows:
+                    statuses[row['transaction_uuid']] = dict(row)
+        return statuses
+
+    @timed('update_order')
+    def update_order(self, order_id, fields):
+        with self._write() as conn:
+            return self._merge(conn, 'orders', 'order_id', order_id, fields)
+
+    @timed('update_transaction')
+    def update_transaction(self, transaction_uuid, fields):
+        with self._write() as conn:
+            return self._merge(conn, 'transactions', 'transaction_uuid', transaction_uuid, fields)
+
+    @timed('update_payment')
+    def update_payment(self, transaction_uuid, transaction_fields, order_fields):
+        with self._write() as conn:
+            transaction = self._merge(conn, 'transactions', 'transaction_uuid', transaction_uuid,
+                                      transaction_fields)
+            if transaction is not None and order_fields:
+                self._merge(conn, 'orders', 'order_id', transaction['order_id'], order_fields)
+            return transaction
+
+    @timed('apply_updates')
+    def apply_updates(self, updates, expected_status=None):
+        applied = []
+        with self._write() as conn:
+            for transaction_uuid, transaction_fields, order_fields in updates:
+                transaction = self._merge(conn, 'transactions', 'transaction_uuid', transaction_uuid,
+                                          transaction_fields, expected_status)
+                if transaction is None:
+                    continue
+                if order_fields:
+                    self._merge(conn, 'orders', 'order_id', transaction['order_id'], order_fields)
+                applied.append(transaction)
+        return applied
+
+    @timed('redeem_promotion')
+    def redeem_promotion(self, code, customer, max_redemptions, per_user_limit):
+        # '' is the global counter row; customer rows hold per-user counts
+        with self._write() as conn:
+            rows = dict(conn.execute(
+                'SELECT customer, count FROM promotion_redemptions WHERE code = ? AND customer IN (?, ?)',
+                (code, '', customer)
+            ).fetchall())
+            if max_redemptions is not None and rows.get('', 0) >= max_redemptions:
+                return False
+            if per_user_limit is not None and rows.get(customer, 0) >= per_user_limit:
+                return False
+            conn.executemany(
+                'INSERT INTO promotion_redemptions (code, customer, count) VALUES (?, ?, 1) '
+                'ON CONFLICT (code, customer) DO UPDATE SET count = count + 1',
+                [(code, ''), (code, customer)]
+            )
+            return True
+
+    @timed('release_promotion')
+    def release_promotion(self, code, customer):
+        with self._write() as conn:
+            conn.execute(
+                'UPDATE promotion_redemptions SET count = count - 1 '
+                'WHERE code = ? AND customer IN (?, ?) AND count > 0',
+                (code, '', customer)
+            )
+
+    @timed('pending_transactions')
+    def pending_transactions(self, older_than, after=None, limit=500):
+        sql = "SELECT data FROM transactions WHERE status = 'PENDING' AND created_at < ?"
+        params: List[Any] = [older_than]
+        if after:
+            sql += ' AND (created_at, transaction_uuid) > (?, ?)'
+            params.extend(after)
+        sql += ' ORDER BY created_at, transaction_uuid LIMIT ?'
+        params.append(int(limit))
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    @timed('query_orders')
+    def query_orders(self, filters=None, after=None, limit=50):
+        filters = filters or {}
+        clauses = []
+        params: List[Any] = []
+
+        if filters.get('status'):
+            clauses.append('status = ?')
+            params.append(filters['status'])
+        if filters.get('district'):
+            clauses.append("json_extract(data, '$.location.district') = ?")
+            params.append(filters['district'])
+        if filters.get('promo_code'):
+            clauses.append("json_extract(data, '$.promo_code') = ?")
+            params.append(filters['promo_code'])
+        if filters.get('created_from'):
+            clauses.append('created_at >= ?')
+            params.append(filters['created_from'])
+        if filters.get('created_to'):
+            clauses.append('created_at < ?')
+            params.append(filters['created_to'])
+        if after:
+            clauses.append('(created_at, order_id) < (?, ?)')
+            params.extend(after)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        params.append(int(limit))
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f'SELECT data FROM orders {where} ORDER BY created_at DESC, order_id DESC LIMIT ?',
+                params
+            ).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    @timed('get_cart')
+    def get_cart(self, session_id, now):
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT items FROM carts WHERE session_id = ? AND expires_at > ?',
+                               (session_id, now)).fetchone()
+        return _decode_cart(row['items']) if row is not None else {}
+
+    @timed('update_cart')
+    def update_cart(self, session_id, updater, expires_at, now):
+        with self._write() as conn:
+            row = conn.execute('SELECT items FROM carts WHERE session_id = ? AND expires_at > ?',
+                               (session_id, now)).fetchone()
+            current = _decode_cart(row['items']) if row is not None else {}
+            items = {product_id: qty for product_id, qty in updater(current).items() if qty > 0}
+            if items:
+                conn.execute(
+                    'INSERT INTO carts (session_id, items, expires_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT (session_id) DO UPDATE SET items = excluded.items, expires_at = excluded.expires_at',
+                    (session_id, _encode_cart(items), expires_at)
+                )
+            else:
+                conn.execute('DELETE FROM carts WHERE session_id = ?', (session_id,))
+            return items
+
+    @timed('purge_carts')
+    def purge_carts(self, now):
+        with self._write() as conn:
+            return conn.execute('DELETE FROM carts WHERE expires_at <= ?', (now,)).rowcount
+
+    @timed('claim_idempotency_key')
+    def claim_idempotency_key(self, key, now, lease_until, fingerprint=None):
+        # response is NULL while the owner computes it, then JSON [payload, status_code]
+        with self._write() as conn:
+            row = conn.execute('SELECT fingerprint, response FROM idempotency_keys WHERE key = ? AND expires_at > ?',
+                               (key, now)).fetchone()
+            if row is not None:
+                if row['fingerprint'] != fingerprint:
+                    return 'mismatch', None
+                if row['response'] is None:
+                    return 'pending', None
+                payload, status_code = json.loads(row['response'])
+                return 'done', (payload, status_code)
+            conn.execute(
+                'INSERT INTO idempotency_keys (key, fingerprint, response, expires_at) VALUES (?, ?, NULL, ?) '
+                'ON CONFLICT (key) DO UPDATE SET fingerprint = excluded.fingerprint, response = NULL, '
+                'expires_at = excluded.expires_at',
+                (key, fingerprint, lease_until)
+            )
+            return 'claimed', None
+
+    @timed('complete_idempotency_key')
+    def complete_idempotency_key(self, key, payload, status_code, expires_at, fingerprint=None):
+        with self._write() as conn:
+            conn.execute(
+                'INSERT INTO idempotency_keys (key, fingerprint, response, expires_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET fingerprint = excluded.fingerprint, '
+                'response = excluded.response, expires_at = excluded.expires_at',
+                (key, fingerprint, json.dumps([payload, status_code], separators=(',', ':')), expires_at)
+            )
+
+    @timed('release_idempotency_key')
+    def release_idempotency_key(self, key):
+        with self._write() as conn:
+            conn.execute('DELETE FROM idempotency_keys WHERE key = ?', (key,))
+
+    @timed('purge_idempotency_keys')
+    def purge_idempotency_keys(self, now):
+        with self._write() as conn:
+            return conn.execute('DELETE FROM idempotency_keys WHERE expires_at <= ?', (now,)).rowcount
+
+    def close(self):
+        self.pool.close()
+
+
+def create_store(url: str, pool_size: int = 8) -> OrderStore:
+    """
+    Build a storage backend from a DATABASE_URL style string
+
+    Args:
+        url: 'sqlite:///path/to/file.db' or 'memory://'
+        pool_size: Maximum SQLite connections per process
+
+    Returns:
+        Configured OrderStore instance
+    """
+    if url.startswith('memory://'):
+        return MemoryStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):], pool_size=pool_size)
+    raise StoreError(f"Unsupported DATABASE_URL: {url}")
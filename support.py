@@ -0,0 +1,363 @@
+"""
+Customer support chat
+
+Every browser session has one conversation with the shop. A conversation
+keeps only its last `history` messages, like a ring buffer: posting trims
+the oldest. Idle conversations expire, so storage stays bounded however
+many customers write. Messages live in SQLite (shared by all gunicorn
+workers, so a customer and the admin replying may hit different workers)
+or in process memory (tests, single process).
+
+Clients waiting for replies (long-poll or SSE) register a waiter callback
+instead of polling. Posts made in this process wake waiters directly.
+Posts made by other workers are found by one watcher thread per process,
+with a single query per interval for all watched conversations. A waiter
+is only a callback, so an asyncio client (asgi.py) waits on a future and
+holds no thread while idle.
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, List, Callable, Deque
+
+from storage import SQLiteConnectionPool, StoreError
+
+log = logging.getLogger(__name__)
+
+SENDERS = frozenset({'customer', 'admin'})
+
+Message = Dict[str, Any]
+
+
+class SupportError(ValueError):
+    """Raised for empty or oversized messages"""
+
+
+class MessageBackend:
+    """Storage for conversations; ids increase across all conversations"""
+
+    def append(self, conversation_id: str, sender: str, body: str, now: float, keep: int) -> Message:
+        """Add a message, keeping only the conversation's newest keep messages"""
+        raise NotImplementedError
+
+    def since(self, conversation_id: str, after: int, limit: int) -> List[Message]:
+        """Messages of a conversation with id > after, oldest first"""
+        raise NotImplementedError
+
+    def updated_since(self, after: int) -> Dict[str, int]:
+        """conversation_id -> newest message id, for conversations with messages newer than after"""
+        raise NotImplementedError
+
+    def latest_id(self) -> int:
+        """Newest message id (0 if there are none)"""
+        raise NotImplementedError
+
+    def conversations(self, limit: int) -> List[Message]:
+        """Newest message of each conversation, most recently active first"""
+        raise NotImplementedError
+
+    def purge(self, before: float) -> int:
+        """Drop conversations whose last message is older than before; returns how many"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the backend"""
+
+
+class MemoryMessages(MessageBackend):
+    """Process-local conversations, least recently active evicted beyond max_conversations"""
+
+    def __init__(self, max_conversations: int = 10000):
+        self.max_conversations = max_conversations
+        self._conversations: "OrderedDict[str, Deque[Message]]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._latest = 0
+        self._lock = threading.Lock()
+
+    def append(self, conversation_id, sender, body, now, keep):
+        with self._lock:
+            messages = self._conversations.get(conversation_id)
+            if messages is None or messages.maxlen != keep:
+                messages = self._conversations[conversation_id] = deque(messages or (), maxlen=keep)
+            self._latest = next(self._ids)
+            message = {'id': self._latest, 'conversation_id': conversation_id, 'sender': sender,
+                       'body': body, 'created_at': now}
+            messages.append(message)
+            self._conversations.move_to_end(conversation_id)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+            return dict(message)
+
+    def since(self, conversation_id, after, limit):
+        with self._lock:
+            messages = self._conversations.get(conversation_id) or ()
+            return [dict(message) for message in messages if message['id'] > after][:limit]
+
+    def updated_since(self, after):
+        with self._lock:
+            return {conversation_id: messages[-1]['id'] for conversation_id, messages in self._conversations.items()
+                    if messages and messages[-1]['id'] > after}
+
+    def latest_id(self):
+        return self._latest
+
+    def conversations(self, limit):
+        with self._lock:
+            return [dict(messages[-1]) for messages in reversed(self._conversations.values()) if messages][:limit]
+
+    def purge(self, before):
+        with self._lock:
+            expired = [conversation_id for conversation_id, messages in self._conversations.items()
+                       if not messages or messages[-1]['created_at'] < before]
+            for conversation_id in expired:
+                del self._conversations[conversation_id]
+            return len(expired)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS support_messages (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    sender          TEXT NOT NULL,
+    body            TEXT NOT NULL,
+    created_at      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_support_messages_conversation ON support_messages (conversation_id, id);
+"""
+
+_COLUMNS = 'id, conversation_id, sender, body, created_at'
+
+
+class SQLiteMessages(MessageBackend):
+    """
+    Conversations in a SQLite (WAL) file shared by every worker on the host
+
+    Kept apart from the order database so chat writes never queue behind
+    checkout writes.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4, timeout: float = 5.0):
+        self.pool = SQLiteConnectionPool(path, size=pool_size, timeout=timeout)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def append(self, conversation_id, sender, body, now, keep):
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                message_id = conn.execute(
+                    'INSERT INTO support_messages (conversation_id, sender, body, created_at) VALUES (?, ?, ?, ?)',
+                    (conversation_id, sender, body, now)
+                ).lastrowid
+                # Ring buffer: drop everything older than the newest keep messages
+                conn.execute(
+                    'DELETE FROM support_messages WHERE conversation_id = ? AND id <= ('
+                    'SELECT id FROM support_messages WHERE conversation_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                    (conversation_id, conversation_id, keep)
+                )
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        return {'id': message_id, 'conversation_id': conversation_id, 'sender': sender,
+                'body': body, 'created_at': now}
+
+    def since(self, conversation_id, after, limit):
+        with self.pool.connection() as conn:
+            return [dict(row) for row in conn.execute(
+                f'SELECT {_COLUMNS} FROM support_messages WHERE conversation_id = ? AND id > ? ORDER BY id LIMIT ?',
+                (conversation_id, after, limit)
+            )]
+
+    def updated_since(self, after):
+        with self.pool.connection() as conn:
+            return dict(conn.execute(
+                'SELECT conversation_id, MAX(id) FROM support_messages WHERE id > ? GROUP BY conversation_id',
+                (after,)
+            ).fetchall())
+
+    def latest_id(self):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) FROM support_messages').fetchone()[0]
+
+    def conversations(self, limit):
+        with self.pool.connection() as conn:
+            return [dict(row) for row in conn.execute(
+                f'SELECT {_COLUMNS} FROM support_messages WHERE id IN ('
+                'SELECT MAX(id) FROM support_messages GROUP BY conversation_id) ORDER BY id DESC LIMIT ?',
+                (limit,)
+            )]
+
+    def purge(self, before):
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            removed = conn.execute(
+                'DELETE FROM support_messages WHERE conversation_id IN ('
+                'SELECT conversation_id FROM support_messages GROUP BY conversation_id HAVING MAX(created_at) < ?)',
+                (before,)
+            ).rowcount
+            conn.execute('COMMIT')
+        return removed
+
+    def close(self):
+        self.pool.close()
+
+
+def create_messages(url: str) -> MessageBackend:
+    """
+    Build a message backend from a DATABASE_URL style string
+
+    Args:
+        url: 'sqlite:///path/to/file.db' or 'memory://'
+    """
+    if url.startswith('memory://'):
+        return MemoryMessages()
+    if url.startswith('sqlite:///'):
+        return SQLiteMessages(url[len('sqlite:///'):])
+    raise StoreError(f"Unsupported SUPPORT_DATABASE_URL: {url}")
+
+
+class SupportHub:
+    """Posting, reading and waiting for support messages"""
+
+    def __init__(self, backend: MessageBackend, history: int = 50, max_length: int = 1000,
+                 ttl: float = 7 * 24 * 3600, poll_interval: float = 1.0, purge_interval: float = 3600.0):
+        """
+        Args:
+            backend: Message storage
+            history: Messages kept per conversation
+            max_length: Longest accepted message, in characters
+            ttl: Seconds an idle conversation is kept
+            poll_interval: Seconds between checks for messages posted by other processes
+            purge_interval: Minimum seconds between purges of idle conversations
+        """
+        self.backend = backend
+        self.history = history
+        self.max_length = max_length
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.purge_interval = purge_interval
+        self._waiters: Dict[str, Dict[int, Callable[[], None]]] = {}
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._next_purge = 0.0
+
+    def post(self, conversation_id: str, sender: str, body: Any) -> Message:
+        """
+        Add a message to a conversation and wake its waiters
+
+        Raises:
+            SupportError: Empty, oversized or non-text message
+        """
+        if sender not in SENDERS:
+            raise SupportError(f"Unknown sender: {sender}")
+        if not isinstance(body, str) or not body.strip():
+            raise SupportError('Message must not be empty')
+        body = body.strip()
+        if len(body) > self.max_length:
+            raise SupportError(f"Message is longer than {self.max_length} characters")
+
+        now = time.time()
+        message = self.backend.append(conversation_id, sender, body, now, self.history)
+        self._wake(conversation_id)
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            try:
+                removed = self.backend.purge(now - self.ttl)
+                if removed:
+                    log.info(f"Purged {removed} idle support messages")
+            except Exception as e:
+                log.warning(f"Support purge failed: {str(e)}")
+        return message
+
+    def messages(self, conversation_id: str, after: int = 0) -> List[Message]:
+        """Messages of a conversation newer than the id after, oldest first"""
+        return self.backend.since(conversation_id, after, self.history)
+
+    def conversations(self, limit: int = 50) -> List[Message]:
+        """Latest message of the most recently active conversations"""
+        return self.backend.conversations(limit)
+
+    def add_waiter(self, conversation_id: str, wake: Callable[[], None]) -> int:
+        """Call wake (from any thread) when the conversation may have new messages; returns a token"""
+        token = next(self._tokens)
+        with self._lock:
+            self._waiters.setdefault(conversation_id, {})[token] = wake
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch, name='support-watcher', daemon=True)
+                self._watcher.start()
+        return token
+
+    def remove_waiter(self, conversation_id: str, token: int) -> None:
+        with self._lock:
+            waiters = self._waiters.get(conversation_id)
+            if waiters is not None:
+                waiters.pop(token, None)
+                if not waiters:
+                    del self._waiters[conversation_id]
+
+    @property
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+    def wait(self, conversation_id: str, after: int, timeout: float) -> List[Message]:
+        """Block until the conversation has messages newer than after, or timeout; [] on timeout"""
+        event = threading.Event()
+        # Register before reading so a message posted in between still wakes us
+        token = self.add_waiter(conversation_id, event.set)
+        try:
+            messages = self.messages(conversation_id, after)
+            if messages or not event.wait(timeout):
+                return messages
+            return self.messages(conversation_id, after)
+        finally:
+            self.remove_waiter(conversation_id, token)
+
+    async def wait_async(self, conversation_id: str, after: int, timeout: float) -> List[Message]:
+        """wait() for asyncio: the coroutine holds no thread while the conversation is idle"""
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+
+        token = self.add_waiter(conversation_id, wake)
+        try:
+            messages = await asyncio.to_thread(self.messages, conversation_id, after)
+            if messages:
+                return messages
+            try:
+                await asyncio.wait_for(woken, timeout)
+            except asyncio.TimeoutError:
+                return []
+            return await asyncio.to_thread(self.messages, conversation_id, after)
+        finally:
+            self.remove_waiter(conversation_id, token)
+
+    def _wake(self, conversation_id: str) -> None:
+        with self._lock:
+            waiters = list((self._waiters.get(conversation_id) or {}).values())
+        for wake in waiters:
+            wake()
+
+    def _watch(self) -> None:
+        seen = self.backend.latest_id()
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self._waiters:
+                    continue
+            try:
+                updated = self.backend.updated_since(seen)
+            except Exception as e:
+                log.warning(f"Support watcher poll failed: {str(e)}")
+                continue
+            for conversation_id, latest in updated.items():
+                seen = max(seen, latest)
+                self._wake(conversation_id)
@@ -0,0 +1,31 @@
+"""Test configuration: in-process backends so importing app touches no files"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+for name, value in {
+    'DATABASE_URL': 'memory://',
+    'ANALYTICS_DATABASE_URL': 'memory://',
+    'SUPPORT_DATABASE_URL': 'memory://',
+    'RATE_LIMIT_STORAGE': 'memory://',
+    # Every test client shares one address
+    'RATE_LIMIT_INITIATE': 'off',
+    'JOURNAL_DIR': 'off',
+    'ESEWA_ENV': 'test',
+    'LOG_LEVEL': 'WARNING'
+}.items():
+    os.environ[name] = value
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    """An empty order store of each backend"""
+    from storage import MemoryStore, SQLiteStore
+    store = MemoryStore() if request.param == 'memory' else SQLiteStore(str(tmp_path / 'orders.db'))
+    yield store
+    store.close()
@@ -0,0 +1,109 @@
+import pytest
+
+from analytics import AnalyticsError, MemoryRollups, SalesAnalytics, SQLiteRollups
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def analytics(request, tmp_path):
+    backend = MemoryRollups() if request.param == 'memory' else SQLiteRollups(str(tmp_path / 'analytics.db'))
+    yield SalesAnalytics(backend)
+    backend.close()
+
+
+def order(order_id, status, total, day='2025-06-01', district='kathmandu', promotions=(), discount=0, cart=None):
+    return {
+        'id': order_id,
+        'status': status,
+        'created_at': f'{day}T10:00:00+00:00',
+        'total_amount': total,
+        'discount': discount,
+        'location': {'district': district},
+        'delivery_speed': 'standard',
+        'promotions': list(promotions),
+        'cart': cart or [{'id': 1, 'qty': 2, 'price': total / 2}]
+    }
+
+
+def test_revenue_counts_paid_orders_only(analytics):
+    analytics.record([
+        order('ORD1', 'PAID', 200),
+        order('ORD2', 'PAID', 100, district='lalitpur'),
+        order('ORD3', 'PAYMENT_FAILED', 500),
+        order('ORD4', 'PENDING', 700),
+    ])
+
+    assert analytics.revenue() == [{'day': '2025-06-01', 'orders': 2, 'units': 4, 'revenue': 300.0,
+                                     'discount': 0.0, 'average_order_value': 150.0}]
+    assert [(row['district'], row['revenue']) for row in analytics.revenue(by='district')] == [
+        ('kathmandu', 200.0), ('lalitpur', 100.0)
+    ]
+
+
+def test_status_change_moves_the_order_between_totals(analytics):
+    analytics.record([order('ORD1', 'PENDING', 200)])
+    assert analytics.revenue() == [{'day': '2025-06-01', 'orders': 0, 'units': 0, 'revenue': 0.0,
+                                     'discount': 0.0, 'average_order_value': None}]
+
+    analytics.record([order('ORD1', 'PAID', 200)])
+    assert analytics.revenue()[0]['revenue'] == 200.0
+    assert analytics.failures()[0]['pending'] == 0
+
+    analytics.record([order('ORD1', 'REFUNDED', 200)])
+    assert analytics.revenue()[0]['revenue'] == 0.0
+    assert analytics.failures()[0]['orders'] == 1
+
+
+def test_recording_the_same_order_twice_does_not_double_count(analytics):
+    paid = order('ORD1', 'PAID', 200)
+
+    assert analytics.record([paid]) == 1
+    assert analytics.record([paid]) == 0
+    assert analytics.backfill([paid, order('ORD2', 'PAID', 100)], batch_size=1) == {'orders': 2, 'changed': 1}
+
+    assert analytics.revenue()[0]['orders'] == 2
+    assert analytics.revenue()[0]['revenue'] == 300.0
+
+
+def test_failure_rate_excludes_pending_orders(analytics):
+    analytics.record([
+        order('ORD1', 'PAID', 100),
+        order('ORD2', 'PAYMENT_FAILED', 100),
+        order('ORD3', 'PAYMENT_FAILED', 100),
+        order('ORD4', 'PENDING', 100),
+    ])
+
+    row, = analytics.failures()
+    assert (row['orders'], row['paid'], row['failed'], row['pending']) == (4, 1, 2, 1)
+    assert row['failure_rate'] == pytest.approx(2 / 3, abs=1e-3)
+
+
+def test_promotion_and_product_totals(analytics):
+    analytics.record([
+        order('ORD1', 'PAID', 180, promotions=['thapa10'], discount=20,
+              cart=[{'id': 1, 'qty': 1, 'price': 100}, {'id': 2, 'qty': 1, 'price': 100}]),
+        order('ORD2', 'PAYMENT_FAILED', 90, promotions=['THAPA10'], discount=10,
+              cart=[{'id': 1, 'qty': 1, 'price': 100}]),
+        order('ORD3', 'PAID', 300, cart=[{'id': 2, 'qty': 3, 'price': 100}]),
+    ])
+
+    promo, = analytics.promotions()
+    assert (promo['promo'], promo['orders'], promo['paid'], promo['revenue'], promo['discount']) == (
+        'THAPA10', 2, 1, 180.0, 20.0
+    )
+    assert promo['share_of_orders'] == pytest.approx(2 / 3, abs=1e-3)
+    assert [(row['product_id'], row['units'], row['revenue']) for row in analytics.top_products()] == [
+        (2, 4, 400.0), (1, 1, 100.0)
+    ]
+
+
+def test_days_are_filtered_inclusively(analytics):
+    analytics.record([order(f'ORD{day}', 'PAID', 100, day=f'2025-06-0{day}') for day in (1, 2, 3)])
+
+    assert [row['day'] for row in analytics.revenue(day_from='2025-06-02', day_to='2025-06-03')] == [
+        '2025-06-02', '2025-06-03'
+    ]
+
+
+def test_unknown_dimension_is_rejected(analytics):
+    with pytest.raises(AnalyticsError):
+        analytics.revenue(by='colour')
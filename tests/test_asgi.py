@@ -0,0 +1,36 @@
+import pytest
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import asgi
+
+
+def proxy_fix_address(trusted, peer, forwarded):
+    seen = {}
+
+    def wsgi_app(environ, start_response):
+        seen['address'] = environ['REMOTE_ADDR']
+        return []
+
+    environ = {'REMOTE_ADDR': peer}
+    if forwarded is not None:
+        environ['HTTP_X_FORWARDED_FOR'] = forwarded
+    ProxyFix(wsgi_app, x_for=trusted)(environ, lambda *args: None)
+    return seen['address']
+
+
+@pytest.mark.parametrize('trusted', [1, 2])
+@pytest.mark.parametrize('forwarded', [None, '203.0.113.7', '198.51.100.1, 203.0.113.7',
+                                       '6.6.6.6, 198.51.100.1, 203.0.113.7'])
+def test_client_address_matches_proxy_fix(monkeypatch, trusted, forwarded):
+    monkeypatch.setattr(asgi, 'TRUSTED_PROXY_COUNT', trusted)
+    headers = [] if forwarded is None else [(b'x-forwarded-for', forwarded.encode())]
+    scope = {'client': ('10.0.0.2', 51000), 'headers': headers}
+
+    assert asgi._client_address(scope) == proxy_fix_address(trusted, '10.0.0.2', forwarded)
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(asgi, 'TRUSTED_PROXY_COUNT', 0)
+    scope = {'client': ('10.0.0.2', 51000), 'headers': [(b'x-forwarded-for', b'203.0.113.7')]}
+
+    assert asgi._client_address(scope) == '10.0.0.2'
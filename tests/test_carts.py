@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from carts import CartError, CartService
+from catalog import Catalog
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return Catalog.load(os.path.join(ROOT, 'data', 'products.json'))
+
+
+@pytest.fixture
+def carts(store, catalog):
+    return CartService(store, catalog, max_lines=3, max_qty=10)
+
+
+def test_merge_keeps_the_larger_quantity(carts):
+    carts.add('s1', 1, 2)
+    carts.add('s1', 2, 5)
+
+    items = carts.merge('s1', [{'id': 1, 'qty': 4}, {'id': 2, 'qty': 1}, {'id': 3, 'qty': 1}])
+
+    assert items == {1: 4, 2: 5, 3: 1}
+    assert carts.items('s1') == items
+
+
+def test_merging_the_same_browser_cart_twice_does_not_double_it(carts):
+    browser_cart = [{'id': 1, 'qty': 2}, {'id': 2, 'quantity': 3}]
+
+    carts.merge('s1', browser_cart)
+    assert carts.merge('s1', browser_cart) == {1: 2, 2: 3}
+
+
+def test_merge_skips_invalid_lines_and_caps_quantities(carts):
+    items = carts.merge('s1', [
+        {'id': 1, 'qty': 50},
+        {'id': 999999, 'qty': 1},
+        {'id': 2, 'qty': 0},
+        {'id': 3, 'qty': '2'},
+        'not a line',
+    ])
+
+    assert items == {1: 10}
+
+
+def test_merge_into_a_full_cart_is_refused(carts):
+    carts.merge('s1', [{'id': 1}, {'id': 2}, {'id': 3}])
+
+    with pytest.raises(CartError):
+        carts.merge('s1', [{'id': 4, 'qty': 1}])
+    assert carts.items('s1') == {1: 1, 2: 1, 3: 1}
+
+
+def test_carts_of_other_sessions_are_untouched(carts):
+    carts.add('s1', 1, 2)
+
+    carts.merge('s2', [{'id': 1, 'qty': 7}])
+
+    assert carts.items('s1') == {1: 2}
+    assert carts.items('s2') == {1: 7}
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+import app as shop
+from delivery import DeliveryPricer, DeliveryPricingError
+
+
+@pytest.fixture(scope='module')
+def pricer():
+    return DeliveryPricer.load(os.path.join(shop.app.root_path, 'data', 'delivery_zones.json'))
+
+
+@pytest.mark.parametrize('coordinates', [
+    {'lat': 'nan', 'lng': 85.3},
+    {'lat': 27.7, 'lng': 'inf'},
+    {'lat': 1e308, 'lng': 85.3},
+    {'lat': -1e308, 'lng': -1e308},
+    {'lat': 91, 'lng': 85.3},
+    {'lat': 27.7, 'lng': -180.5},
+    {'lat': 27.7},
+    {'lat': 'north', 'lng': 85.3},
+])
+def test_quote_rejects_invalid_coordinates(pricer, coordinates):
+    with pytest.raises(DeliveryPricingError):
+        pricer.quote('kathmandu', speed='standard', coordinates=coordinates)
+
+
+def test_zone_lookup_ignores_non_finite_points(pricer):
+    assert pricer.zone_for(float('nan'), 85.3) is None
+    assert pricer.zone_for(1e308, 1e308) is None
+
+
+def test_quote_accepts_coordinates_outside_every_zone(pricer):
+    assert pricer.quote(speed='standard', coordinates={'lat': 0, 'lng': 0})['district'] == 'custom'
+
+
+def test_initiate_rejects_non_finite_coordinates():
+    response = shop.app.test_client().post('/api/payment/initiate', json={
+        'cart': [{'id': 1, 'qty': 1}],
+        'location': {'district': 'kathmandu', 'coordinates': {'lat': 'nan', 'lng': 85.3}}
+    })
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('district, area, speed', [
+    (['kathmandu'], None, 'standard'),
+    ('kathmandu', {'name': 'koteshwor'}, 'standard'),
+    ('kathmandu', 'koteshwor', ['express']),
+    (27, None, 'standard'),
+])
+def test_quote_rejects_non_string_location_fields(pricer, district, area, speed):
+    with pytest.raises(DeliveryPricingError):
+        pricer.quote(district, area, speed)
+
+
+def test_initiate_rejects_a_list_as_area():
+    response = shop.app.test_client().post('/api/payment/initiate', json={
+        'cart': [{'id': 1, 'qty': 1}],
+        'location': {'district': 'kathmandu', 'area': ['koteshwor']}
+    })
+
+    assert response.status_code == 400
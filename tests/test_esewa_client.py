@@ -0,0 +1,201 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from esewa_client import (AsyncEsewaClient, CircuitBreaker, CircuitOpenError, EsewaClient,
+                          EsewaResponseError, EsewaUnavailable)
+
+
+class Stub:
+    """Local status API; answers with the queued (status code, delay) replies, then 200 COMPLETE"""
+
+    def __init__(self):
+        self.replies = []
+        self.requests = 0
+        self.peers = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is visible
+
+            def do_GET(self):
+                stub.requests += 1
+                stub.peers.add(self.client_address)
+                status, delay = stub.replies.pop(0) if stub.replies else (200, 0)
+                time.sleep(delay)
+                body = json.dumps({'status': 'COMPLETE' if status == 200 else 'ERROR'}).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    pass  # the client already timed out
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/epay/transaction/status/"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+
+@pytest.fixture
+def stub():
+    stub = Stub()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+def make_client(stub, **options):
+    settings = {'read_timeout': 0.5, 'max_retries': 2, 'backoff_base': 0.01, 'backoff_max': 0.02}
+    settings.update(options)
+    return EsewaClient(stub.url, **settings)
+
+
+def test_retries_retryable_status_codes(stub):
+    stub.replies = [(503, 0), (502, 0)]
+    client = make_client(stub)
+
+    assert client.check_status('EPAYTEST', '100', 'THAPA-1') == {'status': 'COMPLETE'}
+    assert stub.requests == 3
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_gives_up_after_retries(stub):
+    stub.replies = [(503, 0)] * 3
+    client = make_client(stub)
+
+    with pytest.raises(EsewaUnavailable):
+        client.check_status('EPAYTEST', '100', 'THAPA-1')
+    assert stub.requests == 3
+
+
+def test_read_timeout_is_retried(stub):
+    stub.replies = [(200, 0.5)]
+    client = make_client(stub, read_timeout=0.1)
+
+    started = time.monotonic()
+    assert client.check_status('EPAYTEST', '100', 'THAPA-1') == {'status': 'COMPLETE'}
+    assert time.monotonic() - started < 0.5
+    assert stub.requests == 2
+
+
+def test_client_errors_are_not_retried(stub):
+    stub.replies = [(400, 0)]
+    client = make_client(stub)
+
+    with pytest.raises(EsewaResponseError) as error:
+        client.check_status('EPAYTEST', '100', 'THAPA-1')
+    assert error.value.status_code == 400
+    assert stub.requests == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_connections_are_reused(stub):
+    client = make_client(stub)
+
+    for _ in range(5):
+        client.check_status('EPAYTEST', '100', 'THAPA-1')
+    assert stub.requests == 5
+    assert len(stub.peers) == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_child_does_not_share_pooled_connections(stub):
+    client = make_client(stub)
+    client.check_status('EPAYTEST', '100', 'THAPA-1')
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            client.check_status('EPAYTEST', '100', 'THAPA-2')
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    client.check_status('EPAYTEST', '100', 'THAPA-3')
+
+    assert stub.requests == 3
+    # The child opened its own connection; the parent kept using its one
+    assert len(stub.peers) == 2
+
+
+def test_breaker_opens_and_recovers(stub):
+    stub.replies = [(503, 0)] * 2
+    client = make_client(stub, max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+
+    for _ in range(2):
+        with pytest.raises(EsewaUnavailable):
+            client.check_status('EPAYTEST', '100', 'THAPA-1')
+    with pytest.raises(CircuitOpenError):
+        client.check_status('EPAYTEST', '100', 'THAPA-1')
+    assert stub.requests == 2
+
+    time.sleep(0.25)
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    assert client.check_status('EPAYTEST', '100', 'THAPA-1') == {'status': 'COMPLETE'}
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_async_client_retries(stub):
+    pytest.importorskip('httpx')
+    stub.replies = [(503, 0)]
+
+    async def check():
+        client = AsyncEsewaClient(stub.url, read_timeout=0.5, backoff_base=0.01, backoff_max=0.02)
+        try:
+            return await client.check_status('EPAYTEST', '100', 'THAPA-1')
+        finally:
+            await client.close()
+
+    assert asyncio.run(check()) == {'status': 'COMPLETE'}
+    assert stub.requests == 2
+
+
+def open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    return breaker
+
+
+def test_unexpected_error_in_trial_releases_breaker(stub):
+    class BrokenSession:
+        def get(self, *args, **kwargs):
+            raise RuntimeError('boom')
+
+    breaker = open_breaker()
+    client = EsewaClient(stub.url, breaker=breaker, session=BrokenSession())
+
+    with pytest.raises(RuntimeError):
+        client.check_status('EPAYTEST', '100', 'THAPA-1')
+    assert breaker.allow()
+
+
+def test_cancelled_async_trial_releases_breaker(stub):
+    pytest.importorskip('httpx')
+    stub.replies = [(200, 0.5)]
+    breaker = open_breaker()
+
+    async def cancel_trial():
+        client = AsyncEsewaClient(stub.url, breaker=breaker)
+        try:
+            task = asyncio.ensure_future(client.check_status('EPAYTEST', '100', 'THAPA-1'))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        finally:
+            await client.close()
+
+    asyncio.run(cancel_trial())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
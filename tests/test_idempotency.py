@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from idempotency import IdempotencyCache, request_fingerprint
+
+
+def workers(store, count=2, **options):
+    # One cache per gunicorn worker, sharing the store
+    return [IdempotencyCache(store=store, wait_timeout=2.0, **options) for _ in range(count)]
+
+
+def test_duplicate_on_another_worker_is_replayed(store):
+    first, second = workers(store)
+    calls = []
+
+    def create_order():
+        calls.append(1)
+        return {'order_id': f'ORD{len(calls)}'}, 200
+
+    assert first.run('initiate:c1:k1', create_order) == ({'order_id': 'ORD1'}, 200, False)
+    assert second.run('initiate:c1:k1', create_order) == ({'order_id': 'ORD1'}, 200, True)
+    assert len(calls) == 1
+
+
+def test_concurrent_duplicate_waits_for_the_first_worker(store):
+    first, second = workers(store)
+    started = threading.Event()
+    results = {}
+
+    def slow_order():
+        started.set()
+        time.sleep(0.3)
+        return {'order_id': 'ORD1'}, 200
+
+    thread = threading.Thread(target=lambda: results.setdefault('first', first.run('k', slow_order)))
+    thread.start()
+    started.wait()
+    results['second'] = second.run('k', lambda: pytest.fail('created a second order'))
+    thread.join()
+
+    assert results['first'] == ({'order_id': 'ORD1'}, 200, False)
+    assert results['second'] == ({'order_id': 'ORD1'}, 200, True)
+
+
+def test_failed_attempt_can_be_retried_on_another_worker(store):
+    first, second = workers(store)
+
+    assert first.run('k', lambda: ({'error': 'Cart is empty'}, 400))[1] == 400
+    assert second.run('k', lambda: ({'order_id': 'ORD2'}, 200)) == ({'order_id': 'ORD2'}, 200, False)
+
+
+def test_duplicate_gets_409_while_the_first_call_runs_too_long(store):
+    first, second = workers(store)
+    second.wait_timeout = 0.1
+    store.claim_idempotency_key('k', time.time(), time.time() + 30)
+
+    assert second.run('k', lambda: pytest.fail('created a second order'))[1] == 409
+
+
+def test_claim_of_a_dead_worker_expires(store):
+    store.claim_idempotency_key('k', time.time() - 60, time.time() - 30)
+    cache, = workers(store, count=1)
+
+    assert cache.run('k', lambda: ({'order_id': 'ORD3'}, 200)) == ({'order_id': 'ORD3'}, 200, False)
+
+
+def test_expired_responses_are_purged(store):
+    store.complete_idempotency_key('old', {'order_id': 'ORD0'}, 200, time.time() - 1)
+    store.complete_idempotency_key('new', {'order_id': 'ORD1'}, 200, time.time() + 60)
+
+    assert store.purge_idempotency_keys(time.time()) == 1
+    assert store.claim_idempotency_key('new', time.time(), time.time() + 30) == ('done', ({'order_id': 'ORD1'}, 200))
+
+
+def test_key_reused_for_another_body_is_refused(store):
+    first, second = workers(store)
+    order = lambda: ({'order_id': 'ORD1'}, 200)
+
+    assert first.run('k', order, 'body-a') == ({'order_id': 'ORD1'}, 200, False)
+    # Same worker (local cache) and another worker (store)
+    assert first.run('k', lambda: pytest.fail('created a second order'), 'body-b')[1] == 422
+    assert second.run('k', lambda: pytest.fail('created a second order'), 'body-b')[1] == 422
+    assert second.run('k', order, 'body-a') == ({'order_id': 'ORD1'}, 200, True)
+
+
+def test_key_reused_for_another_body_while_in_flight_is_refused(store):
+    first, second = workers(store)
+    store.claim_idempotency_key('k', time.time(), time.time() + 30, 'body-a')
+
+    assert second.run('k', lambda: pytest.fail('created a second order'), 'body-b')[1] == 422
+
+
+def test_fingerprint_covers_coordinates_at_quote_precision():
+    def body(lat, lng):
+        return {'cart': [{'id': 1, 'qty': 2}],
+                'location': {'district': 'kathmandu', 'coordinates': {'lat': lat, 'lng': lng}}}
+
+    assert request_fingerprint(body(27.70001, 85.3)) == request_fingerprint(body('27.70004', 85.30002))
+    assert request_fingerprint(body(27.7, 85.3)) != request_fingerprint(body(27.71, 85.3))
+    assert request_fingerprint(body(27.7, 85.3)) != request_fingerprint({'cart': [{'id': 1, 'qty': 2}],
+                                                                         'location': {'district': 'kathmandu'}})
+    assert request_fingerprint(body('nan', None))
+
+
+def test_initiate_refuses_an_idempotency_key_reused_for_another_order():
+    import app as shop
+    client = shop.app.test_client()
+
+    def initiate(qty):
+        return client.post('/api/payment/initiate', headers={'Idempotency-Key': 'checkout-1'}, json={
+            'cart': [{'id': 1, 'qty': qty}],
+            'location': {'district': 'kathmandu', 'area': 'koteshwor'}
+        })
+
+    first = initiate(2)
+    assert first.status_code == 200
+    assert initiate(2).get_json() == first.get_json()
+    assert initiate(3).status_code == 422
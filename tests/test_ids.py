@@ -0,0 +1,88 @@
+import os
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from ids import ID_LENGTH, IdGenerator, new_id, timestamp_of
+
+MILLISECOND = 1_000_000
+
+
+def test_ids_are_monotonic_within_a_millisecond():
+    generator = IdGenerator(clock=lambda: 1_700_000_000_000 * MILLISECOND)
+
+    ids = [generator.new() for _ in range(10000)]
+
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert all(len(value) == ID_LENGTH for value in ids)
+
+
+def test_ids_stay_ordered_when_the_clock_steps_back():
+    now = [1_700_000_000_005 * MILLISECOND]
+    generator = IdGenerator(clock=lambda: now[0])
+    first = generator.new()
+    now[0] -= 5 * MILLISECOND
+
+    assert generator.new() > first
+
+
+def test_ids_carry_their_timestamp():
+    generator = IdGenerator(clock=lambda: 1_700_000_000_123 * MILLISECOND)
+
+    assert timestamp_of('ORD' + generator.new()) == datetime.fromtimestamp(1_700_000_000.123, tz=timezone.utc)
+    with pytest.raises(ValueError):
+        timestamp_of('not-an-id')
+
+
+def test_new_id_prefix():
+    value = new_id('THAPA-')
+
+    assert value.startswith('THAPA-') and len(value) == len('THAPA-') + ID_LENGTH
+    assert value.replace('-', '').isalnum()
+
+
+def test_ids_are_unique_and_ordered_per_thread():
+    generator = IdGenerator()
+    results = [[] for _ in range(8)]
+
+    def generate(out):
+        out.extend(generator.new() for _ in range(5000))
+
+    threads = [threading.Thread(target=generate, args=(out,)) for out in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(out == sorted(out) for out in results)
+    assert len({value for out in results for value in out}) == 8 * 5000
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_workers_do_not_repeat_ids():
+    # A frozen clock keeps every process in the same millisecond, where only
+    # the reset at fork stops the children from continuing the parent's sequence
+    generator = IdGenerator(clock=lambda: 1_700_000_000_000 * MILLISECOND)
+    generator.new()
+    children = []
+    for _ in range(4):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            with os.fdopen(write_end, 'w') as out:
+                out.write('\n'.join(generator.new() for _ in range(5000)))
+            os._exit(0)
+        os.close(write_end)
+        children.append((pid, read_end))
+
+    ids = [generator.new() for _ in range(5000)]
+    for pid, read_end in children:
+        with os.fdopen(read_end) as source:
+            ids.extend(source.read().split('\n'))
+        os.waitpid(pid, 0)
+
+    assert len(ids) == 5 * 5000
+    assert len(set(ids)) == len(ids)
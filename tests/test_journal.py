@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+
+from journal import EventJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = EventJournal(str(tmp_path), snapshot_every=0, durable=False)
+    yield journal
+    journal.close()
+
+
+def write_segment(directory, name, events):
+    with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event) + '\n')
+
+
+def event(ts, event_type, status=None):
+    return {'ts': f'2025-01-01T10:00:{ts:02d}+00:00', 'type': event_type, 'transaction_uuid': 'THAPA-1',
+            'order_id': 'ORD1', **({'status': status} if status else {})}
+
+
+def test_replay_orders_events_across_segments_by_time(journal):
+    # The worker that verified opened its segment first; the initiating worker's segment sorts later
+    write_segment(journal.directory, 'events-000000000000001-100.jsonl', [event(5, 'verified', 'SUCCESS')])
+    write_segment(journal.directory, 'events-000000000000002-200.jsonl', [event(1, 'initiated', 'PENDING')])
+
+    state = journal.replay()
+
+    assert state['transactions']['THAPA-1']['status'] == 'SUCCESS'
+    assert state['transactions']['THAPA-1']['updated_at'] == event(5, 'verified')['ts']
+    assert state['events_replayed'] == 2
+
+
+def test_snapshot_keeps_latest_status_when_older_events_arrive_later(journal):
+    write_segment(journal.directory, 'events-000000000000001-100.jsonl', [event(5, 'verified', 'SUCCESS')])
+    journal.snapshot()
+    # A segment first read after the snapshot holds an older event of the same transaction
+    write_segment(journal.directory, 'events-000000000000002-200.jsonl', [event(1, 'initiated', 'PENDING')])
+
+    journal.snapshot()
+
+    assert journal.replay()['transactions']['THAPA-1']['status'] == 'SUCCESS'
+    assert [e['type'] for e in journal.history('THAPA-1')] == ['initiated', 'verified']
+
+
+def test_appended_events_replay_in_order(journal):
+    journal.append('initiated', 'THAPA-2', order_id='ORD2', status='PENDING')
+    journal.append('failed', 'THAPA-2', order_id='ORD2', status='FAILED')
+
+    assert journal.replay()['transactions']['THAPA-2']['status'] == 'FAILED'
@@ -0,0 +1,57 @@
+import os
+import threading
+
+from metrics import RETIRED_FILE, MetricsRegistry, retire_process
+
+
+def test_exited_threads_fold_into_the_retired_shard():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests')
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    requests.inc()
+
+    def work():
+        for _ in range(10):
+            requests.inc()
+            latency.observe(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The retired totals plus the main thread's own shard
+    assert len(requests._shards) == 2
+    assert len(latency._shards) == 1
+    assert requests.collect() == {(): 501}
+    assert latency.collect()[()][:3] == [0, 500, 0]
+
+
+def worker_registry(directory, flush_interval=5.0):
+    registry = MetricsRegistry()
+    registry.directory = directory
+    registry.flush_interval = flush_interval
+    return registry
+
+
+def test_retired_worker_counters_are_kept_and_its_file_removed(tmp_path):
+    directory = str(tmp_path)
+    worker = worker_registry(directory)
+    worker.counter('orders_total', 'Orders', ['status']).inc('paid', amount=3)
+    worker.gauge('in_flight', 'In flight').inc()
+    worker.flush()
+    os.rename(tmp_path / f"{os.getpid()}.json", tmp_path / '4242.json')
+
+    scraper = worker_registry(directory)
+    scraper.counter('orders_total', 'Orders', ['status']).inc('paid')
+    scraper.gauge('in_flight', 'In flight')
+    before = scraper.collect()
+
+    retire_process(directory, 4242)
+    retire_process(directory, 4242)
+
+    assert sorted(os.listdir(directory)) == [RETIRED_FILE]
+    after = scraper.collect()
+    assert before['orders_total'] == after['orders_total'] == {('paid',): 4}
+    assert after['in_flight'] == {}
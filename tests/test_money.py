@@ -0,0 +1,76 @@
+import random
+from decimal import Decimal
+
+import pytest
+
+from money import MoneyError, breakdown, format_amount, to_paisa
+
+
+@pytest.mark.parametrize('value, paisa', [
+    (0, 0),
+    (550, 55000),
+    ('550', 55000),
+    ('449.90', 44990),
+    (449.9, 44990),
+    (0.1 + 0.2, 30),
+    (1.1 * 3, 330),
+    (44.99000000000001, 4499),
+    (0.005, 1),
+    ('0.004', 0),
+    (' 12.5 ', 1250),
+    (Decimal('99.995'), 10000),
+    (-2.5, -250),
+])
+def test_to_paisa(value, paisa):
+    assert to_paisa(value) == paisa
+
+
+@pytest.mark.parametrize('value', [None, True, '', 'abc', 'nan', 'inf', float('nan'), float('-inf')])
+def test_to_paisa_rejects_non_numbers(value):
+    with pytest.raises(MoneyError):
+        to_paisa(value)
+
+
+@pytest.mark.parametrize('paisa, text', [
+    (0, '0'), (55000, '550'), (44990, '449.90'), (30, '0.30'), (1, '0.01'), (-250, '-2.50')
+])
+def test_format_amount(paisa, text):
+    assert format_amount(paisa) == text
+
+
+def test_format_and_parse_round_trip():
+    rng = random.Random(1234)
+    for paisa in [0, 1, 99, 100, 101, 10 ** 12] + [rng.randrange(-10 ** 9, 10 ** 9) for _ in range(2000)]:
+        text = format_amount(paisa)
+        assert to_paisa(text) == paisa
+        assert to_paisa(float(text)) == paisa
+        assert format_amount(to_paisa(text)) == text
+
+
+def test_float_sums_format_canonically():
+    assert format_amount(to_paisa(0.1 + 0.2)) == '0.30'
+    assert format_amount(to_paisa(sum([0.1] * 10))) == '1'
+    assert format_amount(to_paisa(449.90000000000003)) == '449.90'
+
+
+def test_breakdown_components_add_up_to_total():
+    rng = random.Random(42)
+    for _ in range(2000):
+        subtotal = rng.randrange(0, 10 ** 7)
+        discount = rng.randrange(0, subtotal + 1)
+        delivery, tax, service = (rng.randrange(0, 10 ** 5) for _ in range(3))
+
+        amounts = breakdown(subtotal, discount, delivery, tax, service)
+
+        paisa = {name: to_paisa(value) for name, value in amounts.items()}
+        assert paisa['amount'] == subtotal - discount
+        assert paisa['total_amount'] == (paisa['amount'] + paisa['tax_amount'] + paisa['product_service_charge']
+                                         + paisa['product_delivery_charge'])
+        assert all(format_amount(paisa[name]) == value for name, value in amounts.items())
+
+
+def test_breakdown_rejects_invalid_components():
+    with pytest.raises(MoneyError):
+        breakdown(1000, 1001, 0)
+    with pytest.raises(MoneyError):
+        breakdown(1000, 0, -1)
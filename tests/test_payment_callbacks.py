@@ -0,0 +1,110 @@
+import base64
+import json
+
+import pytest
+
+import app as shop
+
+
+@pytest.fixture
+def client():
+    return shop.app.test_client()
+
+
+def checkout(client, promo_code=None):
+    response = client.post('/api/payment/initiate', json={
+        'cart': [{'id': 1, 'qty': 2}],
+        'location': {'district': 'kathmandu', 'area': 'koteshwor'},
+        'delivery_speed': 'standard',
+        'promo_code': promo_code
+    })
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def settle_paid(transaction_uuid):
+    return shop.store.apply_updates(
+        [(transaction_uuid, {'status': 'SUCCESS'}, {'status': 'PAID'})], expected_status='PENDING'
+    )
+
+
+def test_failure_callback_fails_pending_payment_and_releases_promotion(client):
+    payment = checkout(client, 'NEWUSER20')
+    transaction_uuid = payment['transaction_uuid']
+
+    client.get(f'/payment/failure?transaction_uuid={transaction_uuid}')
+
+    assert shop.store.get_transaction(transaction_uuid)['status'] == 'FAILED'
+    assert shop.store.get_order(payment['order_id'])['status'] == 'PAYMENT_FAILED'
+    # The redemption was given back, so the code can be used again
+    checkout(client, 'NEWUSER20')
+
+
+def test_failure_callback_cannot_fail_paid_payment(client):
+    payment = checkout(client, 'NEWUSER20')
+    transaction_uuid = payment['transaction_uuid']
+    assert settle_paid(transaction_uuid)
+
+    for _ in range(2):
+        client.get(f'/payment/failure?transaction_uuid={transaction_uuid}')
+
+    assert shop.store.get_transaction(transaction_uuid)['status'] == 'SUCCESS'
+    assert shop.store.get_order(payment['order_id'])['status'] == 'PAID'
+    response = client.post('/api/payment/initiate', json={
+        'cart': [{'id': 1, 'qty': 1}],
+        'location': {'district': 'kathmandu', 'area': 'koteshwor'},
+        'promo_code': 'NEWUSER20'
+    })
+    assert response.status_code == 400
+
+
+def success_callback(client, payment, transaction_code='000ABC1'):
+    fields = {
+        'transaction_code': transaction_code,
+        'status': 'COMPLETE',
+        'total_amount': payment['esewa_data']['total_amount'],
+        'transaction_uuid': payment['transaction_uuid'],
+        'product_code': shop.esewa.merchant_code,
+        'signed_field_names': 'transaction_code,status,total_amount,transaction_uuid,product_code,signed_field_names'
+    }
+    fields['signature'] = shop.signer.sign(shop.signer.message_for(fields, fields['signed_field_names'].split(',')))
+    data = base64.b64encode(json.dumps(fields).encode()).decode()
+    return client.get('/payment/success', query_string={'data': data})
+
+
+def test_success_callback_settles_pending_payment(client):
+    payment = checkout(client)
+
+    response = success_callback(client, payment)
+
+    assert '/payment-success.html' in response.headers['Location']
+    assert shop.store.get_order(payment['order_id'])['status'] == 'PAID'
+
+
+def test_success_callback_recovers_failed_payment_and_retakes_promotion(client):
+    payment = checkout(client, 'NEWUSER20')
+    client.get(f"/payment/failure?transaction_uuid={payment['transaction_uuid']}")
+
+    response = success_callback(client, payment, transaction_code='000ABC2')
+
+    assert '/payment-success.html' in response.headers['Location']
+    assert shop.store.get_transaction(payment['transaction_uuid'])['status'] == 'SUCCESS'
+    assert shop.store.get_order(payment['order_id'])['status'] == 'PAID'
+    # The released redemption is counted again, so the code is used up
+    response = client.post('/api/payment/initiate', json={
+        'cart': [{'id': 1, 'qty': 1}],
+        'location': {'district': 'kathmandu', 'area': 'koteshwor'},
+        'promo_code': 'NEWUSER20'
+    })
+    assert response.status_code == 400
+
+
+def test_success_callback_leaves_refunded_payment_alone(client):
+    payment = checkout(client)
+    shop.store.apply_updates([(payment['transaction_uuid'], {'status': 'REFUNDED'}, {'status': 'REFUNDED'})],
+                             expected_status='PENDING')
+
+    response = success_callback(client, payment, transaction_code='000ABC3')
+
+    assert 'reason=payment_incomplete' in response.headers['Location']
+    assert shop.store.get_order(payment['order_id'])['status'] == 'REFUNDED'
@@ -0,0 +1,134 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import app as shop
+from promotions import PromotionEngine, PromotionError
+
+
+def test_per_user_limit(store):
+    assert store.redeem_promotion('NEWUSER20', 'alice', None, 1)
+    assert not store.redeem_promotion('NEWUSER20', 'alice', None, 1)
+    assert store.redeem_promotion('NEWUSER20', 'bob', None, 1)
+
+
+def test_global_limit_counts_every_customer(store):
+    assert store.redeem_promotion('LAUNCH', 'alice', 2, None)
+    assert store.redeem_promotion('LAUNCH', 'bob', 2, None)
+    assert not store.redeem_promotion('LAUNCH', 'carol', 2, None)
+
+
+def test_released_redemption_can_be_used_again(store):
+    assert store.redeem_promotion('LAUNCH', 'alice', 1, 1)
+    store.release_promotion('LAUNCH', 'alice')
+
+    assert store.redeem_promotion('LAUNCH', 'bob', 1, 1)
+    assert not store.redeem_promotion('LAUNCH', 'alice', 1, 1)
+
+
+def test_refused_redemption_is_not_counted(store):
+    assert store.redeem_promotion('LAUNCH', 'alice', 2, 1)
+    assert not store.redeem_promotion('LAUNCH', 'alice', 2, 1)
+
+    # alice's refused attempt did not use up the global cap
+    assert store.redeem_promotion('LAUNCH', 'bob', 2, 1)
+
+
+def test_only_capped_promotions_are_counted():
+    engine = PromotionEngine([
+        {'code': 'OPEN10', 'value': 10},
+        {'code': 'ONCE', 'value': 10, 'per_user_limit': 1},
+        {'code': 'FIRST100', 'value': 10, 'max_redemptions': 100},
+    ])
+
+    assert [engine.get(code).limited for code in ('OPEN10', 'ONCE', 'FIRST100')] == [False, True, True]
+
+
+def test_expired_and_off_day_promotions_do_not_apply():
+    engine = PromotionEngine([
+        {'code': 'OLD', 'value': 10, 'expires_at': '2025-01-01T00:00:00+00:00'},
+        {'code': 'FRIDAY', 'value': 10, 'weekdays': [4]},
+    ])
+    cart = [{'id': 1, 'price': 100, 'qty': 1}]
+    thursday = datetime(2025, 6, 5, 12, tzinfo=timezone.utc)
+
+    assert engine.evaluate('OLD', cart, 10000, now=thursday)['promotions'] == []
+    assert engine.evaluate('FRIDAY', cart, 10000, now=thursday)['promotions'] == []
+    assert engine.evaluate('friday', cart, 10000, now=datetime(2025, 6, 6, 12, tzinfo=timezone.utc))['discount'] == 1000
+
+
+@pytest.mark.parametrize('rule, subtotal, discount', [
+    # 10% of Rs 44.99 is 449.9 paisa; half up to the paisa
+    ({'value': 10}, 4499, 450),
+    ({'value': 10}, 4494, 449),
+    ({'value': 12.5}, 3333, 417),
+    ({'value': 20, 'max_discount': 50}, 40000, 5000),
+    ({'type': 'flat', 'value': 49.99}, 10000, 4999),
+    ({'type': 'flat', 'value': 50}, 3000, 3000),
+    ({'value': 10, 'min_subtotal': 500}, 49999, 0),
+])
+def test_discounts_are_whole_paisa(rule, subtotal, discount):
+    engine = PromotionEngine([{'code': 'SAVE', **rule}])
+    cart = [{'id': 1, 'price': subtotal / 100, 'qty': 1}]
+
+    result = engine.evaluate('SAVE', cart, subtotal)['discount']
+    assert result == discount
+    assert isinstance(result, int)
+
+
+def test_category_discount_is_computed_on_the_category_lines():
+    engine = PromotionEngine([{'code': 'SNACKS', 'value': 15, 'categories': ['snacks']}])
+    cart = [{'id': 2, 'price': 80, 'qty': 3, 'category': 'snacks'},
+            {'id': 1, 'price': 100, 'qty': 1, 'category': 'beverages'}]
+
+    # 15% of Rs 240
+    assert engine.evaluate('SNACKS', cart, 34000)['discount'] == 3600
+
+
+def test_malformed_amounts_are_rejected():
+    with pytest.raises(PromotionError):
+        PromotionEngine([{'code': 'BAD', 'type': 'flat', 'value': 'fifty'}])
+    with pytest.raises(PromotionError):
+        PromotionEngine([{'code': 'BAD', 'value': 'NaN'}])
+
+
+def test_checkout_discount_is_exact():
+    response = shop.app.test_client().post('/api/payment/initiate', json={
+        'cart': [{'id': 3, 'qty': 1}],
+        'location': {'district': 'kathmandu', 'area': 'koteshwor'},
+        'promo_code': 'THAPA10'
+    })
+
+    assert response.status_code == 200
+    payment = response.get_json()
+    # Rs 299 less 10% (29.90), or less 20% (59.80) when the automatic Friday sale wins
+    applied = shop.store.get_order(payment['order_id'])['promotions']
+    assert payment['esewa_data']['amount'] == {('THAPA10',): '269.10', ('FRIDAY20',): '239.20'}[tuple(applied)]
+
+
+def initiate(client, promo_code, qty=1):
+    # A different quantity makes a new order rather than a replay of the previous one
+    return client.post('/api/payment/initiate', json={
+        'cart': [{'id': 2, 'qty': qty}],
+        'location': {'district': 'kathmandu', 'area': 'koteshwor'},
+        'promo_code': promo_code
+    })
+
+
+def test_checkout_enforces_the_per_customer_limit():
+    # Each test client is a separate session, so a separate customer
+    first, second = shop.app.test_client(), shop.app.test_client()
+
+    assert initiate(first, 'NEWUSER20').status_code == 200
+    assert initiate(first, 'NEWUSER20', qty=2).status_code == 400
+    assert initiate(second, 'NEWUSER20').status_code == 200
+
+
+@pytest.mark.parametrize('code', [None, 'THAPA10'])
+def test_unlimited_codes_can_be_used_repeatedly(code):
+    client = shop.app.test_client()
+
+    responses = [initiate(client, code, qty) for qty in (1, 2, 3)]
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert len({response.get_json()['order_id'] for response in responses}) == 3
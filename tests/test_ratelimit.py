@@ -0,0 +1,99 @@
+import pytest
+
+from ratelimit import Limit, MemoryBuckets, RateLimiter, SQLiteBuckets
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    backend = MemoryBuckets() if request.param == 'memory' else SQLiteBuckets(str(tmp_path / 'ratelimit.db'))
+    yield backend
+    backend.close()
+
+
+def limiter(backend, clock, client='3/minute', global_limit=None):
+    rules = {'initiate': {'client': Limit.parse(client), 'global': Limit.parse(global_limit)}}
+    return RateLimiter(backend, rules, clock=clock)
+
+
+def test_burst_is_allowed_then_denied_with_retry_after(backend):
+    clock = Clock()
+    limits = limiter(backend, clock)
+
+    assert [limits.check('initiate', '10.0.0.1')['allowed'] for _ in range(3)] == [True, True, True]
+    # One token refills every 20 seconds
+    assert limits.check('initiate', '10.0.0.1') == {'allowed': False, 'retry_after': 20}
+
+
+def test_tokens_refill_over_time(backend):
+    clock = Clock()
+    limits = limiter(backend, clock)
+    for _ in range(3):
+        limits.check('initiate', '10.0.0.1')
+
+    clock.now += 19
+    assert limits.check('initiate', '10.0.0.1') == {'allowed': False, 'retry_after': 1}
+    clock.now += 1
+    assert limits.check('initiate', '10.0.0.1')['allowed']
+    assert not limits.check('initiate', '10.0.0.1')['allowed']
+
+    # A long pause refills the bucket up to its burst, not beyond
+    clock.now += 3600
+    assert [limits.check('initiate', '10.0.0.1')['allowed'] for _ in range(4)] == [True, True, True, False]
+
+
+def test_clients_have_separate_buckets(backend):
+    clock = Clock()
+    limits = limiter(backend, clock, client='1/minute')
+
+    assert limits.check('initiate', '10.0.0.1')['allowed']
+    assert not limits.check('initiate', '10.0.0.1')['allowed']
+    assert limits.check('initiate', '10.0.0.2')['allowed']
+
+
+def test_global_bucket_is_shared_and_a_denial_spends_nothing(backend):
+    clock = Clock()
+    limits = limiter(backend, clock, client='2/minute', global_limit='3/minute')
+
+    assert limits.check('initiate', '10.0.0.1')['allowed']
+    assert limits.check('initiate', '10.0.0.2')['allowed']
+    assert limits.check('initiate', '10.0.0.3')['allowed']
+    # The global bucket is empty; the client bucket of 10.0.0.4 is not charged
+    assert not limits.check('initiate', '10.0.0.4')['allowed']
+    clock.now += 20
+    assert limits.check('initiate', '10.0.0.4')['allowed']
+
+
+def test_groups_without_limits_are_always_allowed(backend):
+    limits = RateLimiter(backend, {'status': {'client': None, 'global': None}}, clock=Clock())
+
+    assert all(limits.check('status', '10.0.0.1')['allowed'] for _ in range(100))
+    assert limits.check('unknown', '10.0.0.1')['allowed']
+
+
+@pytest.mark.parametrize('value, burst, rate', [
+    ('10/minute', 10, 10 / 60),
+    ('5/second', 5, 5),
+    ('100/15minutes', 100, 100 / 900),
+])
+def test_limit_parse(value, burst, rate):
+    limit = Limit.parse(value)
+    assert limit.burst == burst
+    assert limit.rate == pytest.approx(rate)
+
+
+@pytest.mark.parametrize('value', ['', 'off', 'none', '0', None])
+def test_limit_parse_disabled(value):
+    assert Limit.parse(value) is None
+
+
+def test_limit_parse_rejects_garbage():
+    with pytest.raises(ValueError):
+        Limit.parse('ten per minute')